@@ -0,0 +1,30 @@
+from trace_to_goal.cache import GoalCache
+
+
+def test_cache_keys_and_prune(tmp_path):
+    cache = GoalCache(str(tmp_path / 'cache'), max_size=1 << 20)
+    trace = tmp_path / 't.csv'
+    trace.write_text('0,0,4096,W,0.0\n')
+    out = tmp_path / 'out.goal'
+    calls = []
+
+    def generate(content: str):
+        calls.append(content)
+        out.write_text(content)
+
+    for slice_size in (64, 64, 128):
+        cache.run('trace', {'slice_size': slice_size}, [str(trace)], {'goal': str(out)},
+                  lambda: generate(f'goal {slice_size}'))
+    # The second run is restored, a different parameter is a new entry
+    assert calls == ['goal 64', 'goal 128']
+    assert cache.stats()['hits'] == 1
+
+    # Changed input content is a new entry
+    trace.write_text('0,0,65536,W,0.0\n')
+    cache.run('trace', {'slice_size': 64}, [str(trace)], {'goal': str(out)},
+              lambda: generate('goal 64 changed'))
+    assert len(calls) == 3 and out.read_text() == 'goal 64 changed'
+
+    assert len(cache.entries()) == 3
+    assert cache.prune(max_size=0) == 3
+    assert cache.entries() == []
@@ -0,0 +1,45 @@
+from trace_to_goal.estimate import LogGPParameters, estimate_events
+from trace_to_goal.goal import parse_goal
+
+PARAMS = LogGPParameters(L=100, o=10, g=0, G=0, O=0)
+
+
+def estimate(text: str):
+    return estimate_events(parse_goal(text.splitlines()), PARAMS)
+
+
+def test_critical_path_follows_messages():
+    result = estimate("""
+num_ranks 2
+rank 0 {
+l1: calc 1000
+l2: send 1b to 1 tag 1
+l2 requires l1
+}
+rank 1 {
+l1: recv 1b from 0 tag 1
+l2: calc 500
+l2 requires l1
+}
+""")
+    # calc, send overhead and flight (o + L), recv overhead, calc
+    assert result.critical_path_ns == 1000 + 10 + 100 + 10 + 500
+    assert (result.critical_ranks, result.critical_ops) == ([0, 1], 4)
+    assert result.no_messages == 1 and not result.deadlocked
+    assert result.lower_bound_ns == result.critical_path_ns
+
+
+def test_unmatched_receive_blocks():
+    result = estimate("""
+num_ranks 2
+rank 0 {
+l1: recv 8b from 1 tag 1
+l2: calc 10
+l2 requires l1
+}
+rank 1 {
+l1: send 8b to 0 tag 2
+}
+""")
+    assert (result.unmatched_sends, result.unmatched_recvs) == (1, 1)
+    assert result.blocked_ops == 2 and result.deadlocked
@@ -0,0 +1,75 @@
+import pytest
+
+from trace_to_goal.goal import GoalParseError, iter_goal_lines, parse_goal, read_goal
+from trace_to_goal.goalstat import GoalStats, load_rank_map, rank_names_of, rank_racks_of
+from trace_to_goal.network import DirectDriveNetwork, NetworkTopology
+
+GOAL = """num_ranks 2
+// Host
+rank 0 {
+l1: send 64b to 1 tag 3
+l2: calc 100
+l3: recv 8b from 1
+l2 requires l1
+l3 requires l1
+}
+rank 1 {
+l1: recv 64b from 0 tag 3
+l2: send 8b to 0
+l2 requires l1
+}
+"""
+
+
+def test_goal_parser_events(tmp_path):
+    events = list(parse_goal(GOAL.splitlines()))
+    assert events[:3] == [
+        ('num_ranks', 2, None, None, 0, None, 0),
+        ('rank', 0, None, None, 0, None, 0),
+        ('op', 0, 'l1', 'send', 64, 1, 3),
+    ]
+    assert ('requires', 0, 'l3', None, 0, 'l1', 0) in events
+    # Missing tags are tag 0
+    assert ('op', 1, 'l2', 'send', 8, 0, 0) in events
+
+    # Reading in small chunks splits no line
+    (tmp_path / 't.goal').write_text(GOAL)
+    assert list(iter_goal_lines(str(tmp_path / 't.goal'), chunk_size=16)) == GOAL.splitlines()
+
+    with pytest.raises(GoalParseError):
+        list(parse_goal(['rank 0 {', 'l1: send 8b to', '}']))
+    with pytest.raises(GoalParseError):
+        list(parse_goal(['l1: calc 10']))
+
+
+def test_goalstat_aggregates(tmp_path):
+    (tmp_path / 't.goal').write_text(GOAL)
+    stats = GoalStats({0: 'Host 0'})
+    stats.add(read_goal(str(tmp_path / 't.goal')))
+    assert stats.ranks[0] == {
+        'ops': 3, 'sends': 1, 'recvs': 1, 'calcs': 1, 'bytes_sent': 64,
+        'bytes_received': 8, 'calc_time': 100, 'requires': 2,
+        'max_fan_in': 1, 'max_fan_out': 2,
+    }
+    assert stats.links == {(0, 1): [1, 64], (1, 0): [1, 8]}
+    assert stats.totals()['ops'] == 5
+
+
+def test_cross_rack_traffic_from_rank_map(tmp_path):
+    topology = NetworkTopology(host_count=2, ccs_count=2, bss_count=4, strategy='racked',
+                               racks=2, racks_per_pod=1)
+    topology.to_file(str(tmp_path / 'names.json'))
+    rank_map = load_rank_map(str(tmp_path / 'names.json'))
+    racks = rank_racks_of(rank_map)
+    assert racks == dict(enumerate(topology.rank_racks))
+    assert all(rank_map[r]['pod'] == rack for (r, rack) in racks.items())
+    assert rank_names_of(rank_map)[topology.get_bss(0)].startswith('BSS 0 (')
+
+    network = DirectDriveNetwork(topology, disk_size=1 << 20, slice_size=1 << 16)
+    network.add_interaction(op_code='w', host=0, address=0, size=1 << 17)
+    network.to_goal(str(tmp_path / 't.goal'))
+    stats = GoalStats(rank_names_of(rank_map), racks)
+    stats.add(read_goal(str(tmp_path / 't.goal')))
+
+    cross = sum(n for ((src, dst), (n, _)) in stats.links.items() if racks[src] != racks[dst])
+    assert 0 < stats.cross_rack_messages == cross
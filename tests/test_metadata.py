@@ -0,0 +1,33 @@
+from trace_to_goal.convert import convert_trace
+from trace_to_goal.goal import read_goal, OP
+from trace_to_goal.metadata import Metadata
+from trace_to_goal.trace import open_trace, TraceSelection
+
+# asu, lba, size, opcode, timestamp
+TRACE = """0,0,4096,W,0.0
+0,0,4096,W,0.1
+0,4096,4096,W,0.2
+1,0,4096,R,0.3
+0,65536,4096,R,0.4
+"""
+
+
+def test_ops_map_to_trace_rows(tmp_path):
+    (tmp_path / 't.csv').write_text(TRACE)
+    goal = str(tmp_path / 't.goal')
+    meta = str(tmp_path / 't.meta')
+    # Row 0 is skipped, rows 1 and 2 of host 0 are merged into row 1
+    convert_trace(
+        open_trace(str(tmp_path / 't.csv'), TraceSelection(skip=1)), goal,
+        slice_size=64, ccs_count=1, bss_count=2, metadata_dest=meta,
+        dump_state=False, coalesce_rows=2)
+
+    metadata = Metadata(meta)
+    hosts = [r for (r, k) in enumerate(metadata['rank_kind']) if metadata.rank_kinds[k] == 'host']
+    rows = {}
+    for (event, rank, label, *_) in read_goal(goal):
+        if event == OP and rank in hosts:
+            context = metadata.context_of_labels([int(label[1:])])[0]
+            assert metadata['host'][context] == hosts.index(rank)
+            rows.setdefault(rank, set()).add(int(metadata['row'][context]))
+    assert rows == {hosts[0]: {1, 4}, hosts[1]: {3}}
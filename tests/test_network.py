@@ -0,0 +1,142 @@
+import pytest
+
+from trace_to_goal.estimate import estimate_network
+from trace_to_goal.goal import read_goal
+from trace_to_goal.goalstat import GoalStats
+from trace_to_goal.network import DirectDriveNetwork, NetworkTopology
+
+SLICE_SIZE = 1 << 16
+
+
+def make_network(host_count: int = 1, ccs_count: int = 1, bss_count: int = 2,
+                 **kwargs) -> DirectDriveNetwork:
+    topology = NetworkTopology(host_count=host_count, ccs_count=ccs_count, bss_count=bss_count)
+    return DirectDriveNetwork(topology, disk_size=1 << 20, slice_size=SLICE_SIZE, **kwargs)
+
+
+def goal_stats(network: DirectDriveNetwork, tmp_path) -> GoalStats:
+    assert network.validate().ok
+    network.to_goal(str(tmp_path / 't.goal'))
+    stats = GoalStats()
+    stats.add(read_goal(str(tmp_path / 't.goal')))
+    return stats
+
+
+def messages(stats: GoalStats, network: DirectDriveNetwork, src: str, dst: str) -> int:
+    """ No of messages from all ranks of kind src to all ranks of kind dst """
+    def ranks(kind: str):
+        topology = network.topology
+        return {getattr(topology, f'get_{kind}')(i) for i in range(getattr(topology, f'{kind}_count'))}
+
+    (srcs, dsts) = (ranks(src), ranks(dst))
+    return sum(n for ((s, d), (n, _)) in stats.links.items() if s in srcs and d in dsts)
+
+
+def test_queue_depth_bounds_outstanding_operations():
+    def critical_path(**kwargs) -> float:
+        network = make_network(**kwargs)
+        for _ in range(8):
+            network.add_interaction(op_code='r', host=0, address=0, size=4096)
+        assert network.validate().ok
+        return estimate_network(network).critical_path_ns
+
+    # Chained operations wait for each other, deeper queues overlap them
+    chained = critical_path(queue_depth=1)
+    assert critical_path(op_depens=True) == chained
+    assert chained > critical_path(queue_depth=2) > critical_path(queue_depth=4) > \
+        critical_path(op_depens=False)
+
+
+def test_open_loop_issues_at_trace_time(tmp_path):
+    network = make_network(open_loop=True)
+    for issue_time in (0, 10_000_000):
+        network.add_interaction(op_code='w', host=0, address=0, size=4096, issue_time=issue_time)
+    assert network.validate().ok
+    assert estimate_network(network).critical_path_ns > 10_000_000
+    network.to_goal(str(tmp_path / 't.goal'))
+    assert '10000000 cpu 1' in (tmp_path / 't.goal').read_text()
+
+
+@pytest.mark.parametrize('batch_lookups', [False, True])
+def test_batched_lookups(tmp_path, batch_lookups):
+    network = make_network(ccs_count=2, bss_count=4, batch_lookups=batch_lookups)
+    # 4 slices, 2 per CCS
+    network.add_interaction(op_code='r', host=0, address=0, size=4 * SLICE_SIZE - 1)
+    stats = goal_stats(network, tmp_path)
+    assert messages(stats, network, 'host', 'ccs') == (2 if batch_lookups else 4)
+    assert messages(stats, network, 'host', 'bss') == 4
+
+
+def test_sqn_cache_skips_lookups(tmp_path):
+    network = make_network(host_count=2, sqn_cache_size=4)
+    for host in (0, 0, 1, 0):
+        op_code = 'w' if host == 1 else 'r'
+        network.add_interaction(op_code=op_code, host=host, address=0, size=4096)
+    stats = goal_stats(network, tmp_path)
+    # The second read is cached, the write of host 1 invalidates it again
+    host0 = network.topology.get_host(0)
+    ccs = network.topology.get_ccs(0)
+    assert stats.links[(host0, ccs)][0] == 2
+    assert network.sqn_cache.lookup(0, 0)
+
+
+def test_least_loaded_counts_operations_in_flight():
+    # Queue depth 1: the first read has completed when the second one is
+    # issued, so both are served by the first replica
+    network = make_network(next_bss_strategy='least-loaded', queue_depth=1)
+    for size in (4096, 8192):
+        network.add_interaction(op_code='r', host=0, address=0, size=size)
+    assert network.bss_load_bytes == [8192, 0]
+    assert network.validate().ok
+
+    # Queue depth 2: the first read is still in flight
+    network = make_network(next_bss_strategy='least-loaded', queue_depth=2)
+    for size in (4096, 8192):
+        network.add_interaction(op_code='r', host=0, address=0, size=size)
+    assert network.bss_load_bytes == [4096, 8192]
+    assert network.bss_load_ops == [1, 1]
+
+
+@pytest.mark.parametrize('write_quorum', [None, 1, 2])
+def test_write_quorum_acks(tmp_path, write_quorum):
+    network = make_network(bss_count=3, write_quorum=write_quorum)
+    network.add_interaction(op_code='w', host=0, address=0, size=4096)
+    stats = goal_stats(network, tmp_path)
+    # All replicas get the data, the ack only waits for the quorum
+    assert messages(stats, network, 'ccs', 'bss') == 3
+    assert stats.ranks[network.topology.get_ccs(0)]['max_fan_in'] == (write_quorum or 3)
+
+
+def test_group_commit_replicates_once_per_batch(tmp_path):
+    network = make_network(host_count=3, group_commit=2)
+    for host in range(3):
+        network.add_interaction(op_code='w', host=host, address=0, size=4096)
+    stats = goal_stats(network, tmp_path)
+    # One full batch of 2 writes, the last write is flushed on its own
+    assert (network.group_commit_rounds, network.group_commit_writes) == (2, 3)
+    assert messages(stats, network, 'ccs', 'bss') == 2 * 2
+    assert messages(stats, network, 'ccs', 'host') == 3
+
+
+def test_volumes_have_their_own_slices(tmp_path):
+    network = make_network(volume_sizes=[2 * SLICE_SIZE, 3 * SLICE_SIZE])
+    assert network.no_slices == 5
+    assert [sid for (sid, _) in network.resolve_slices(SLICE_SIZE + 4096, 4096, volume=0)] == [1]
+    # Volume 1 starts behind the 2 slices of volume 0
+    slices = network.resolve_slices(SLICE_SIZE + 4096, 4096, volume=1)
+    assert [sid for (sid, _) in slices] == [3]
+    network.add_interaction(op_code='w', host=0, address=0, size=4096, slices=slices)
+    goal_stats(network, tmp_path)
+
+
+def test_erasure_coding_fragments(tmp_path):
+    network = make_network(bss_count=3, erasure_coding=(2, 1))
+    assert [len(r) for r in network.bss_resp] == [3]
+    network.add_interaction(op_code='w', host=0, address=0, size=4096)
+    network.add_interaction(op_code='r', host=0, address=0, size=4096)
+    stats = goal_stats(network, tmp_path)
+    ccs = network.topology.get_ccs(0)
+    bss = [network.topology.get_bss(i) for i in range(3)]
+    # k + m fragments of size / k are written, k of them are read
+    assert [stats.links[(ccs, b)][1] for b in bss] == [2048] * 3
+    assert messages(stats, network, 'host', 'bss') == 2
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from trace_to_goal.network import DirectDriveNetwork, NetworkTopology, parse_rack_rules
+from trace_to_goal.placement import VALID_PLACEMENTS, Placement
+
+
+@pytest.mark.parametrize('strategy', VALID_PLACEMENTS)
+def test_placement_tables_are_valid(strategy):
+    placement = Placement(strategy=strategy, replication=3, racks=3, seed=4)
+    owners = placement.slice_owners(1000, 5)
+    assert owners.min() >= 0 and owners.max() < 5
+    # All CCS own slices, and the same seed places the same way
+    assert len(np.unique(owners)) == 5
+    assert np.array_equal(owners, Placement(strategy=strategy, seed=4).slice_owners(1000, 5))
+
+    replicas = placement.replica_sets(5, 9)
+    assert replicas.shape == (5, 3)
+    assert replicas.min() >= 0 and replicas.max() < 9
+    assert all(len(set(r)) == 3 for r in replicas.tolist())
+    if strategy == 'rack-aware':
+        assert all(len(set(placement.rack_of(r, 9).tolist())) == 3 for r in replicas)
+
+
+def test_rack_aware_follows_topology_racks():
+    # Spread BSS: BSS i is in rack i % 4, not in rack i * 4 // 8
+    topology = NetworkTopology(ccs_count=4, bss_count=8, strategy='racked', racks=4,
+                               rack_rules=parse_rack_rules('bss=spread'))
+    network = DirectDriveNetwork(topology, disk_size=1 << 20, slice_size=1 << 16,
+                                 placement=Placement(strategy='rack-aware', replication=4, racks=4))
+    racks = np.array(topology.bss_racks())
+    assert racks.tolist() == [i % 4 for i in range(8)]
+    for replicas in network.bss_resp:
+        assert sorted(racks[replicas].tolist()) == [0, 1, 2, 3]
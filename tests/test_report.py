@@ -0,0 +1,114 @@
+from trace_to_goal.metadata import MetadataWriter, Metadata
+from trace_to_goal.network import TOPOLOGY_KINDS
+from trace_to_goal.report import GoalReplay, LatencyReport
+
+# Two overlapping reads through the same CCS (rank 2) and BSS (rank 3):
+# I/O 0 of host 0 (labels 0-7, tags 1-4) and I/O 1 of host 1 (labels 8-16,
+# tags 5-8). The CCS lists the receive of host 0 first, but the message of
+# host 1 is handled first.
+GOAL = """num_ranks 4
+
+rank 0 {
+s0: send 8b to 2 tag 1
+r1: recv 8b from 2 tag 2
+s2: send 8b to 3 tag 3
+r3: recv 4096b from 3 tag 4
+r1 requires s0
+s2 requires r1
+r3 requires s2
+}
+rank 1 {
+s8: send 8b to 2 tag 5
+r9: recv 8b from 2 tag 6
+s10: send 8b to 3 tag 7
+r11: recv 4096b from 3 tag 8
+r9 requires s8
+s10 requires r9
+r11 requires s10
+}
+rank 2 {
+r4: recv 8b from 0 tag 1
+s5: send 8b to 0 tag 2
+c12: calc 3200
+r13: recv 8b from 1 tag 5
+s14: send 8b to 1 tag 6
+s5 requires r4
+r13 requires c12
+s14 requires r13
+}
+rank 3 {
+r6: recv 8b from 0 tag 3
+s7: send 4096b to 0 tag 4
+r15: recv 8b from 1 tag 7
+s16: send 4096b to 1 tag 8
+s7 requires r6
+s16 requires r15
+}
+"""
+
+# Simulated with L = 2000, o = 1000 and G = 0. The message of host 1 reaches
+# the CCS at 3000 and is received once the calc is done at 3200, the one of
+# host 0 only arrives at 3500.
+VIZ = """numranks 4;
+osend 1 0 0 1000 0 0 1
+transmission 1 2 1000 1000 8 0 0 0 1
+loclop 2 0 0 3200 0 0 1
+osend 0 0 500 1500 0 0 1
+transmission 0 2 1500 1500 8 0 0 0 1
+orecv 2 0 3200 4200 0 0 1
+osend 2 0 4200 5200 0 0 1
+transmission 2 1 5200 5200 8 0 0 0 1
+orecv 2 0 5200 6200 0 0 1
+osend 2 0 6200 7200 0 0 1
+transmission 2 0 7200 7200 8 0 0 0 1
+orecv 1 0 7200 8200 0 0 1
+osend 1 0 8200 9200 0 0 1
+transmission 1 3 9200 9200 8 0 0 0 1
+orecv 0 0 9200 10200 0 0 1
+osend 0 0 10200 11200 0 0 1
+transmission 0 3 11200 11200 8 0 0 0 1
+orecv 3 0 11200 12200 0 0 1
+osend 3 0 12200 13200 0 0 1
+transmission 3 1 13200 13200 4096 0 0 0 1
+orecv 3 0 13200 14200 0 0 1
+osend 3 0 14200 15200 0 0 1
+transmission 3 0 15200 15200 4096 0 0 0 1
+orecv 1 0 15200 16200 0 0 1
+orecv 0 0 17200 18200 0 0 1
+"""
+
+
+def write_metadata(path: str):
+    counters = {'label': 0, 'tag': 1}
+    writer = MetadataWriter(path, counters)
+    writer.set_op(0, 0, 'r')
+    counters.update(label=8, tag=5)
+    writer.set_op(1, 1, 'r')
+    counters.update(label=17, tag=9)
+    kinds = [TOPOLOGY_KINDS.index(k) for k in ('host', 'host', 'ccs', 'bss')]
+    writer.close(kinds, TOPOLOGY_KINDS)
+
+
+def test_overlapping_reads(tmp_path):
+    (tmp_path / 'a.goal').write_text(GOAL)
+    write_metadata(str(tmp_path / 'a.meta'))
+    replay = GoalReplay(str(tmp_path / 'a.goal'), Metadata(str(tmp_path / 'a.meta')))
+    report = LatencyReport(replay, latency=2000)
+    report.add(VIZ.splitlines())
+
+    assert report.totals() == {
+        'ios': 2, 'incomplete_ios': 0, 'unmatched_transmissions': 0,
+        'unmatched_orecvs': 0, 'unmatched_loclops': 0, 'joined_records': 17,
+        'ambiguous_joins': 0,
+    }
+    # Single values, the max is exact
+    latencies = {
+        (r['host'], r['phase']): r['max_us']
+        for r in report.latency_rows(per_host=True) if r['host'] != 'all'
+    }
+    assert latencies == {
+        ('0', 'total'): 17.7, ('0', 'sqn-lookup'): 9.7, ('0', 'bss-read'): 8.0,
+        ('1', 'total'): 16.2, ('1', 'sqn-lookup'): 8.2, ('1', 'bss-read'): 8.0,
+    }
+    assert report.throughput_rows() == [
+        {'start_ns': 0, 'reads': 2, 'writes': 0, 'read_bytes': 8192, 'write_bytes': 0}]
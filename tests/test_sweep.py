@@ -0,0 +1,12 @@
+import pytest
+
+from trace_to_goal.sweep import parse_grid, sweepable_parameters
+
+
+def test_output_paths_are_not_sweepable():
+    params = sweepable_parameters()
+    assert 'ccs_count' in params
+    for name in ('rank_names_dest', 'host_map_dest', 'metadata_dest', 'dump_folder', 'validate'):
+        assert name not in params
+    with pytest.raises(ValueError):
+        parse_grid(['metadata-dest=a.meta,b.meta'])
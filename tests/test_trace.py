@@ -0,0 +1,103 @@
+import bz2
+import gzip
+import lzma
+import random
+
+import pytest
+
+from trace_to_goal.trace import ColumnarTrace, CsvTrace, HostMapping, TraceAmplification, \
+    TraceCoalescing, TraceSelection, import_trace, open_trace
+
+
+def write_trace(path, no_rows: int = 500, seed: int = 0):
+    rng = random.Random(seed)
+    lines = [
+        f"{rng.randrange(6)},{rng.randrange(1024) * 512},{rng.choice([512, 4096, 65536])},"
+        f"{rng.choice('rRwW')},{i * 0.01:.2f}\n"
+        for i in range(no_rows)
+    ]
+    path.write_text(''.join(lines))
+    return str(path)
+
+
+def test_columnar_import_round_trip(tmp_path):
+    csv_path = write_trace(tmp_path / 't.csv')
+    assert import_trace(csv_path, str(tmp_path / 't.col')) == 500
+    columnar = open_trace(str(tmp_path / 't.col'))
+    assert isinstance(columnar, ColumnarTrace)
+    assert list(columnar) == list(CsvTrace(csv_path))
+    assert columnar.extent() == CsvTrace(csv_path).extent()
+
+
+@pytest.mark.parametrize('compress', [gzip.compress, bz2.compress, lzma.compress])
+def test_compressed_input(tmp_path, compress):
+    csv_path = write_trace(tmp_path / 't.csv')
+    (tmp_path / 't.csv.z').write_bytes(compress((tmp_path / 't.csv').read_bytes()))
+    assert list(open_trace(str(tmp_path / 't.csv.z'))) == list(CsvTrace(csv_path))
+
+
+@pytest.mark.parametrize('selection', [
+    dict(start_time=1.0, end_time=3.0),
+    dict(asus=[1, 4], skip=3, every=2),
+    dict(host_rate=0.5, seed=3),
+    dict(reservoir=40, seed=7),
+    dict(start_time=0.5, reservoir=25, max_rows=10, seed=1),
+])
+def test_selection_matches_across_formats(tmp_path, selection):
+    csv_path = write_trace(tmp_path / 't.csv')
+    import_trace(csv_path, str(tmp_path / 't.col'))
+    rows = list(CsvTrace(csv_path, TraceSelection(**selection)).indexed())
+    assert rows == list(ColumnarTrace(str(tmp_path / 't.col'), TraceSelection(**selection)).indexed())
+    # Seeded, so converting again draws the same rows
+    assert rows == list(CsvTrace(csv_path, TraceSelection(**selection)).indexed())
+    assert 0 < len(rows) < 500
+
+
+def test_host_mappings():
+    asus = [3, 7, 8, 12]
+    identity = HostMapping(asus)
+    assert (identity.host_count, identity[12]) == (13, 12)
+    compact = HostMapping(asus, kind='compact')
+    assert compact.host_count == 4
+    assert [compact[a] for a in asus] == [0, 1, 2, 3]
+    fold = HostMapping(asus, kind='fold', fold_count=3)
+    assert fold.host_count == 3
+    assert [fold[a] for a in asus] == [0, 1, 2, 0]
+    assert fold.host_labels()[0] == 'Host 0 (ASU 3, 12)'
+
+
+def test_amplification_transforms():
+    slices = [(sid, 512) for sid in range(10)]
+    offset = TraceAmplification(10, factor=3, transform='offset')
+    assert offset.total_slices() == 30
+    assert offset.clone_slices(2, slices) == [(sid + 20, 512) for sid in range(10)]
+    assert offset.clone_host(2, 1, host_count=4) == 9
+
+    shuffle = TraceAmplification(10, factor=3, transform='shuffle', seed=5)
+    assert shuffle.total_slices() == 10
+    assert shuffle.clone_slices(0, slices) == slices
+    for clone in (1, 2):
+        # A permutation of the slices of the original host
+        assert sorted(sid for (sid, _) in shuffle.clone_slices(clone, slices)) == list(range(10))
+
+
+def test_coalescing_merges_contiguous_requests():
+    rows = [
+        (0, 0, 4096, 'w', 0.0),
+        (0, 4096, 4096, 'w', 0.1),
+        (1, 0, 4096, 'w', 0.2),
+        (0, 8192, 4096, 'r', 0.3),
+        (0, 12288, 4096, 'r', 0.4),
+        (0, 16384, 4096, 'r', 0.5),
+    ]
+    coalescing = TraceCoalescing(window_rows=2, slice_size=8192)
+    merged = list(coalescing.coalesce(enumerate(rows)))
+    assert sorted(merged) == [
+        (0, (0, 0, 8192, 'w', 0.0)),
+        (2, (1, 0, 4096, 'w', 0.2)),
+        # The run of row 3 expires before row 5 could extend it
+        (3, (0, 8192, 8192, 'r', 0.3)),
+        (5, (0, 16384, 4096, 'r', 0.5)),
+    ]
+    assert coalescing.requests(coalescing.before) == 6
+    assert coalescing.requests(coalescing.after) == 4
@@ -0,0 +1,62 @@
+from trace_to_goal.goal import parse_goal
+from trace_to_goal.validate import GoalValidator
+
+
+def validate(text: str, check_cycles: bool = False):
+    validator = GoalValidator(check_cycles)
+    validator.add(parse_goal(text.splitlines()))
+    return validator.finish()
+
+
+def test_valid_exchange():
+    report = validate("""
+num_ranks 2
+rank 0 {
+l1: send 8b to 1 tag 1
+l2: recv 8b from 1 tag 2
+l2 requires l1
+}
+rank 1 {
+l1: recv 8b from 0 tag 1
+l2: send 8b to 0 tag 2
+l2 requires l1
+}
+""")
+    assert report.ok, report.errors
+
+
+def test_rank_local_cycle():
+    text = """
+num_ranks 1
+rank 0 {
+l1: calc 10
+l2: calc 10
+l1 requires l2
+l2 requires l1
+}
+"""
+    report = validate(text)
+    assert report.counts == {'dependency cycles': 1}
+    assert validate(text, check_cycles=True).counts == {'dependency cycles': 1}
+
+
+def test_two_rank_deadlock():
+    # Both ranks only send after receiving the message of the other
+    text = """
+num_ranks 2
+rank 0 {
+l1: recv 8b from 1 tag 1
+l2: send 8b to 1 tag 2
+l2 requires l1
+}
+rank 1 {
+l1: recv 8b from 0 tag 2
+l2: send 8b to 0 tag 1
+l2 requires l1
+}
+"""
+    # Only found with the graph of all ranks
+    assert validate(text).ok
+    report = validate(text, check_cycles=True)
+    assert report.counts == {'dependency cycles': 1}
+    assert '4 ops of ranks 0, 1' in report.errors[0]
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from trace_to_goal.workload import VALID_PATTERNS, WorkloadGenerator
+
+
+@pytest.mark.parametrize('pattern', VALID_PATTERNS)
+def test_workload_is_seeded_and_fits_the_disk(pattern):
+    def generate(seed):
+        return WorkloadGenerator(disk_size=1 << 20, host_count=4, pattern=pattern,
+                                 size_distribution='lognormal', seed=seed).generate(100)
+
+    workload = generate(1)
+    assert len(workload) == 400
+    assert list(workload) == list(generate(1))
+    assert list(workload) != list(generate(2))
+    assert np.all(workload.addresses % 512 == 0)
+    assert np.all(workload.addresses + workload.sizes <= 1 << 20)
+    # Operations of all hosts are interleaved
+    assert workload.hosts[:4].tolist() == [0, 1, 2, 3]
+
+
+def test_sequential_hosts_continue_where_they_stopped():
+    workload = WorkloadGenerator(disk_size=1 << 30, host_count=2, pattern='sequential',
+                                 size=4096, read_ratio=1, seed=0).generate(10)
+    for host in (0, 1):
+        addresses = workload.addresses[workload.hosts == host]
+        assert np.all(np.diff(addresses) == 4096)
+    assert set(op for (op, *_) in workload) == {'r'}
@@ -1,12 +1,30 @@
 #!/usr/bin/env python3.11
 
-import csv
+import os
 import sys
-import random
 import click
+import numpy as np
+from pathlib import Path
 from loguru import logger
 from tqdm import tqdm
-from .network import NetworkTopology, DirectDriveNetwork, VALID_TOPOLOGY_STRATEGIES
+from .network import NetworkTopology, DirectDriveNetwork, VALID_TOPOLOGY_STRATEGIES, \
+    VALID_NEXT_BSS_STRATEGIES, VALID_RACK_RULES, DEFAULT_RACK_RULES, parse_erasure_coding, parse_rack_rules
+from .placement import Placement, VALID_PLACEMENTS, format_placement_report
+from .workload import Workload, WorkloadGenerator, random_ranges, \
+    OP_READ, OP_WRITE, VALID_PATTERNS, VALID_SIZE_DISTRIBUTIONS
+from .trace import open_trace, import_trace, load_columns, TraceSelection, \
+    VALID_HOST_MAPPINGS, VALID_AMPLIFY_TRANSFORMS, VALID_VOLUME_MODES
+from .convert import convert_trace, default_host_map_dest
+from .cache import GoalCache, run_cached
+from .estimate import LogGPParameters, estimate_goal
+from .goal import read_goal
+from .goalstat import GoalStats, format_table, load_rank_map, rank_names_of, rank_racks_of
+from .validate import validate_goal
+from .report import report_viz, LATENCY_COLUMNS
+from .sweep import parse_grid, expand_grid, run_sweep, write_summary, format_summary
+
+# Modules whose info logs are shown without the debug flag
+USER_LOG_MODULES = ('__main__', 'trace_to_goal.convert', 'trace_to_goal.cache')
 
 
 @click.group(name="trace2goal")
@@ -21,10 +39,63 @@ def cli(debug):
 
         logger.remove()  # remove the old handler. Else, the old one will work along with the new one you've added below'
         logger.add(sys.stdout, format=my_format,
-                   filter="__main__", level="INFO")
+                   filter=lambda record: record['name'] in USER_LOG_MODULES, level="INFO")
+
+
+def selection_options(func):
+    """ Options selecting the subset of a trace to convert """
+    options = [
+        click.option('--max-no-instructions', type=int, default=None, help='Only read the first X (selected) instructions from the trace file.'),
+        click.option('--start-time', type=float, default=None, help='Only select instructions issued at or after this trace timestamp (in s)'),
+        click.option('--end-time', type=float, default=None, help='Only select instructions issued before this trace timestamp (in s)'),
+        click.option('--skip', type=int, default=0, help='Skip the first X instructions (after the time window)'),
+        click.option('--every', type=int, default=1, help='Only select every k-th instruction'),
+        click.option('--host-sample-rate', type=float, default=None, help='Only select the instructions of this fraction of hosts (0-1)'),
+        click.option('--reservoir', type=int, default=None, help='Select a uniform random sample of X instructions (reservoir sampling)'),
+        click.option('--seed', type=int, default=0, help='Seed used for host and reservoir sampling'),
+        click.option('--asus', type=str, default=None, help='Comma separated list of ASUs to keep, all others are dropped'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def selection_from_options(max_no_instructions, start_time, end_time, skip, every,
+                           host_sample_rate, reservoir, seed, asus) -> TraceSelection:
+    return TraceSelection(
+        asus=[int(asu) for asu in asus.split(',')] if asus else None,
+        start_time=start_time, end_time=end_time, skip=skip, every=every,
+        host_rate=host_sample_rate, reservoir=reservoir,
+        max_rows=max_no_instructions, seed=seed
+    )
+
+
+def rack_rules_from_option(rack_rules):
+    try:
+        return parse_rack_rules(rack_rules)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--rack-rules')
+
 
+def erasure_coding_from_option(erasure_coding):
+    try:
+        return parse_erasure_coding(erasure_coding)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--erasure-coding')
 
-@cli.command(name="trace", help="Transform a uMass trace file to a goal file. The no of hosts and minimum disk size will be autodected and adapted if necessary")
+
+@cli.command(name="import", help="Convert a uMass trace file once into a binary columnar trace file, which 'trace' reads zero-copy instead of parsing the csv again")
+@click.argument('trace_path', type=click.Path(exists=True, dir_okay=False, resolve_path=True))
+@click.argument('out_path', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True))
+@click.option('--max-no-instructions', type=int, default=None, help='Only import the first X instructions from the trace file.')
+def cli_import(trace_path, out_path, max_no_instructions):
+    logger.info(f"Importing trace '{trace_path}'")
+    no_rows = import_trace(trace_path, out_path,
+                           selection=TraceSelection(max_rows=max_no_instructions))
+    logger.info(f"Wrote {no_rows} rows to columnar trace '{out_path}'")
+
+
+@cli.command(name="trace", help="Transform a uMass trace file (csv, gzip/bz2/xz/zstd compressed csv or imported columnar file) to a goal file. The no of hosts and minimum disk size will be autodected and adapted if necessary")
 @click.argument('trace_path', type=click.Path(exists=True, dir_okay=False, resolve_path=True))
 @click.argument('out_path', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True))
 @click.option('--slice-size', default=1024, help='Slice size in kB')
@@ -34,66 +105,212 @@ def cli(debug):
 @click.option('--ccs-count', default=8, help='No of Change Coordinator Services in network')
 @click.option('--bss-count', default=64, help='No of Block Storage Services in network')
 @click.option('--next-slb-strategy', default='round-robin', help="Strategy to decide on next SLB")
+@click.option('--next-bss-strategy', type=click.Choice(VALID_NEXT_BSS_STRATEGIES), default='round-robin', help="Strategy to decide on the BSS replica serving a read ('least-loaded' picks the replica with the least bytes in flight)")
 @click.option('--topology-strategy', default='grouped-by-kind', help=f"Strategy to use to spread elements across network (One of: {VALID_TOPOLOGY_STRATEGIES})")
 @click.option('--rank-names-dest', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True))
+@click.option('--metadata-dest', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True), help='Where to write the binary op metadata sidecar (trace row, host, operation and slice of every goal op), used by the report command')
 @click.option('--op-depens/--no-op-depens', default=True, help='Whether operations of the same host should require termination before the next operation can be executed')
+@click.option('--queue-depth', type=int, default=None, help='No of outstanding operations per host, each operation waits for the one X positions earlier (Default: 1 with --op-depens, unlimited otherwise)')
+@click.option('--batch-lookups/--no-batch-lookups', default=False, help='Request the SqNs of all slices of a read handled by the same CCS in one round trip')
+@click.option('--sqn-cache-size', default=0, help='No of slice SqNs each host caches (LRU, invalidated by writes of other hosts), cached slices skip the CCS lookup (Default: no cache)')
+@click.option('--write-quorum', type=int, default=None, help='No of replica acks the CCS waits for before acknowledging a write, the remaining replicas complete in the background (Default: all)')
+@click.option('--erasure-coding', type=str, default=None, help="Store slices erasure coded as 'k+m' (k data and m parity fragments of size/k on the k + m BSS of the CCS, reads fetch k fragments) instead of replicated (Default: replication)")
+@click.option('--group-commit', type=int, default=None, help='No of slice writes a CCS collects before replicating them in one round per BSS, each write is acknowledged once its round completes (Default: no group commit)')
+@click.option('--placement', type=click.Choice(VALID_PLACEMENTS), default='modulo', help="How slices are assigned to CCS and CCS to BSS replica sets: 'modulo', 'consistent-hash', 'rendezvous' or 'rack-aware' (replicas in distinct racks first)")
+@click.option('--replication', type=int, default=None, help='No of BSS replicas per CCS (Default: BSS count / CCS count)')
+@click.option('--racks', default=1, help="No of racks the BSS are spread over (for --placement rack-aware and --topology-strategy racked)")
+@click.option('--racks-per-pod', type=int, default=None, help="No of racks grouped into a pod (for --topology-strategy racked)")
+@click.option('--rack-rules', type=str, default=None, help=f"How each kind is spread over the racks of a racked topology, e.g. 'host=spread,ccs=packed' (Rules: {VALID_RACK_RULES}; Default: {','.join(f'{k}={v}' for (k, v) in DEFAULT_RACK_RULES.items())})")
+@click.option('--open-loop/--closed-loop', default=False, help='Issue the operations of a host at their (scaled) trace timestamps, regardless of the completion of earlier operations')
+@click.option('--time-scale', type=float, default=1.0, help='Factor applied to the trace inter-arrival times in --open-loop mode (< 1 compresses and increases the load)')
 @click.option('--dump-state/--no-dump-state', default=True, help='Will dump the state to disk and delete local references to reduce memory footprint significantly.')
-@click.option('--max-no-instructions', type=int, default=None, help='Only read the first X instructions from the trace file.')
-def cli_pt(trace_path, out_path, slice_size, slb_count, gs_count, mds_count, ccs_count, bss_count, next_slb_strategy, topology_strategy, rank_names_dest, op_depens, dump_state, max_no_instructions):
-    disk_size = 1024*1024*1024
-    slice_size *= 1024
-    host_count = 1
-
-    logger.info("Extracting host count and disk size from trace")
-    csv_line_no = 0
-    with open(trace_path, 'r') as f:
-        reader = csv.reader(f)
-        for (asu, lba, size, opcode, *_) in tqdm(reader):
-            host_count = max(host_count, int(asu) + 1)
-            disk_size = max(int(lba) + int(size), disk_size)
-
-            csv_line_no += 1
-            if max_no_instructions is not None and csv_line_no > max_no_instructions:
-                break
-
-    # Create Network Topology
-    logger.info(
-        f"Creating network topology ({host_count} hosts; {ccs_count} CCS; {bss_count} BSS)")
-    topology = NetworkTopology(
-        host_count=host_count,
-        slb_count=slb_count,
-        gs_count=gs_count,
-        mds_count=mds_count,
-        ccs_count=ccs_count,
-        bss_count=bss_count,
-        strategy=topology_strategy
+@selection_options
+@click.option('--host-mapping', type=click.Choice(VALID_HOST_MAPPINGS), default='identity', help="How ASUs are mapped to hosts: 'identity' (host = ASU), 'compact' (dense host ids for the ASUs doing I/O) or 'fold' (compact onto --fold-hosts hosts)")
+@click.option('--fold-hosts', type=int, default=None, help="No of hosts to fold the ASUs onto (requires --host-mapping fold)")
+@click.option('--volumes', type=click.Choice(VALID_VOLUME_MODES), default='shared', help="Whether all hosts access one shared disk ('shared') or mount their own volume, sized to the addresses they access, per host ('per-host') or per ASU ('per-asu')")
+@click.option('--host-map-dest', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True), help="Where to write the ASU to host mapping (Default: next to --rank-names-dest)")
+@click.option('--amplify', type=int, default=1, help='Replay the trace as if K times as many hosts issued it')
+@click.option('--amplify-transform', type=click.Choice(VALID_AMPLIFY_TRANSFORMS), default='offset', help="Address transform of the cloned hosts: 'none' (same slices), 'offset' (own copy of the disk) or 'shuffle' (seeded permutation of the slices)")
+@click.option('--coalesce-rows', type=int, default=None, help='Merge contiguous or overlapping requests of the same host and opcode issued within X trace rows of each other')
+@click.option('--coalesce-time', type=float, default=None, help='Merge contiguous or overlapping requests of the same host and opcode issued within X seconds (trace time) of each other')
+@click.option('--cache/--no-cache', default=True, help='Reuse goal files generated before from the same trace and options (see the cache command)')
+@click.option('--validate/--no-validate', default=False, help='Check the goal schedule for structural errors before writing it')
+def cli_pt(trace_path, out_path, slice_size, slb_count, gs_count, mds_count, ccs_count, bss_count, next_slb_strategy, next_bss_strategy, topology_strategy, rank_names_dest, metadata_dest, op_depens, queue_depth, batch_lookups, sqn_cache_size, write_quorum, group_commit, erasure_coding, placement, replication, racks, racks_per_pod, rack_rules, open_loop, time_scale, dump_state, max_no_instructions,
+           start_time, end_time, skip, every, host_sample_rate, reservoir, seed, asus, host_mapping, fold_hosts, host_map_dest, volumes,
+           amplify, amplify_transform, coalesce_rows, coalesce_time, cache, validate):
+    rack_rules_from_option(rack_rules)
+    erasure_coding_from_option(erasure_coding)
+    selection = selection_from_options(
+        max_no_instructions, start_time, end_time, skip, every,
+        host_sample_rate, reservoir, seed, asus)
+    params = dict(
+        slice_size=slice_size, slb_count=slb_count, gs_count=gs_count,
+        mds_count=mds_count, ccs_count=ccs_count, bss_count=bss_count,
+        next_slb_strategy=next_slb_strategy, next_bss_strategy=next_bss_strategy,
+        topology_strategy=topology_strategy, op_depens=op_depens, queue_depth=queue_depth, open_loop=open_loop,
+        time_scale=time_scale, batch_lookups=batch_lookups,
+        sqn_cache_size=sqn_cache_size, write_quorum=write_quorum, group_commit=group_commit,
+        erasure_coding=erasure_coding,
+        placement=placement, replication=replication, racks=racks, seed=seed,
+        racks_per_pod=racks_per_pod, rack_rules=rack_rules,
+        host_mapping=host_mapping, volumes=volumes,
+        fold_hosts=fold_hosts, amplify=amplify, amplify_transform=amplify_transform,
+        coalesce_rows=coalesce_rows, coalesce_time=coalesce_time
     )
-    if rank_names_dest:
-        topology.to_file(rank_names_dest)
+    if rank_names_dest and not host_map_dest:
+        host_map_dest = default_host_map_dest(rank_names_dest)
 
-    # Create Network
-    logger.info(
-        f"Creating network (Slice Size: {slice_size//1024}kB; Disk Size: {disk_size//1024}kB)")
-    network = DirectDriveNetwork(
-        topology=topology, slice_size=slice_size, disk_size=disk_size,
-        next_slb_strategy=next_slb_strategy, op_depens=op_depens,
-        dump_state=dump_state
-    )
+    def generate():
+        trace = open_trace(trace_path, selection=selection)
+        convert_trace(
+            trace, out_path, rank_names_dest=rank_names_dest,
+            metadata_dest=metadata_dest, host_map_dest=host_map_dest, dump_state=dump_state,
+            validate=validate, **params)
 
-    # Add Interactions
-    logger.info("Adding interactions")
-    with open(trace_path, 'r') as f:
-        reader = csv.reader(f)
-        for (i, (asu, lba, size, opcode, *_)) in tqdm(enumerate(reader), total=csv_line_no):
-            network.add_interaction(op_code=opcode, host=int(asu),
-                                    address=int(lba), size=int(size))
+    run_cached(
+        GoalCache() if cache else None, 'trace',
+        params | {'selection': vars(selection)}, [trace_path],
+        {'goal': out_path, 'rank_names': rank_names_dest, 'host_map': host_map_dest,
+         'metadata': metadata_dest},
+        generate)
 
-            if max_no_instructions is not None and i > max_no_instructions:
-                break
 
-    # Finalize
-    logger.info(f"Writing goal file to '{out_path}'")
-    network.to_goal(out_path)
+@cli.command(name="sweep", help="Parse and slice a trace once, then generate one goal file (and rank name map) per configuration of a parameter grid in parallel")
+@click.argument('trace_path', type=click.Path(exists=True, dir_okay=False, resolve_path=True))
+@click.argument('out_dir', type=click.Path(exists=False, writable=True, file_okay=False, resolve_path=True))
+@click.option('--grid', multiple=True, help="Values of a 'trace' option to sweep, e.g. '--grid ccs-count=4,8 --grid slice-size=512,1024'. Options with a single value are set for all variants.")
+@click.option('--jobs', type=int, default=os.cpu_count(), help='No of variants generated in parallel')
+@selection_options
+def cli_sweep(trace_path, out_dir, grid, jobs, max_no_instructions, start_time, end_time, skip, every,
+              host_sample_rate, reservoir, seed, asus):
+    try:
+        grid = parse_grid(list(grid))
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--grid')
+    variants = expand_grid(grid)
+
+    selection = selection_from_options(
+        max_no_instructions, start_time, end_time, skip, every,
+        host_sample_rate, reservoir, seed, asus)
+    trace = open_trace(trace_path, selection=selection)
+
+    logger.info("Loading trace")
+    columns = load_columns(trace)
+    del trace
+
+    logger.info(
+        f"Generating {len(variants)} variants of {len(columns['asu'])} instructions ({jobs} jobs)")
+    results = run_sweep(columns, variants, out_dir, {'seed': seed}, jobs)
+
+    summary_path = Path(out_dir) / "summary.csv"
+    write_summary(results, str(summary_path))
+    click.echo(format_summary(results))
+    logger.info(f"Wrote sweep summary to '{summary_path}'")
+
+
+@cli.command(name="synth", help="Creates a goal file from a synthetic workload (sequential, strided, uniform or zipf hot-spot addresses)")
+@click.option('--ops-per-host', default=1024, help='No. of operations per host')
+@click.option('--pattern', type=click.Choice(VALID_PATTERNS), default='uniform', help='Address pattern of the operations')
+@click.option('--read-ratio', default=0.5, help='Fraction of reads (0-1), the remaining operations are writes')
+@click.option('--size-dist', type=click.Choice(VALID_SIZE_DISTRIBUTIONS), default='fixed', help="Distribution of the operation sizes: 'fixed' (--size), 'uniform' (--min-size to --max-size) or 'lognormal' (median --size)")
+@click.option('--size', default=4, help='(Median) operation size in kB')
+@click.option('--min-size', default=1, help='Minimum operation size in kB')
+@click.option('--max-size', default=1024, help='Maximum operation size in kB')
+@click.option('--stride', default=64, help="Stride in kB for the 'strided' pattern")
+@click.option('--zipf-alpha', default=1.2, help="Skew (> 1) of the 'zipf' pattern")
+@click.option('--block-size', default=4, help='Alignment of addresses and sizes in kB')
+@click.option('--seed', type=int, default=None, help='Seed for the workload (Default: random)')
+@click.option('--mount/--no-mount', default=True, help='Also simulate mount operation for each host')
+@click.option('--disk-size', default=1024*1024, help='Disk size in kB')
+@click.option('--slice-size', default=1024, help='Slice size in kB')
+@click.option('--host-count', default=16, help='No. of hosts in network')
+@click.option('--slb-count', default=1, help='No of Software Load Balancers in network')
+@click.option('--gs-count', default=1, help='No of Gateway Switches in network')
+@click.option('--mds-count', default=1, help='No of MetaData Services in network')
+@click.option('--ccs-count', default=8, help='No of Change Coordinator Services in network')
+@click.option('--bss-count', default=64, help='No of Block Storage Services in network')
+@click.option('--next-bss-strategy', type=click.Choice(VALID_NEXT_BSS_STRATEGIES), default='round-robin', help="Strategy to decide on the BSS replica serving a read ('least-loaded' picks the replica with the least bytes in flight)")
+@click.option('--topology-strategy', default='grouped-by-kind', help=f"Strategy to use to spread elements across network (One of: {VALID_TOPOLOGY_STRATEGIES})")
+@click.option('--rank-names-dest', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True))
+@click.option('--metadata-dest', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True), help='Where to write the binary op metadata sidecar (trace row, host, operation and slice of every goal op), used by the report command')
+@click.option('--op-depens/--no-op-depens', default=True, help='Whether operations of the same host should require termination before the next operation can be executed')
+@click.option('--queue-depth', type=int, default=None, help='No of outstanding operations per host, each operation waits for the one X positions earlier (Default: 1 with --op-depens, unlimited otherwise)')
+@click.option('--batch-lookups/--no-batch-lookups', default=False, help='Request the SqNs of all slices of a read handled by the same CCS in one round trip')
+@click.option('--sqn-cache-size', default=0, help='No of slice SqNs each host caches (LRU, invalidated by writes of other hosts), cached slices skip the CCS lookup (Default: no cache)')
+@click.option('--write-quorum', type=int, default=None, help='No of replica acks the CCS waits for before acknowledging a write, the remaining replicas complete in the background (Default: all)')
+@click.option('--erasure-coding', type=str, default=None, help="Store slices erasure coded as 'k+m' (k data and m parity fragments of size/k on the k + m BSS of the CCS, reads fetch k fragments) instead of replicated (Default: replication)")
+@click.option('--group-commit', type=int, default=None, help='No of slice writes a CCS collects before replicating them in one round per BSS, each write is acknowledged once its round completes (Default: no group commit)')
+@click.option('--placement', type=click.Choice(VALID_PLACEMENTS), default='modulo', help="How slices are assigned to CCS and CCS to BSS replica sets: 'modulo', 'consistent-hash', 'rendezvous' or 'rack-aware' (replicas in distinct racks first)")
+@click.option('--replication', type=int, default=None, help='No of BSS replicas per CCS (Default: BSS count / CCS count)')
+@click.option('--racks', default=1, help="No of racks the BSS are spread over (for --placement rack-aware and --topology-strategy racked)")
+@click.option('--racks-per-pod', type=int, default=None, help="No of racks grouped into a pod (for --topology-strategy racked)")
+@click.option('--rack-rules', type=str, default=None, help=f"How each kind is spread over the racks of a racked topology, e.g. 'host=spread,ccs=packed' (Rules: {VALID_RACK_RULES}; Default: {','.join(f'{k}={v}' for (k, v) in DEFAULT_RACK_RULES.items())})")
+@click.option('--dump-state/--no-dump-state', default=True, help='Will dump the state to disk and delete local references to reduce memory footprint significantly.')
+@click.option('--cache/--no-cache', default=True, help='Reuse goal files generated before from the same options (only if --seed is set)')
+@click.argument('out_file', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True))
+def cli_synth(out_file, ops_per_host, pattern, read_ratio, size_dist, size, min_size, max_size, stride, zipf_alpha, block_size, seed, mount,
+              disk_size, slice_size, host_count, slb_count, gs_count, mds_count, ccs_count, bss_count, next_bss_strategy, topology_strategy, rank_names_dest, metadata_dest, op_depens, queue_depth, batch_lookups, sqn_cache_size, write_quorum, group_commit, erasure_coding, placement, replication, racks, racks_per_pod, rack_rules, dump_state,
+              cache):
+    disk_size *= 1024
+    slice_size *= 1024
+    params = {
+        k: v for (k, v) in locals().items()
+        if k not in ('out_file', 'rank_names_dest', 'metadata_dest', 'dump_state', 'cache')
+    }
+    rules = rack_rules_from_option(rack_rules)
+    ec = erasure_coding_from_option(erasure_coding)
+    if ec is not None:
+        replication = sum(ec)
+
+    def generate():
+        logger.info(
+            f"Generating synthetic workload ({host_count} hosts x {ops_per_host} ops; {pattern})")
+        generator = WorkloadGenerator(
+            disk_size=disk_size, host_count=host_count, pattern=pattern,
+            read_ratio=read_ratio, size_distribution=size_dist, size=size * 1024,
+            min_size=min_size * 1024, max_size=max_size * 1024,
+            stride=stride * 1024, zipf_alpha=zipf_alpha,
+            block_size=block_size * 1024, seed=seed
+        )
+        workload = generator.generate(ops_per_host)
+        logger.info(
+            f"Generated {len(workload)} ops ({workload.total_bytes() // 1024}kB)")
+
+        topology = NetworkTopology(
+            host_count=host_count,
+            slb_count=slb_count,
+            gs_count=gs_count,
+            mds_count=mds_count,
+            ccs_count=ccs_count,
+            bss_count=bss_count,
+            strategy=topology_strategy,
+            racks=racks, racks_per_pod=racks_per_pod, rack_rules=rules
+        )
+        if rank_names_dest:
+            topology.to_file(rank_names_dest)
+
+        network = DirectDriveNetwork(
+            topology=topology, slice_size=slice_size, disk_size=disk_size,
+            next_bss_strategy=next_bss_strategy, op_depens=op_depens, queue_depth=queue_depth,
+            batch_lookups=batch_lookups, sqn_cache_size=sqn_cache_size,
+            write_quorum=write_quorum, group_commit=group_commit,
+            erasure_coding=ec, dump_state=dump_state, metadata_dest=metadata_dest,
+            placement=Placement(strategy=placement, replication=replication,
+                                racks=racks, seed=seed)
+        )
+        logger.info(
+            f"Placement ({placement}): {format_placement_report(network.placement_stats)}")
+
+        logger.info("Adding interactions")
+        network.add_workload(workload, mount=mount)
+
+        logger.info(f"Writing goal file to '{out_file}'")
+        network.to_goal(out_file)
+
+    # Without a seed every run draws a different workload
+    run_cached(
+        GoalCache() if cache and seed is not None else None, 'synth', params, [],
+        {'goal': out_file, 'rank_names': rank_names_dest, 'metadata': metadata_dest}, generate)
 
 
 @cli.command(name="simple", help="Creates a goal file of a simple network and adds for each host random read and writes")
@@ -110,8 +327,9 @@ def cli_pt(trace_path, out_path, slice_size, slb_count, gs_count, mds_count, ccs
 @click.option('--bss-count', default=1280, help='No of Block Storage Services in network')
 @click.option('--topology-strategy', default='grouped-by-kind', help=f"Strategy to use to spread elements across network (One of: {VALID_TOPOLOGY_STRATEGIES})")
 @click.option('--rank-names-dest', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True))
+@click.option('--seed', type=int, default=None, help='Seed for the random operations (Default: random)')
 @click.argument('out_file', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True))
-def cli_cs(out_file, writes, reads, mount, host_count, disk_size, slice_size, slb_count, gs_count, mds_count, ccs_count, bss_count, topology_strategy, rank_names_dest):
+def cli_cs(out_file, writes, reads, mount, host_count, disk_size, slice_size, slb_count, gs_count, mds_count, ccs_count, bss_count, topology_strategy, rank_names_dest, seed):
     """ Creates a simple network and random reads and writes in it """
     disk_size *= 1024
     slice_size *= 1024
@@ -133,31 +351,21 @@ def cli_cs(out_file, writes, reads, mount, host_count, disk_size, slice_size, sl
         dump_state=True, op_depens=True
     )
 
-    pbar = tqdm(total=(reads * host_count + writes * host_count))
+    rng = np.random.default_rng(seed)
 
     if not reads and not writes and mount:
         for h in range(host_count):
             network.add_mount(h)
 
-    if reads:
-        logger.info("Adding Read Interactions")
-        for h in range(host_count):
-            for _ in range(reads):
-                start = random.randint(0, disk_size//2)
-                len = random.randint(0, disk_size-start)
-                network.add_interaction(
-                    op_code='r', host=h, address=start, size=len, mount=mount)
-            pbar.update(host_count)
-
-    if writes:
-        logger.info("Adding Write Interactions")
-        for h in range(host_count):
-            for _ in range(writes):
-                start = random.randint(0, disk_size//2)
-                len = random.randint(0, disk_size-start)
-                network.add_interaction(
-                    op_code='w', host=h, address=start, size=len, mount=mount)
-            pbar.update(host_count)
+    for (op, count, name) in [(OP_READ, reads, "Read"), (OP_WRITE, writes, "Write")]:
+        if not count:
+            continue
+        logger.info(f"Adding {name} Interactions")
+        (starts, ends) = random_ranges(rng, host_count * count, disk_size)
+        workload = Workload(
+            np.full(host_count * count, op, dtype=np.uint8),
+            np.repeat(np.arange(host_count), count), starts, ends - starts)
+        network.add_workload(workload, mount=mount)
 
     logger.info(f"Writing goal file to '{out_file}'")
     network.to_goal(out_file)
@@ -179,8 +387,9 @@ def cli_cs(out_file, writes, reads, mount, host_count, disk_size, slice_size, sl
 @click.option('--topology-strategy', default='grouped-by-kind', help=f"Strategy to use to spread elements across network (One of: {VALID_TOPOLOGY_STRATEGIES})")
 @click.option('--rank-names-dest', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True))
 @click.option('--dump-state/--no-dump-state', default=True, help='Will dump the state to disk and delete local references to reduce memory footprint significantly.')
+@click.option('--seed', type=int, default=None, help='Seed for the random operations (Default: random)')
 @click.argument('out_file', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True))
-def cli_wc(out_file, writes, reads, mount, host_count, disk_size, slice_size, slb_count, gs_count, mds_count, ccs_count, bss_count, topology_strategy, rank_names_dest, repeats, dump_state):
+def cli_wc(out_file, writes, reads, mount, host_count, disk_size, slice_size, slb_count, gs_count, mds_count, ccs_count, bss_count, topology_strategy, rank_names_dest, repeats, dump_state, seed):
     """ Creates a simple network and random reads and writes in it """
     disk_size *= 1024
     slice_size *= 1024
@@ -202,6 +411,7 @@ def cli_wc(out_file, writes, reads, mount, host_count, disk_size, slice_size, sl
         dump_state=dump_state, op_depens=True
     )
 
+    rng = np.random.default_rng(seed)
     pbar = tqdm(total=(repeats*reads*host_count + repeats*writes *
                 host_count + (host_count if mount else 0)))
     if mount:
@@ -213,18 +423,16 @@ def cli_wc(out_file, writes, reads, mount, host_count, disk_size, slice_size, sl
     for r in range(repeats):
         if reads:
             logger.info(f"Adding Read Interactions (Rep {r})")
-            for _ in range(reads):
-                start = random.randint(0, disk_size//2)
-                end = random.randint(start, disk_size)
+            (starts, ends) = random_ranges(rng, reads, disk_size)
+            for (start, end) in zip(starts.tolist(), ends.tolist()):
                 for h in range(host_count):
                     network.add_read(h, start, end)
                 pbar.update(host_count)
 
         if writes:
             logger.info(f"Adding Write Interactions (Rep {r})")
-            for _ in range(writes):
-                start = random.randint(0, disk_size//2)
-                end = random.randint(start, disk_size)
+            (starts, ends) = random_ranges(rng, writes, disk_size)
+            for (start, end) in zip(starts.tolist(), ends.tolist()):
                 for h in range(host_count):
                     network.add_write(h, start, end)
                 pbar.update(host_count)
@@ -233,5 +441,154 @@ def cli_wc(out_file, writes, reads, mount, host_count, disk_size, slice_size, sl
     network.to_goal(out_file)
 
 
+@cli.command(name="estimate", help="Estimate runtime bounds of a goal file in seconds (LogGP critical path and per rank busy time), to screen configurations before running LogGOPSim")
+@click.argument('goal_path', type=click.Path(exists=True, dir_okay=False, resolve_path=True))
+@click.option('-L', 'latency', type=int, default=LogGPParameters.L, help='Latency in ns')
+@click.option('-o', 'overhead', type=int, default=LogGPParameters.o, help='CPU overhead per message in ns')
+@click.option('-g', 'gap', type=int, default=LogGPParameters.g, help='Gap between messages in ns')
+@click.option('-G', 'gap_per_byte', type=float, default=LogGPParameters.G, help='Gap per byte in ns')
+@click.option('-O', 'overhead_per_byte', type=float, default=LogGPParameters.O, help='CPU overhead per byte in ns')
+@click.option('--per-rank-dest', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True), help='Where to write the busy times per rank (csv)')
+def cli_estimate(goal_path, latency, overhead, gap, gap_per_byte, overhead_per_byte, per_rank_dest):
+    params = LogGPParameters(L=latency, o=overhead, g=gap,
+                             G=gap_per_byte, O=overhead_per_byte)
+    logger.info(f"Estimating runtime of '{goal_path}'")
+    est = estimate_goal(goal_path, params)
+
+    busiest = est.busiest_rank
+    path = ' -> '.join(map(str, est.critical_ranks[:16])) + \
+        (' -> ...' if len(est.critical_ranks) > 16 else '')
+    click.echo(f"Ranks: {est.no_ranks}, ops: {est.no_ops}, messages: {est.no_messages}")
+    click.echo(f"Lower bound: {est.lower_bound_ns / 1e9:.6f}s")
+    click.echo(
+        f"Critical path: {est.critical_path_ns / 1e9:.6f}s ({est.critical_ops} ops; ranks {path})")
+    if busiest >= 0:
+        click.echo(
+            f"Busiest rank: {busiest} ({est.busy_ns[busiest] / 1e9:.6f}s busy; {est.ops_per_rank[busiest]} ops)")
+    if est.unmatched_sends or est.unmatched_recvs or est.dangling_requires:
+        click.echo(
+            f"Warning: {est.unmatched_sends} unmatched sends, {est.unmatched_recvs} unmatched receives, {est.dangling_requires} dangling requires")
+    if est.deadlocked:
+        click.echo(f"Warning: {est.blocked_ops} ops can never execute (deadlock)")
+
+    if per_rank_dest:
+        with open(per_rank_dest, 'w+') as f:
+            f.write("rank,ops,cpu_busy_ns,nic_busy_ns\n")
+            f.writelines(
+                f"{r},{est.ops_per_rank[r]},{est.cpu_busy_ns[r]:.0f},{est.nic_busy_ns[r]:.0f}\n"
+                for r in range(est.no_ranks))
+        logger.info(f"Wrote busy times per rank to '{per_rank_dest}'")
+
+
+@cli.command(name="validate", help="Check a goal file for structural errors (duplicate or dangling labels, dependency cycles, unmatched sends/receives) before simulating it")
+@click.argument('goal_path', type=click.Path(exists=True, dir_okay=False, resolve_path=True))
+@click.option('--check-cycles/--no-check-cycles', default=False, help='Also check for wait cycles across ranks (holds the op graph in memory like estimate, which reports them as deadlocks too)')
+def cli_validate(goal_path, check_cycles):
+    logger.info(f"Validating goal file '{goal_path}'")
+    report = validate_goal(goal_path, check_cycles)
+    for error in report.errors:
+        click.echo(error)
+    click.echo(report.summary())
+    if not report.ok:
+        sys.exit(1)
+
+
+@cli.command(name="goalstat", help="Aggregate a goal file per rank (ops, bytes, dependency fan-in/out) and per link (messages and bytes per rank pair) in one streaming pass")
+@click.argument('goal_path', type=click.Path(exists=True, dir_okay=False, resolve_path=True))
+@click.option('--rank-names', type=click.Path(exists=True, dir_okay=False, resolve_path=True), help='Rank name map of the goal file (see --rank-names-dest) to label the ranks')
+@click.option('--json-dest', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True), help='Where to write all aggregates as json')
+@click.option('--ranks-csv', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True), help='Where to write the per rank aggregates as csv')
+@click.option('--links-csv', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True), help='Where to write the per link aggregates as csv')
+@click.option('--top', default=10, help='No of largest ranks and links to show')
+@click.option('--sort-by', type=click.Choice(['ops', 'bytes_sent', 'bytes_received', 'requires', 'max_fan_in', 'max_fan_out']), default='ops', help='Order of the largest ranks')
+def cli_goalstat(goal_path, rank_names, json_dest, ranks_csv, links_csv, top, sort_by):
+    rank_map = load_rank_map(rank_names) if rank_names else {}
+    stats = GoalStats(rank_names_of(rank_map), rank_racks_of(rank_map))
+    logger.info(f"Reading goal file '{goal_path}'")
+    stats.add(read_goal(goal_path))
+
+    totals = stats.totals()
+    click.echo(', '.join(f"{k}: {v}" for (k, v) in totals.items()))
+    if top:
+        click.echo(f"\nTop {top} ranks by {sort_by}:")
+        click.echo(format_table(stats.top_ranks(sort_by, top), [
+            'rank', 'name', 'ops', 'bytes_sent', 'bytes_received', 'max_fan_in', 'max_fan_out']))
+        click.echo(f"\nTop {top} links by bytes:")
+        click.echo(format_table(stats.top_links(top), ['src', 'dst', 'messages', 'bytes']))
+
+    if json_dest:
+        stats.to_json(json_dest)
+        logger.info(f"Wrote aggregates to '{json_dest}'")
+    if ranks_csv or links_csv:
+        stats.to_csv(ranks_csv, links_csv)
+        logger.info("Wrote aggregates as csv")
+
+
+@cli.command(name="report", help="Per I/O latency breakdown (p50/p99/p999 per op, host and phase) and throughput over time of a LogGOPSim viz file, joined with the op metadata of its goal file (see --metadata-dest)")
+@click.argument('viz_path', type=click.Path(exists=True, dir_okay=False, resolve_path=True))
+@click.argument('goal_path', type=click.Path(exists=True, dir_okay=False, resolve_path=True))
+@click.argument('metadata_path', type=click.Path(exists=True, dir_okay=False, resolve_path=True))
+@click.option('--bucket-width', type=int, default=1_000_000, help='Width of the throughput buckets (in ns of simulated time)')
+@click.option('-L', 'latency', type=int, default=LogGPParameters.L, help='Network latency in ns the viz file was simulated with, orders the receives like LogGOPSim')
+@click.option('--max-ambiguous', type=float, default=0.01, help='Fail if more than this share of the joined records had several equally ready ops of different I/Os, their latencies would be attributed by guess (Default: 1%)')
+@click.option('--per-host/--no-per-host', default=False, help='Also show the latencies per host')
+@click.option('--json-dest', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True), help='Where to write latencies and throughput as json')
+@click.option('--latencies-csv', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True), help='Where to write the latencies per op, host and phase as csv')
+@click.option('--throughput-csv', type=click.Path(exists=False, writable=True, dir_okay=False, resolve_path=True), help='Where to write the throughput per bucket as csv')
+def cli_report(viz_path, goal_path, metadata_path, bucket_width, latency, max_ambiguous, per_host, json_dest,
+               latencies_csv, throughput_csv):
+    logger.info(f"Reading viz file '{viz_path}'")
+    report = report_viz(viz_path, goal_path, metadata_path, bucket_width, latency)
+
+    totals = report.totals()
+    click.echo(', '.join(f"{k}: {v}" for (k, v) in totals.items()))
+    if totals['incomplete_ios'] or any(v for (k, v) in totals.items() if k.startswith('unmatched_')):
+        logger.warning("Not all records could be joined, was the viz file simulated from this goal file (and with this -L)?")
+    ambiguous = totals['ambiguous_joins'] / max(totals['joined_records'], 1)
+    if ambiguous > max_ambiguous:
+        logger.error(
+            f"{ambiguous:.2%} of the records had several equally ready ops of different I/Os (more than --max-ambiguous {max_ambiguous:.2%}), the latencies per I/O would be guesses")
+        sys.exit(1)
+    if totals['ambiguous_joins']:
+        logger.warning(f"{totals['ambiguous_joins']} records had several equally ready ops of different I/Os, their per I/O attribution is a guess")
+    click.echo("\nLatencies:")
+    click.echo(format_table(report.latency_rows(per_host), LATENCY_COLUMNS))
+
+    if json_dest:
+        report.to_json(json_dest)
+        logger.info(f"Wrote report to '{json_dest}'")
+    if latencies_csv or throughput_csv:
+        report.to_csv(latencies_csv, throughput_csv)
+        logger.info("Wrote report as csv")
+
+
+@cli.group(name="cache", help="Inspect and maintain the cache of generated goal files")
+@click.option('--cache-dir', type=click.Path(file_okay=False, resolve_path=True), default=None, help='Cache directory (Default: $TRACE2GOAL_CACHE_DIR or ~/.cache/trace2goal)')
+@click.pass_context
+def cli_cache(ctx, cache_dir):
+    ctx.obj = GoalCache(cache_dir)
+
+
+@cli_cache.command(name="stats", help="Show size, no of entries and hit rate of the cache")
+@click.pass_obj
+def cli_cache_stats(cache):
+    stats = cache.stats()
+    lookups = stats['hits'] + stats['misses']
+    click.echo(f"Cache directory: {stats['cache_dir']}")
+    click.echo(f"Entries: {stats['entries']}")
+    click.echo(
+        f"Size: {stats['size'] / 1024**2:.2f}MB of {stats['max_size'] / 1024**2:.2f}MB")
+    click.echo(
+        f"Hits: {stats['hits']}, misses: {stats['misses']} ({stats['hits'] / max(lookups, 1):.0%} hit rate)")
+
+
+@cli_cache.command(name="prune", help="Evict the least recently used entries until the cache fits into its size limit")
+@click.option('--max-size', type=int, default=None, help='Size limit in MB (Default: $TRACE2GOAL_CACHE_SIZE or 50GB)')
+@click.pass_obj
+def cli_cache_prune(cache, max_size):
+    evicted = cache.prune(max_size * 1024**2 if max_size is not None else None)
+    logger.info(f"Evicted {evicted} cache entries")
+
+
 if __name__ == "__main__":
     cli()
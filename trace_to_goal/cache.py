@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from loguru import logger
+from typing import Any, Callable, Dict, List, Optional
+
+from . import __version__
+
+DEFAULT_CACHE_DIR: str = os.environ.get(
+    'TRACE2GOAL_CACHE_DIR',
+    str(Path.home() / '.cache' / 'trace2goal'))
+# Size limit of the cache in bytes
+DEFAULT_CACHE_SIZE: int = int(os.environ.get(
+    'TRACE2GOAL_CACHE_SIZE', 50 * 1024**3))
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+PACKAGE_DIR = Path(__file__).parent
+
+_source_digest: Optional[str] = None
+
+
+def source_digest() -> str:
+    """ Hash of the package sources, so changes to the generation invalidate
+    the cache even if the version was not bumped """
+    global _source_digest
+    if _source_digest is None:
+        digest = hashlib.sha256()
+        for path in sorted(PACKAGE_DIR.rglob('*.py')):
+            digest.update(str(path.relative_to(PACKAGE_DIR)).encode())
+            digest.update(path.read_bytes())
+        _source_digest = digest.hexdigest()
+    return _source_digest
+
+
+def link_or_copy(src: str, dest: str):
+    """ Hardlinks src to dest, falls back to copying across file systems """
+    parent = Path(dest).parent.absolute()
+    os.makedirs(parent, exist_ok=True)
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+def unlink_outputs(outputs: Dict[str, Optional[str]]):
+    """ Removes existing outputs before they are regenerated. They might be
+    hardlinks into the cache, which must not be overwritten in place """
+    for path in outputs.values():
+        if path and os.path.lexists(path):
+            os.remove(path)
+
+
+def run_cached(cache: Optional['GoalCache'], command: str, params: Dict[str, Any],
+               inputs: List[str], outputs: Dict[str, Optional[str]],
+               generate: Callable[[], Any]):
+    if cache is None:
+        unlink_outputs(outputs)
+        generate()
+    else:
+        cache.run(command, params, inputs, outputs, generate)
+
+
+class GoalCache:
+    """ Content addressed cache of generated goal files (and their side
+    outputs). Entries are keyed by the input content, all parameters, the
+    tool version and its sources and are evicted least recently used first """
+    cache_dir: Path
+    max_size: int
+
+    def __init__(self, cache_dir: Optional[str] = None, max_size: Optional[int] = None):
+        self.cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR).absolute()
+        self.max_size = max_size if max_size is not None else DEFAULT_CACHE_SIZE
+        os.makedirs(self.entries_dir, exist_ok=True)
+        os.makedirs(self.inputs_dir, exist_ok=True)
+
+    @property
+    def entries_dir(self) -> Path:
+        return self.cache_dir / 'entries'
+
+    @property
+    def inputs_dir(self) -> Path:
+        return self.cache_dir / 'inputs'
+
+    def hash_input(self, path: str) -> str:
+        """ Content hash of an input file. A '<path>.sha256' sidecar is used
+        if it exists, computed hashes are memoized by (path, size, mtime) """
+        sidecar = Path(f"{path}.sha256")
+        if sidecar.is_file():
+            return sidecar.read_text().split()[0]
+
+        stat = os.stat(path)
+        memo_key = hashlib.sha256(
+            f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+        memo = self.inputs_dir / memo_key
+        if memo.is_file():
+            return memo.read_text()
+
+        logger.info(f"Hashing input '{path}'")
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+        value = digest.hexdigest()
+        memo.write_text(value)
+        return value
+
+    def key(self, command: str, params: Dict[str, Any], inputs: List[str], roles: List[str]) -> str:
+        value = {
+            'version': __version__,
+            'sources': source_digest(),
+            'command': command,
+            'params': params,
+            'inputs': [self.hash_input(i) for i in inputs],
+            'outputs': sorted(roles),
+        }
+        return hashlib.sha256(
+            json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+    def restore(self, key: str, outputs: Dict[str, str]) -> bool:
+        entry = self.entries_dir / key
+        if not all((entry / role).is_file() for role in outputs):
+            return False
+        for (role, dest) in outputs.items():
+            link_or_copy(str(entry / role), dest)
+        # Mark the entry as recently used
+        os.utime(entry / 'meta.json')
+        return True
+
+    def store(self, key: str, outputs: Dict[str, str], params: Dict[str, Any]):
+        entry = self.entries_dir / key
+        tmp_entry = self.entries_dir / f".{key}.{os.getpid()}"
+        os.makedirs(tmp_entry, exist_ok=True)
+        for (role, src) in outputs.items():
+            link_or_copy(src, str(tmp_entry / role))
+        (tmp_entry / 'meta.json').write_text(
+            json.dumps({'created': time.time(), 'params': params}, default=str))
+
+        if entry.exists():
+            shutil.rmtree(entry)
+        os.rename(tmp_entry, entry)
+        self.prune()
+
+    def run(self, command: str, params: Dict[str, Any], inputs: List[str],
+            outputs: Dict[str, Optional[str]], generate: Callable[[], Any]):
+        """ Restores the outputs from the cache, or generates and stores them """
+        outputs = {role: path for (role, path) in outputs.items() if path}
+        key = self.key(command, params, inputs, list(outputs))
+        if self.restore(key, outputs):
+            logger.info(f"Restored outputs from cache (entry {key[:12]})")
+            self._count('hits')
+            return
+        self._count('misses')
+
+        unlink_outputs(outputs)
+        generate()
+        self.store(key, outputs, params)
+        logger.info(f"Stored outputs in cache (entry {key[:12]})")
+
+    def _count(self, counter: str):
+        path = self.cache_dir / 'counters.json'
+        counters = json.loads(path.read_text()) if path.is_file() else {}
+        counters[counter] = counters.get(counter, 0) + 1
+        path.write_text(json.dumps(counters))
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """ All entries with their size and last use, least recently used first """
+        result = []
+        for entry in self.entries_dir.iterdir():
+            meta = entry / 'meta.json'
+            if entry.name.startswith('.') or not meta.is_file():
+                continue
+            # Hardlinked files are still counted fully
+            size = sum(f.stat().st_size for f in entry.iterdir())
+            result.append({
+                'key': entry.name, 'path': entry, 'size': size,
+                'last_used': meta.stat().st_mtime,
+            })
+        result.sort(key=lambda e: e['last_used'])
+        return result
+
+    def prune(self, max_size: Optional[int] = None) -> int:
+        """ Evicts the least recently used entries until the cache is smaller
+        than max_size, returns the no of evicted entries """
+        max_size = self.max_size if max_size is None else max_size
+        entries = self.entries()
+        total = sum(e['size'] for e in entries)
+        evicted = 0
+        for e in entries:
+            if total <= max_size:
+                break
+            shutil.rmtree(e['path'])
+            total -= e['size']
+            evicted += 1
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self.entries()
+        path = self.cache_dir / 'counters.json'
+        counters = json.loads(path.read_text()) if path.is_file() else {}
+        return {
+            'cache_dir': str(self.cache_dir),
+            'entries': len(entries),
+            'size': sum(e['size'] for e in entries),
+            'max_size': self.max_size,
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+        }
@@ -0,0 +1,234 @@
+import math
+import os
+import time
+from pathlib import Path
+from loguru import logger
+from tqdm import tqdm
+from typing import Dict, Optional
+
+from .common import DEFAULT_DUMP_DIR
+from .network import NetworkTopology, DirectDriveNetwork, parse_erasure_coding, parse_rack_rules
+from .placement import Placement, format_placement_report
+from .trace import HostMapping, TraceAmplification, TraceCoalescing, TraceTimings, VolumeLayout
+from .validate import GoalValidationError
+
+
+def default_host_map_dest(rank_names_dest: str) -> str:
+    return str(Path(rank_names_dest).with_suffix('')) + '_hosts.json'
+
+
+def convert_trace(trace, out_path: str, *,
+                  slice_size: int = 1024,
+                  slb_count: int = 1,
+                  gs_count: int = 1,
+                  mds_count: int = 1,
+                  ccs_count: int = 8,
+                  bss_count: int = 64,
+                  next_slb_strategy: str = 'round-robin',
+                  next_bss_strategy: str = 'round-robin',
+                  topology_strategy: str = 'grouped-by-kind',
+                  rank_names_dest: Optional[str] = None,
+                  metadata_dest: Optional[str] = None,
+                  op_depens: bool = True,
+                  queue_depth: Optional[int] = None,
+                  open_loop: bool = False,
+                  time_scale: float = 1.0,
+                  batch_lookups: bool = False,
+                  sqn_cache_size: int = 0,
+                  write_quorum: Optional[int] = None,
+                  group_commit: Optional[int] = None,
+                  erasure_coding: Optional[str] = None,
+                  placement: str = 'modulo',
+                  replication: Optional[int] = None,
+                  racks: int = 1,
+                  racks_per_pod: Optional[int] = None,
+                  rack_rules: Optional[str] = None,
+                  dump_state: bool = True,
+                  dump_folder: str = DEFAULT_DUMP_DIR,
+                  seed: int = 0,
+                  host_mapping: str = 'identity',
+                  fold_hosts: Optional[int] = None,
+                  host_map_dest: Optional[str] = None,
+                  volumes: str = 'shared',
+                  amplify: int = 1,
+                  amplify_transform: str = 'offset',
+                  coalesce_rows: Optional[int] = None,
+                  coalesce_time: Optional[float] = None,
+                  validate: bool = False) -> Dict:
+    """ Transforms an opened (csv or columnar) trace to a goal file and
+    returns some statistics of the conversion. Sizes are given in kB """
+    conversion_start = time.perf_counter()
+    disk_size = 1024*1024*1024
+    slice_size *= 1024
+
+    logger.info("Extracting host count and disk size from trace")
+    (trace_asus, max_addr, no_rows) = trace.extent()
+    disk_size = max(max_addr, disk_size)
+    hosts = HostMapping(trace_asus, host_mapping, fold_count=fold_hosts)
+    logger.info(
+        f"Mapped {len(trace_asus)} ASUs onto {hosts.host_count} hosts ({host_mapping})")
+
+    assert time_scale > 0, "Time scale has to be > 0"
+    no_slices = math.ceil(disk_size / slice_size)
+    volume_layout = None
+    volume_sizes = None
+    if volumes != 'shared':
+        volume_layout = VolumeLayout(trace.asu_extents(), hosts, volumes)
+        logger.info(
+            f"Creating {len(volume_layout.sizes)} volumes ({volumes}) with {volume_layout.no_slices(slice_size)} slices "
+            f"(a shared disk has {no_slices} slices)")
+        no_slices = volume_layout.no_slices(slice_size)
+    amplification = TraceAmplification(
+        no_slices, amplify, amplify_transform, seed=seed)
+    host_count = hosts.host_count * amplification.factor
+    disk_size = max(disk_size, amplification.total_slices() * slice_size)
+    if volume_layout is not None:
+        # Offset clones access their own copies of all volumes
+        copies = amplification.factor if amplification.transform == 'offset' else 1
+        volume_sizes = volume_layout.sizes * copies
+    host_labels = hosts.host_labels()
+    if amplification.factor > 1:
+        logger.info(
+            f"Amplifying {hosts.host_count} hosts {amplify}x ({amplify_transform})")
+        host_labels = {
+            amplification.clone_host(c, h, hosts.host_count):
+                f"Host {amplification.clone_host(c, h, hosts.host_count)} (Clone {c} of " +
+                host_labels.get(h, f"Host {h}") + ")"
+            for c in range(1, amplification.factor)
+            for h in range(hosts.host_count)
+        } | host_labels
+
+    # Create Network Topology
+    logger.info(
+        f"Creating network topology ({host_count} hosts; {ccs_count} CCS; {bss_count} BSS)")
+    topology = NetworkTopology(
+        host_count=host_count,
+        slb_count=slb_count,
+        gs_count=gs_count,
+        mds_count=mds_count,
+        ccs_count=ccs_count,
+        bss_count=bss_count,
+        strategy=topology_strategy,
+        racks=racks, racks_per_pod=racks_per_pod,
+        rack_rules=parse_rack_rules(rack_rules)
+    )
+    if rank_names_dest:
+        topology.to_file(rank_names_dest, host_labels=host_labels)
+        if not host_map_dest:
+            host_map_dest = default_host_map_dest(rank_names_dest)
+    if host_map_dest:
+        hosts.to_file(host_map_dest)
+
+    ec = parse_erasure_coding(erasure_coding)
+    if ec is not None:
+        # Every CCS stores the k + m fragments of its slices on k + m BSS
+        assert replication is None or replication == sum(ec), "Erasure coding requires a replication of k + m"
+        replication = sum(ec)
+
+    # Create Network
+    logger.info(
+        f"Creating network (Slice Size: {slice_size//1024}kB; Disk Size: {disk_size//1024}kB)")
+    network = DirectDriveNetwork(
+        topology=topology, slice_size=slice_size, disk_size=disk_size,
+        next_slb_strategy=next_slb_strategy, next_bss_strategy=next_bss_strategy,
+        op_depens=op_depens,
+        queue_depth=queue_depth, open_loop=open_loop,
+        batch_lookups=batch_lookups, sqn_cache_size=sqn_cache_size,
+        write_quorum=write_quorum, group_commit=group_commit,
+        volume_sizes=volume_sizes, erasure_coding=ec,
+        placement=Placement(strategy=placement, replication=replication,
+                            racks=racks, seed=seed),
+        dump_state=dump_state, dump_folder=dump_folder,
+        metadata_dest=metadata_dest
+    )
+
+    logger.info(
+        f"Placement ({placement}): {format_placement_report(network.placement_stats)}")
+
+    # Add Interactions
+    logger.info("Adding interactions")
+    trace.timings = TraceTimings()
+    start = time.perf_counter()
+    first_timestamp = None
+    issue_time = None
+    rows = tqdm(trace.indexed(), total=no_rows)
+    coalescing = None
+    if coalesce_rows is not None or coalesce_time is not None:
+        coalescing = TraceCoalescing(
+            window_rows=coalesce_rows, window_time=coalesce_time, slice_size=slice_size)
+        # Requests of different volumes are never adjacent
+        rows = coalescing.coalesce(
+            rows, host_of=None if volumes == 'per-asu' else hosts.__getitem__)
+    # Operations are identified by their row in the trace file (the first
+    # one of coalesced requests), clones share it
+    for (row, (asu, lba, size, opcode, timestamp)) in rows:
+        if open_loop:
+            # Trace time since the first operation, scaled and in ns
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            issue_time = round((timestamp - first_timestamp) * time_scale * 1e9)
+        # Slices are only resolved once and then transformed for each clone
+        host = hosts[asu]
+        slices = network.resolve_slices(
+            lba, size, volume_layout[asu] if volume_layout is not None else None)
+        for clone in range(amplification.factor):
+            network.add_interaction(
+                op_code=opcode, address=lba, size=size,
+                host=amplification.clone_host(clone, host, hosts.host_count),
+                slices=amplification.clone_slices(clone, slices),
+                issue_time=issue_time, row=row)
+    if open_loop and issue_time is not None:
+        logger.info(
+            f"Open loop replay issues the operations over {issue_time / 1e9:.3f}s (time scale {time_scale})")
+    timings = trace.timings
+    total = time.perf_counter() - start
+    logger.info(
+        f"Time split: decompress {timings.decompress:.2f}s (in background); parse {timings.parse:.2f}s; "
+        f"generate {total - timings.parse - timings.stall:.2f}s; waiting for input {timings.stall:.2f}s")
+
+    if network.sqn_cache is not None:
+        cache = network.sqn_cache
+        logger.info(
+            f"SqN cache: {cache.hits} hits, {cache.misses} misses ({cache.hits / max(cache.hits + cache.misses, 1):.0%} hit rate)")
+
+    # Finalize
+    network.flush_write_batches()
+    if network.group_commit_rounds:
+        logger.info(
+            f"Group commit: {network.group_commit_writes} slice writes replicated in {network.group_commit_rounds} rounds")
+    if validate:
+        logger.info("Validating goal schedule")
+        report = network.validate()
+        for error in report.errors:
+            logger.error(error)
+        if not report.ok:
+            raise GoalValidationError(report.summary())
+    logger.info(f"Writing goal file to '{out_path}'")
+    network.to_goal(out_path)
+    if metadata_dest:
+        logger.info(f"Wrote op metadata to '{metadata_dest}'")
+    goal_bytes = os.path.getsize(out_path)
+    network_bytes = network.bytes_sent()
+    layout = f"EC {ec[0]}+{ec[1]}" if ec else f"{len(network.bss_resp[0])}x replication"
+    logger.info(
+        f"Network: {network_bytes / 1024**2:.2f}MB sent ({layout}); goal file: {goal_bytes / 1024**2:.2f}MB")
+
+    if coalescing is not None:
+        replication = len(network.bss_resp[0])
+        (before, after) = (coalescing.before, coalescing.after)
+        (msgs_before, msgs_after) = (coalescing.messages(before, replication),
+                                     coalescing.messages(after, replication))
+        logger.info(
+            f"Coalescing: {coalescing.requests(before)} -> {coalescing.requests(after)} ops; "
+            f"{coalescing.slice_requests(before)} -> {coalescing.slice_requests(after)} slice requests; "
+            f"~{msgs_before} -> ~{msgs_after} messages; "
+            f"~{goal_bytes * msgs_before // max(msgs_after, 1)} -> {goal_bytes} goal bytes")
+
+    return {
+        'rows': no_rows,
+        'hosts': host_count,
+        'ranks': topology.get_total_ranks(),
+        'generate_s': time.perf_counter() - conversion_start,
+        'goal_bytes': goal_bytes,
+        'network_bytes': network_bytes,
+    }
@@ -0,0 +1,278 @@
+import numpy as np
+from array import array
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .goal import GoalEvent, parse_goal, read_goal, \
+    NUM_RANKS, END, OP, REQUIRES, SEND, RECV, CALC
+
+KIND_SEND = 0
+KIND_RECV = 1
+KIND_CALC = 2
+KIND_CODES = {SEND: KIND_SEND, RECV: KIND_RECV}
+
+
+class LogGPParameters:
+    """ LogGP(O) parameters in ns (and ns per byte), the defaults match the
+    ones of LogGOPSim """
+    L: int = 2500
+    o: int = 1500
+    g: int = 1000
+    G: float = 6
+    O: float = 0
+
+    def __init__(self, *, L=None, o=None, g=None, G=None, O=None):
+        if L is not None:
+            self.L = L
+        if o is not None:
+            self.o = o
+        if g is not None:
+            self.g = g
+        if G is not None:
+            self.G = G
+        if O is not None:
+            self.O = O
+
+
+class Estimate:
+    """ Runtime bounds of a goal schedule. The lower bound is the longer of
+    the critical path (unlimited concurrency, no contention) and the busy
+    time of the busiest rank (no dependencies) """
+    no_ranks: int = 0
+    no_ops: int = 0
+    no_messages: int = 0
+    critical_path_ns: float = 0
+    # Ranks visited along the critical path (consecutive duplicates merged)
+    critical_ranks: List[int] = []
+    critical_ops: int = 0
+    # Per rank time spent in the CPU (overheads, calc) and the NIC (gaps, bytes)
+    cpu_busy_ns: np.ndarray
+    nic_busy_ns: np.ndarray
+    ops_per_rank: np.ndarray
+    unmatched_sends: int = 0
+    unmatched_recvs: int = 0
+    dangling_requires: int = 0
+    # Ops never ready due to unmatched receives or dependency cycles
+    blocked_ops: int = 0
+
+    @property
+    def busy_ns(self) -> np.ndarray:
+        return np.maximum(self.cpu_busy_ns, self.nic_busy_ns)
+
+    @property
+    def busiest_rank(self) -> int:
+        return int(np.argmax(self.busy_ns)) if self.no_ranks else -1
+
+    @property
+    def lower_bound_ns(self) -> float:
+        max_busy = float(self.busy_ns.max()) if self.no_ranks else 0
+        return max(self.critical_path_ns, max_busy)
+
+    @property
+    def deadlocked(self) -> bool:
+        return self.blocked_ops > 0
+
+
+class _Graph:
+    """ Ops of a goal schedule with their requires and message edges, held in
+    typed arrays (a few bytes per op instead of python objects) """
+
+    def __init__(self, keep_ids: bool = False):
+        self.no_ranks = 0
+        self.kinds = array('b')
+        # Tag of every message and label number of every calc ('c12' -> 12)
+        self.ids: Optional[array] = array('q') if keep_ids else None
+        self.sizes = array('q')
+        self.ranks = array('i')
+        self.edges_src = array('q')
+        self.edges_dst = array('q')
+        self.dangling_requires = 0
+        # (op, src, dst, tag) of every message, matched once all are added
+        self._messages = array('q')
+        self._partners: Optional[np.ndarray] = None
+
+    def add(self, events: Iterable[GoalEvent]):
+        for _ in self.record(events):
+            pass
+
+    def record(self, events: Iterable[GoalEvent]) -> Iterator[GoalEvent]:
+        """ Adds the events while passing them on, for single pass readers
+        also checking them on their own (e.g. the validator) """
+        self._partners = None
+        labels: Dict[str, int] = {}
+        requires: List[Tuple[str, str]] = []
+        for e in events:
+            (event, rank, label, kind, size, peer, tag) = e
+            if event == OP:
+                idx = len(self.kinds)
+                labels[label] = idx
+                self.kinds.append(KIND_CODES.get(kind, KIND_CALC))
+                self.sizes.append(size)
+                self.ranks.append(rank)
+                if self.ids is not None:
+                    self.ids.append(int(label[1:]) if kind == CALC else tag)
+                if kind == SEND:
+                    self._messages.extend((idx, rank, peer, tag))
+                elif kind == RECV:
+                    self._messages.extend((idx, peer, rank, tag))
+            elif event == REQUIRES:
+                if label in labels and peer in labels:
+                    self.edges_src.append(labels[peer])
+                    self.edges_dst.append(labels[label])
+                else:
+                    requires.append((label, peer))
+            elif event == END:
+                # Labels are only unique per rank, requires of labels defined
+                # later in the block are resolved at its end
+                for (label, dep) in requires:
+                    if label in labels and dep in labels:
+                        self.edges_src.append(labels[dep])
+                        self.edges_dst.append(labels[label])
+                    else:
+                        self.dangling_requires += 1
+                labels = {}
+                requires = []
+                self.no_ranks = max(self.no_ranks, rank + 1)
+            elif event == NUM_RANKS:
+                self.no_ranks = max(self.no_ranks, rank)
+            yield e
+
+    @property
+    def partners(self) -> np.ndarray:
+        """ Matched receive of every send and send of every receive, -1 for
+        calcs and unmatched messages """
+        if self._partners is None:
+            self._partners = self._match()
+        return self._partners
+
+    def _match(self) -> np.ndarray:
+        # Messages of the same (src, dst, tag) are matched in posting order:
+        # the i-th send with the i-th receive
+        partners = np.full(len(self.kinds), -1, dtype=np.int64)
+        messages = np.array(self._messages, dtype=np.int64).reshape(-1, 4)
+        (ops, src, dst, tag) = messages.T
+        is_send = np.array(self.kinds, dtype=np.int8)[ops] == KIND_SEND
+        # Sends before receives within every (src, dst, tag)
+        order = np.lexsort((ops, ~is_send, tag, dst, src))
+        (ops, src, dst, tag, is_send) = (a[order] for a in (ops, src, dst, tag, is_send))
+        first = np.ones(len(ops), dtype=bool)
+        first[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1]) | (tag[1:] != tag[:-1])
+        group = np.cumsum(first) - 1
+        starts = np.flatnonzero(first)
+        no_sends = np.bincount(group, weights=is_send, minlength=len(starts)).astype(np.int64)
+        no_recvs = np.diff(np.append(starts, len(ops))) - no_sends
+        pos = np.arange(len(ops))
+        matched = is_send & (pos - starts[group] < no_recvs[group])
+        sends = pos[matched]
+        recvs = sends + no_sends[group[matched]]
+        partners[ops[sends]] = ops[recvs]
+        partners[ops[recvs]] = ops[sends]
+        return partners
+
+
+def _estimate(graph: _Graph, params: LogGPParameters) -> Estimate:
+    n = len(graph.kinds)
+    result = Estimate()
+    result.no_ranks = graph.no_ranks
+    result.no_ops = n
+    result.dangling_requires = graph.dangling_requires
+
+    kinds = np.array(graph.kinds, dtype=np.int8)
+    partners = graph.partners
+    result.no_messages = int(((kinds == KIND_SEND) & (partners >= 0)).sum())
+    result.unmatched_sends = int(((kinds == KIND_SEND) & (partners < 0)).sum())
+    result.unmatched_recvs = int(((kinds == KIND_RECV) & (partners < 0)).sum())
+    sizes = np.array(graph.sizes, dtype=np.int64)
+    ranks = np.array(graph.ranks, dtype=np.int64)
+    is_msg = kinds != KIND_CALC
+    extra_bytes = np.maximum(sizes - 1, 0)
+
+    # Busy times only depend on the ops of a rank, not on their order
+    cpu = np.where(is_msg, params.o + extra_bytes * params.O, sizes)
+    nic = np.where(kinds == KIND_SEND, params.g + extra_bytes * params.G,
+                   np.where(kinds == KIND_RECV, extra_bytes * params.G, 0))
+    result.cpu_busy_ns = np.bincount(ranks, weights=cpu, minlength=graph.no_ranks)
+    result.nic_busy_ns = np.bincount(ranks, weights=nic, minlength=graph.no_ranks)
+    result.ops_per_rank = np.bincount(ranks, minlength=graph.no_ranks)
+
+    # Successors of every op in CSR layout
+    src = np.array(graph.edges_src, dtype=np.int64)
+    dst = np.array(graph.edges_dst, dtype=np.int64)
+    order = np.argsort(src, kind='stable')
+    succs = dst[order].tolist()
+    offsets = np.searchsorted(src[order], np.arange(n + 1)).tolist()
+
+    indegree = np.bincount(dst, minlength=n)
+    recvs = np.flatnonzero(kinds == KIND_RECV)
+    # Every receive waits for its send, unmatched receives wait forever
+    indegree[recvs] += 1
+    indegree = indegree.tolist()
+
+    cost = cpu.tolist()
+    flight = (params.o + params.L + extra_bytes * params.G).tolist()
+    kinds = kinds.tolist()
+    partner = partners.tolist()
+    ready = [0.0] * n
+    pred = [-1] * n
+    finish = [0.0] * n
+
+    queue = deque(i for i in range(n) if indegree[i] == 0)
+    processed = 0
+    while queue:
+        u = queue.popleft()
+        processed += 1
+        done = ready[u] + cost[u]
+        finish[u] = done
+        for v in succs[offsets[u]:offsets[u + 1]]:
+            if done > ready[v]:
+                ready[v] = done
+                pred[v] = u
+            indegree[v] -= 1
+            if indegree[v] == 0:
+                queue.append(v)
+        if kinds[u] == KIND_SEND and partner[u] != -1:
+            v = partner[u]
+            arrival = ready[u] + flight[u]
+            if arrival > ready[v]:
+                ready[v] = arrival
+                pred[v] = u
+            indegree[v] -= 1
+            if indegree[v] == 0:
+                queue.append(v)
+    result.blocked_ops = n - processed
+
+    if processed:
+        last = max(range(n), key=finish.__getitem__)
+        result.critical_path_ns = finish[last]
+        path_ranks = []
+        while last != -1:
+            result.critical_ops += 1
+            if not path_ranks or path_ranks[-1] != graph.ranks[last]:
+                path_ranks.append(graph.ranks[last])
+            last = pred[last]
+        result.critical_ranks = path_ranks[::-1]
+    return result
+
+
+def estimate_events(events: Iterable[GoalEvent],
+                    params: Optional[LogGPParameters] = None) -> Estimate:
+    graph = _Graph()
+    graph.add(events)
+    return _estimate(graph, params or LogGPParameters())
+
+
+def estimate_goal(path: str, params: Optional[LogGPParameters] = None) -> Estimate:
+    """ Estimates runtime bounds of a goal file in a single topological pass """
+    return estimate_events(read_goal(path), params)
+
+
+def estimate_network(network, params: Optional[LogGPParameters] = None) -> Estimate:
+    """ Estimates runtime bounds of a network, without writing its goal file """
+    network.flush_write_batches()
+    graph = _Graph()
+    for b in network.builders:
+        rank_res = b.serialize()
+        assert rank_res is not None, "unreachable"
+        graph.add(parse_goal(rank_res.splitlines()))
+        del rank_res
+    return _estimate(graph, params or LogGPParameters())
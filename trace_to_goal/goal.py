@@ -0,0 +1,101 @@
+import mmap
+import os
+from typing import Iterable, Iterator, Optional, Tuple
+
+# Goal files are read in chunks of this size
+CHUNK_SIZE = 16 * 1024 * 1024
+
+# Events yielded by the goal parser
+NUM_RANKS = 'num_ranks'
+RANK = 'rank'
+END = 'end'
+OP = 'op'
+REQUIRES = 'requires'
+
+SEND = 'send'
+RECV = 'recv'
+CALC = 'calc'
+
+# (event, rank, label, kind, size, peer, tag)
+#   num_ranks: rank holds the no of ranks
+#   rank / end: start and end of the block of `rank`
+#   op: `kind` is send, recv or calc, `size` the bytes (or calc time)
+#   requires: `label` requires `peer` (a label of the same rank)
+GoalEvent = Tuple[str, int, Optional[str], Optional[str], int, Optional[str | int], int]
+
+
+class GoalParseError(ValueError):
+    def __init__(self, line_no: int, line: str, reason: str):
+        super().__init__(f"Line {line_no}: {reason} ('{line.strip()}')")
+        self.line_no = line_no
+
+
+def _parse_op(parts, line: str, line_no: int, rank: int) -> GoalEvent:
+    label = parts[0].rstrip(':')
+    kind = parts[1]
+    try:
+        if kind == CALC:
+            return (OP, rank, label, CALC, int(parts[2]), None, 0)
+        if kind in (SEND, RECV):
+            size = int(parts[2].rstrip('b'))
+            peer = int(parts[4])
+            tag = 0
+            if 'tag' in parts:
+                tag = int(parts[parts.index('tag') + 1])
+            return (OP, rank, label, kind, size, peer, tag)
+    except (IndexError, ValueError):
+        raise GoalParseError(line_no, line, f"Malformed {kind}")
+    raise GoalParseError(line_no, line, f"Unknown operation '{kind}'")
+
+
+def parse_goal(lines: Iterable[str]) -> Iterator[GoalEvent]:
+    """ Parses the lines of a goal file into a stream of events. Comments and
+    empty lines are skipped, missing tags are reported as tag 0 """
+    rank = -1
+    for (line_no, line) in enumerate(lines, start=1):
+        parts = line.split()
+        if not parts or parts[0].startswith('//'):
+            continue
+
+        head = parts[0]
+        if head == '}':
+            yield (END, rank, None, None, 0, None, 0)
+            rank = -1
+        elif head == 'rank':
+            if rank != -1:
+                raise GoalParseError(line_no, line, "Nested rank block")
+            rank = int(parts[1])
+            yield (RANK, rank, None, None, 0, None, 0)
+        elif head == 'num_ranks':
+            yield (NUM_RANKS, int(parts[1]), None, None, 0, None, 0)
+        elif rank == -1:
+            raise GoalParseError(line_no, line, "Statement outside of a rank block")
+        elif len(parts) == 3 and parts[1] in ('requires', 'irequires'):
+            yield (REQUIRES, rank, parts[0], None, 0, parts[2], 0)
+        else:
+            yield _parse_op(parts, line, line_no, rank)
+
+
+def iter_goal_lines(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """ Streams the lines of a (multi GB) goal file from a read only mmap in
+    chunks ending at a line break, so memory use does not grow with the file """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            if hasattr(m, 'madvise'):
+                m.madvise(mmap.MADV_SEQUENTIAL)
+            start = 0
+            while start < size:
+                end = min(start + chunk_size, size)
+                if end < size:
+                    cut = m.rfind(b'\n', start, end)
+                    # Lines longer than a chunk extend it to their end
+                    end = cut + 1 if cut != -1 else m.find(b'\n', end) + 1 or size
+                yield from m[start:end].decode().splitlines()
+                start = end
+
+
+def read_goal(path: str) -> Iterator[GoalEvent]:
+    return parse_goal(iter_goal_lines(path))
@@ -0,0 +1,147 @@
+import csv
+import json
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from .goal import GoalEvent, NUM_RANKS, RANK, END, OP, REQUIRES, SEND, RECV, CALC
+
+RANK_COLUMNS = ['rank', 'name', 'ops', 'sends', 'recvs', 'calcs', 'bytes_sent',
+                'bytes_received', 'calc_time', 'requires', 'max_fan_in', 'max_fan_out']
+LINK_COLUMNS = ['src', 'dst', 'messages', 'bytes']
+# Rank name map entries: the name, or name, rack and pod of racked topologies
+RankEntry = Union[str, Dict]
+
+
+class GoalStats:
+    """ Aggregates of a goal file per rank and per link (rank pair). Only
+    the labels of the current rank are held in memory """
+    no_ranks: int = 0
+    ranks: Dict[int, Dict[str, int]]
+    # (src, dst) -> [no of messages, bytes]
+    links: Dict[Tuple[int, int], List[int]]
+    rank_names: Dict[int, str]
+    # Rank -> rack, cross rack traffic is only counted if known
+    rank_racks: Optional[Dict[int, int]] = None
+    cross_rack_messages: int = 0
+    cross_rack_bytes: int = 0
+
+    def __init__(self, rank_names: Optional[Dict[int, str]] = None,
+                 rank_racks: Optional[Dict[int, int]] = None):
+        self.ranks = {}
+        self.links = {}
+        self.rank_names = rank_names or {}
+        self.rank_racks = rank_racks or None
+        self.cross_rack_messages = 0
+        self.cross_rack_bytes = 0
+
+    def add(self, events: Iterable[GoalEvent]):
+        stats = None
+        fan_in: Counter = Counter()
+        fan_out: Counter = Counter()
+        for (event, rank, label, kind, size, peer, tag) in events:
+            if event == OP:
+                stats['ops'] += 1
+                if kind == SEND:
+                    stats['sends'] += 1
+                    stats['bytes_sent'] += size
+                    link = self.links.setdefault((rank, peer), [0, 0])
+                    link[0] += 1
+                    link[1] += size
+                    racks = self.rank_racks
+                    if racks is not None and racks.get(rank) != racks.get(peer):
+                        self.cross_rack_messages += 1
+                        self.cross_rack_bytes += size
+                elif kind == RECV:
+                    stats['recvs'] += 1
+                    stats['bytes_received'] += size
+                elif kind == CALC:
+                    stats['calcs'] += 1
+                    stats['calc_time'] += size
+            elif event == REQUIRES:
+                stats['requires'] += 1
+                fan_in[label] += 1
+                fan_out[peer] += 1
+            elif event == RANK:
+                stats = self.ranks.setdefault(
+                    rank, {c: 0 for c in RANK_COLUMNS[2:]})
+            elif event == END:
+                stats['max_fan_in'] = max(
+                    stats['max_fan_in'], max(fan_in.values(), default=0))
+                stats['max_fan_out'] = max(
+                    stats['max_fan_out'], max(fan_out.values(), default=0))
+                fan_in.clear()
+                fan_out.clear()
+                self.no_ranks = max(self.no_ranks, rank + 1)
+            elif event == NUM_RANKS:
+                self.no_ranks = max(self.no_ranks, rank)
+
+    def totals(self) -> Dict[str, int]:
+        totals = {c: sum(s[c] for s in self.ranks.values())
+                  for c in RANK_COLUMNS[2:] if not c.startswith('max_')}
+        totals['ranks'] = self.no_ranks
+        totals['links'] = len(self.links)
+        if self.rank_racks is not None:
+            totals['cross_rack_messages'] = self.cross_rack_messages
+            totals['cross_rack_bytes'] = self.cross_rack_bytes
+        return totals
+
+    def rank_rows(self) -> List[Dict]:
+        return [
+            {'rank': r, 'name': self.rank_names.get(r, '')} | s
+            for (r, s) in sorted(self.ranks.items())
+        ]
+
+    def link_rows(self) -> List[Dict]:
+        return [
+            {'src': src, 'dst': dst, 'messages': m, 'bytes': b}
+            for ((src, dst), (m, b)) in sorted(self.links.items())
+        ]
+
+    def top_ranks(self, key: str, count: int) -> List[Dict]:
+        return sorted(self.rank_rows(), key=lambda r: r[key], reverse=True)[:count]
+
+    def top_links(self, count: int) -> List[Dict]:
+        return sorted(self.link_rows(), key=lambda r: r['bytes'], reverse=True)[:count]
+
+    def to_json(self, dest: str):
+        value = {
+            'totals': self.totals(),
+            'ranks': self.rank_rows(),
+            'links': self.link_rows(),
+        }
+        with open(dest, 'w+') as f:
+            f.writelines(json.dumps(value))
+
+    def to_csv(self, ranks_dest: Optional[str] = None, links_dest: Optional[str] = None):
+        for (dest, columns, rows) in [(ranks_dest, RANK_COLUMNS, self.rank_rows()),
+                                      (links_dest, LINK_COLUMNS, self.link_rows())]:
+            if not dest:
+                continue
+            with open(dest, 'w+', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=columns)
+                writer.writeheader()
+                writer.writerows(rows)
+
+
+def format_table(rows: List[Dict], columns: List[str]) -> str:
+    table = [columns] + [[str(r[c]) for c in columns] for r in rows]
+    widths = [max(len(r[i]) for r in table) for i in range(len(columns))]
+    return '\n'.join(
+        '  '.join(v.ljust(w) for (v, w) in zip(r, widths)) for r in table)
+
+
+def load_rank_map(path: str) -> Dict[int, RankEntry]:
+    """ Reads a rank name map as written by NetworkTopology.to_file """
+    with open(path, 'r') as f:
+        return {int(k): v for (k, v) in json.load(f).items()}
+
+
+def rank_names_of(rank_map: Dict[int, RankEntry]) -> Dict[int, str]:
+    return {rank: v['name'] if isinstance(v, dict) else v
+            for (rank, v) in rank_map.items()}
+
+
+def rank_racks_of(rank_map: Dict[int, RankEntry]) -> Dict[int, int]:
+    """ Rack of every rank, empty if the topology has no racks """
+    return {rank: v['rack'] for (rank, v) in rank_map.items()
+            if isinstance(v, dict) and 'rack' in v}
@@ -1,4 +1,4 @@
-from typing import List, Tuple, Literal
+from typing import List, Optional, Set, Tuple, Literal
 from math import ceil
 
 from .common import Addr, SliceId, SliceMap
@@ -6,6 +6,9 @@ from .common import Addr, SliceId, SliceMap
 # Request Config
 LOOKUP_REQ_SIZE: int = 256 * 4
 LOOKUP_RESP_SIZE: int = 1024 * 4
+# Additional size per slice of batched SqN lookups
+LOOKUP_REQ_ENTRY_SIZE: int = 64
+LOOKUP_RESP_ENTRY_SIZE: int = 256
 MOUNT_REQ_SIZE: int = 1024 * 4
 MOUNT_RESP_SIZE: int = 1024 * 4
 
@@ -78,35 +81,29 @@ def inject_mount(network: 'DirectDriveNetwork', host_id: int):
 
 
 def resolve_to_slices_and_sizes(slice_map: SliceMap, data_start: int, data_end: int) -> List[Tuple[SliceId, int]]:
-    # By doing this manually we can terminate early by only looking once at the data
-    results = []
-    for (sid, (start, end)) in enumerate(slice_map):
-        if end < data_start:
-            continue
-        if data_end < start:
-            break
-        dist = min(end, data_end) - min(start, data_start)
-        results.append((sid, dist))
-
-    return results
-
-
-def inject_read(network: 'DirectDriveNetwork', host_id: int, start: Addr, length: int, depends_on=[]):
-    get_new_tag = network.get_next_tag
+    # Slice maps are made of equally sized slices, so the slices touching the
+    # range are computed instead of scanning the map (slices ending at
+    # data_start or starting at data_end count as touching)
+    if not slice_map:
+        return []
+    slice_size = slice_map[0][1] - slice_map[0][0]
+    first = max(-(-data_start // slice_size) - 1, 0)
+    last = min(data_end // slice_size, len(slice_map) - 1)
+    return [
+        (sid, min((sid + 1) * slice_size, data_end) - min(sid * slice_size, data_start))
+        for sid in range(first, last + 1)
+    ]
+
+
+def inject_read(network: 'DirectDriveNetwork', host_id: int, start: Addr, length: int, depends_on=[],
+                slices: Optional[List[Tuple[SliceId, int]]] = None):
     get_builder = network.get_builder
 
-    slice_ids = resolve_to_slices_and_sizes(
+    slice_ids = slices if slices is not None else resolve_to_slices_and_sizes(
         network.slice_map, start, start+length)
 
     host_rank = network.topology.get_host(host_id)
     host_builder = get_builder(host_rank)
-    bss_builders = {
-        id: [
-            get_builder(network.topology.get_bss(bss_id))
-            for bss_id in network.bss_resp[network.slice_resp[id]]
-        ]
-        for (id, _) in slice_ids
-    }
     ccs_builders = {
         id: get_builder(network.topology.get_ccs(network.slice_resp[id]))
         for (id, _) in slice_ids
@@ -114,97 +111,242 @@ def inject_read(network: 'DirectDriveNetwork', host_id: int, start: Addr, length
 
     result_lbls = []
 
-    # for (id, _) in slice_ids:
+    # Slices with a SqN in the host's cache skip Part A
+    sqn_cache = network.sqn_cache
+    cached = set()
+    if sqn_cache is not None:
+        cached = {id for (id, _) in slice_ids if sqn_cache.lookup(host_id, id)}
+
+    # Part A (batched): Request the SqNs of all slices of a CCS at once
+    sqn_lbls = {}
+    if network.batch_lookups:
+        slices_per_ccs = {}
+        for (id, _) in slice_ids:
+            if id not in cached:
+                slices_per_ccs.setdefault(ccs_builders[id].rank_id, []).append(id)
+        for ids in slices_per_ccs.values():
+            (lbl_host_req_sqn, lbl_host_resp_sqn) = request_sqns(
+                network, host_builder, ccs_builders[ids[0]], len(ids))
+            for d in depends_on:
+                host_builder.require_dependency(lbl_host_req_sqn, d)
+            for id in ids:
+                sqn_lbls[id] = lbl_host_resp_sqn
+
+    metadata = network.metadata
     for (id, size) in slice_ids:
+        if metadata is not None:
+            metadata.set_slice(id)
         # Part A: Request all SqNs (Assumption)
-        ccs_builder = ccs_builders.get(id)
-        assert ccs_builder, f"CCS builder for slice {id} missing"
-        ccs_rank = ccs_builder.rank_id
+        if id in cached:
+            lbl_host_resp_sqn = None
+        elif not network.batch_lookups:
+            ccs_builder = ccs_builders.get(id)
+            assert ccs_builder, f"CCS builder for slice {id} missing"
+            (lbl_host_req_sqn, lbl_host_resp_sqn) = request_sqns(
+                network, host_builder, ccs_builder, 1)
+        else:
+            lbl_host_resp_sqn = sqn_lbls[id]
+
+        # Part B: Read all slice data, from one replica or k fragments
+        replicas = network.bss_resp[network.slice_resp[id]]
+        if network.erasure_coding is None:
+            sources = [network.get_next_replica(id, replicas, host=host_id)]
+        else:
+            sources = network.get_read_fragments(id, replicas, host=host_id)
+        part_size = network.get_fragment_size(size)
+        lbls_host_req_slice = []
+        for replica in sources:
+            (lbl_host_req_slice, lbl_host_resp_slice) = read_from_bss(
+                network, host_builder, replicas[replica], part_size)
+            if lbl_host_resp_sqn:
+                host_builder.require_dependency(lbl_host_req_slice, lbl_host_resp_sqn)
+            lbls_host_req_slice.append(lbl_host_req_slice)
+            result_lbls.append(lbl_host_resp_slice)
+
+        if id in cached:
+            for lbl_host_req_slice in lbls_host_req_slice:
+                for d in depends_on:
+                    host_builder.require_dependency(lbl_host_req_slice, d)
+        elif not network.batch_lookups:
+            for d in depends_on:
+                host_builder.require_dependency(lbl_host_req_sqn, d)
+
+    if sqn_cache is not None:
+        for (id, _) in slice_ids:
+            sqn_cache.insert(host_id, id)
 
-        sqn_tag = get_new_tag()
-        # Step 1: Host(VDC) -> CCS: Request SqN
-        lbl_host_req_sqn = host_builder.add_send(
-            LOOKUP_REQ_SIZE, ccs_rank, sqn_tag)
-        lbl_ccs_req_sqn = ccs_builder.add_recv(
-            LOOKUP_REQ_SIZE, host_rank, sqn_tag)
+    return result_lbls
 
-        # Step 2: Lookup Sqn
-        lbl_ccs_lookup = ccs_builder.add_calc(
-                calc_io_time(LOOKUP_RESP_SIZE, 'read'))
 
-        # Step 3: CCS -> Host(VDC): Send Sqn
-        lbl_ccs_resp_sqn = ccs_builder.add_send(
-            LOOKUP_RESP_SIZE, host_rank, sqn_tag)
-        lbl_host_resp_sqn = host_builder.add_recv(
-            LOOKUP_RESP_SIZE, ccs_rank, sqn_tag)
+def read_from_bss(network: 'DirectDriveNetwork', host_builder, bss_id: int,
+                  size: int) -> Tuple[str, str]:
+    """ Host -> BSS -> Host round trip reading size bytes. Returns the labels
+    of the host request and response """
+    get_new_tag = network.get_next_tag
+    host_rank = host_builder.rank_id
+    network.add_bss_load(bss_id, size)
+    bss_builder = network.get_builder(network.topology.get_bss(bss_id))
+    bss_rank = bss_builder.rank_id
+
+    recv_tag = get_new_tag()
+    # Step 1: Host(VDC) -> BSS: Request slice data
+    lbl_host_req_slice = host_builder.add_send(
+        LOOKUP_REQ_SIZE, bss_rank, recv_tag)
+    lbl_bss_req_slice = bss_builder.add_recv(
+        LOOKUP_REQ_SIZE, host_rank, recv_tag)
+
+    # Step 2: Lookup Slice data
+    lbl_bss_read = bss_builder.add_calc(calc_io_time(size, 'read'))
+
+    # Step 3: BSS -> Host(VDC): Send slice data
+    lbl_bss_resp_slice = bss_builder.add_send(
+        size, host_rank, recv_tag)
+    lbl_host_resp_slice = host_builder.add_recv(
+        size, bss_rank, recv_tag)
 
-        # Step 1-3: Dependencies
-        host_builder.require_dependency(
-            lbl_host_resp_sqn, lbl_host_req_sqn)
-        ccs_builder.require_dependency(lbl_ccs_resp_sqn, lbl_ccs_lookup)
-        ccs_builder.require_dependency(lbl_ccs_lookup, lbl_ccs_req_sqn)
-
-        # Part B: Read all slice data
-        resp_bss_builders = bss_builders.get(id)
-        assert resp_bss_builders, f"BSS builders for slice {id} missing"
-        bss_builder = resp_bss_builders[network.get_next_bss(
-            id) % len(resp_bss_builders)]
+    # Dependencies
+    # bss_builder.require_dependency(lbl_bss_resp_slice, lbl_bss_req_slice)
+    bss_builder.require_dependency(lbl_bss_read, lbl_bss_req_slice)
+    bss_builder.require_dependency(lbl_bss_resp_slice, lbl_bss_read)
+
+    return (lbl_host_req_slice, lbl_host_resp_slice)
+
+
+def request_sqns(network: 'DirectDriveNetwork', host_builder, ccs_builder,
+                 no_slices: int) -> Tuple[str, str]:
+    """ Host -> CCS -> Host round trip looking up the SqNs of no_slices
+    slices. Returns the labels of the host request and response """
+    host_rank = host_builder.rank_id
+    ccs_rank = ccs_builder.rank_id
+    req_size = LOOKUP_REQ_SIZE + (no_slices - 1) * LOOKUP_REQ_ENTRY_SIZE
+    resp_size = LOOKUP_RESP_SIZE + (no_slices - 1) * LOOKUP_RESP_ENTRY_SIZE
+
+    sqn_tag = network.get_next_tag()
+    # Step 1: Host(VDC) -> CCS: Request SqN
+    lbl_host_req_sqn = host_builder.add_send(
+        req_size, ccs_rank, sqn_tag)
+    lbl_ccs_req_sqn = ccs_builder.add_recv(
+        req_size, host_rank, sqn_tag)
+
+    # Step 2: Lookup Sqn
+    lbl_ccs_lookup = ccs_builder.add_calc(
+            calc_io_time(resp_size, 'read'))
+
+    # Step 3: CCS -> Host(VDC): Send Sqn
+    lbl_ccs_resp_sqn = ccs_builder.add_send(
+        resp_size, host_rank, sqn_tag)
+    lbl_host_resp_sqn = host_builder.add_recv(
+        resp_size, ccs_rank, sqn_tag)
+
+    # Step 1-3: Dependencies
+    host_builder.require_dependency(
+        lbl_host_resp_sqn, lbl_host_req_sqn)
+    ccs_builder.require_dependency(lbl_ccs_resp_sqn, lbl_ccs_lookup)
+    ccs_builder.require_dependency(lbl_ccs_lookup, lbl_ccs_req_sqn)
+
+    return (lbl_host_req_sqn, lbl_host_resp_sqn)
+
+
+class WriteBatch:
+    """ Slice writes a CCS stored, but did not replicate yet (group commit) """
+    ccs_id: int
+    size: int = 0
+    # CCS store labels, the replication waits for all of them
+    store_lbls: List[str]
+    # (host rank, tag) of the acks to send once the batch is replicated
+    acks: List[Tuple[int, int]]
+    hosts: Set[int]
+
+    def __init__(self, ccs_id: int):
+        self.ccs_id = ccs_id
+        self.store_lbls = []
+        self.acks = []
+        self.hosts = set()
+
+
+def replicate(network: 'DirectDriveNetwork', ccs_id: int, size: int, store_lbls: List[str]) -> List[str]:
+    """ Replicates data stored on a CCS to all its BSS (or sends each of
+    them one erasure coded fragment), returns the CCS labels of the acks of
+    the write quorum """
+    get_new_tag = network.get_next_tag
+    get_builder = network.get_builder
+    size = network.get_fragment_size(size)
+
+    ccs_builder = get_builder(network.topology.get_ccs(ccs_id))
+    ccs_rank = ccs_builder.rank_id
+    replicas = network.bss_resp[ccs_id]
+    quorum = network.get_write_quorum(replicas, ccs_id)
+    sqn_promise_lbls = []
+    for (i, bss_id) in enumerate(replicas):
+        bss_builder = get_builder(network.topology.get_bss(bss_id))
         bss_rank = bss_builder.rank_id
+        network.add_bss_load(bss_id, size)
+        repl_tag = get_new_tag()
+        # Step 3a: Send data from CCS to BSS
+        lbl_ccs_replicate = ccs_builder.add_send(
+            size, bss_rank, repl_tag)
+        lbl_bss_replicate = bss_builder.add_recv(
+            size, ccs_rank, repl_tag)
 
-        recv_tag = get_new_tag()
-        # Step 1: Host(VDC) -> BSS: Request slice data
-        lbl_host_req_slice = host_builder.add_send(
-            LOOKUP_REQ_SIZE, bss_rank, recv_tag)
-        lbl_bss_req_slice = bss_builder.add_recv(
-            LOOKUP_REQ_SIZE, host_rank, recv_tag)
-
-        # Step 2: Lookup Slice data
-        lbl_bss_read = bss_builder.add_calc(calc_io_time(size, 'read'))
+        # Step 3b: BSS writes data
+        lbl_bss_store = bss_builder.add_calc(calc_io_time(size, 'write'))
 
-        # Step 3: BSS -> Host(VDC): Send slice data
-        lbl_bss_resp_slice = bss_builder.add_send(
-            size, host_rank, recv_tag)
-        lbl_host_resp_slice = host_builder.add_recv(
-            size, bss_rank, recv_tag)
-        # We don't need this later on
+        sqn_tag = get_new_tag()
+        # Step 3c: BSS responds with SqN to CCS
+        lbl_bss_sqn = bss_builder.add_send(
+            LOOKUP_REQ_SIZE, ccs_rank, sqn_tag)
+        lbl_ccs_sqn = ccs_builder.add_recv(
+            LOOKUP_REQ_SIZE, bss_rank, sqn_tag)
 
         # Dependencies
-        host_builder.require_dependency(lbl_host_req_slice, lbl_host_resp_sqn)
-        # bss_builder.require_dependency(lbl_bss_resp_slice, lbl_bss_req_slice)
-        bss_builder.require_dependency(lbl_bss_read, lbl_bss_req_slice)
-        bss_builder.require_dependency(lbl_bss_resp_slice, lbl_bss_read)
-
-        for d in depends_on:
-            host_builder.require_dependency(lbl_host_req_sqn, d)
+        bss_builder.require_dependency(lbl_bss_sqn, lbl_bss_store)
+        bss_builder.require_dependency(
+            lbl_bss_store, lbl_bss_replicate)
+        for lbl_ccs_store in store_lbls:
+            ccs_builder.require_dependency(
+                lbl_ccs_replicate, lbl_ccs_store)
+        ccs_builder.require_dependency(lbl_ccs_sqn, lbl_ccs_replicate)
+        if i in quorum:
+            sqn_promise_lbls.append(lbl_ccs_sqn)
+    return sqn_promise_lbls
 
-        result_lbls.append(lbl_host_resp_slice)
 
-    return result_lbls
+def flush_write_batch(network: 'DirectDriveNetwork', batch: WriteBatch):
+    """ One replication round for all writes of the batch, every write is
+    acknowledged once the (aggregated) data reached the write quorum """
+    ccs_builder = network.get_builder(network.topology.get_ccs(batch.ccs_id))
+    sqn_promise_lbls = replicate(network, batch.ccs_id, batch.size, batch.store_lbls)
+    for (host_rank, host_sqn_tag) in batch.acks:
+        lbl_ccs_sqn_resp = ccs_builder.add_send(
+            LOOKUP_RESP_SIZE, host_rank, host_sqn_tag)
+        for lbl_ccs_sqn in sqn_promise_lbls:
+            ccs_builder.require_dependency(lbl_ccs_sqn_resp, lbl_ccs_sqn)
 
 
-def inject_write(network: 'DirectDriveNetwork', host_id: int, start: Addr, length: int, depends_on=[]):
+def inject_write(network: 'DirectDriveNetwork', host_id: int, start: Addr, length: int, depends_on=[],
+                 slices: Optional[List[Tuple[SliceId, int]]] = None):
     get_new_tag = network.get_next_tag
     get_builder = network.get_builder
 
-    slice_ids = resolve_to_slices_and_sizes(
+    slice_ids = slices if slices is not None else resolve_to_slices_and_sizes(
         network.slice_map, start, start + length)
 
     host_rank = network.topology.get_host(host_id)
     host_builder = get_builder(host_rank)
-    bss_builders = {
-        id: [
-            get_builder(network.topology.get_bss(bss_id))
-            for bss_id in network.bss_resp[network.slice_resp[id]]
-        ]
-        for (id, _) in slice_ids
-    }
     ccs_builders = {
         id: get_builder(network.topology.get_ccs(network.slice_resp[id]))
         for (id, _) in slice_ids
     }
+    if network.group_commit and network.queue_depth and not network.open_loop:
+        # Batches holding earlier writes of the host may be what this write
+        # depends on, they have to be replicated before it can join one
+        network.flush_write_batches(host_id)
 
     result_lbls = []
+    metadata = network.metadata
     for (id, size) in slice_ids:
+        if metadata is not None:
+            metadata.set_slice(id)
         ccs_builder = ccs_builders.get(id)
         assert ccs_builder, f"CCS builder for slice {id} missing"
         ccs_rank = ccs_builder.rank_id
@@ -220,52 +362,34 @@ def inject_write(network: 'DirectDriveNetwork', host_id: int, start: Addr, lengt
         lbl_ccs_store = ccs_builder.add_calc(calc_io_time(size, 'write'))
         ccs_builder.require_dependency(lbl_ccs_store, lbl_ccs_req_sqn)
 
-        # Step 3: CCS -> all(BSS): Replicate data
-        resp_bss_builders = bss_builders.get(id)
-        assert resp_bss_builders, f"BSS builders for slice {id} missing"
-
-        sqn_promise_lbls = []
-        for bss_builder in resp_bss_builders:
-            bss_rank = bss_builder.rank_id
-            repl_tag = get_new_tag()
-            # Step 3a: Send data from CCS to BSS
-            lbl_ccs_replicate = ccs_builder.add_send(
-                size, bss_rank, repl_tag)
-            lbl_bss_replicate = bss_builder.add_recv(
-                size, ccs_rank, repl_tag)
-
-            # Step 3b: BSS writes data
-            lbl_bss_store = bss_builder.add_calc(calc_io_time(size, 'write'))
-
-            sqn_tag = get_new_tag()
-            # Step 3c: BSS responds with SqN to CCS
-            lbl_bss_sqn = bss_builder.add_send(
-                LOOKUP_REQ_SIZE, ccs_rank, sqn_tag)
-            lbl_ccs_sqn = ccs_builder.add_recv(
-                LOOKUP_REQ_SIZE, bss_rank, sqn_tag)
-
-            # Dependencies
-            bss_builder.require_dependency(lbl_bss_sqn, lbl_bss_store)
-            bss_builder.require_dependency(
-                lbl_bss_store, lbl_bss_replicate)
-            ccs_builder.require_dependency(
-                lbl_ccs_replicate, lbl_ccs_store)
-            ccs_builder.require_dependency(lbl_ccs_sqn, lbl_ccs_replicate)
-            sqn_promise_lbls.append(lbl_ccs_sqn)
-
-        # Step 4: CCS -> Host: Reply with sqn
-        host_sqn_tag = get_new_tag()
-        lbl_ccs_sqn_resp = ccs_builder.add_send(
-            LOOKUP_RESP_SIZE, host_rank, host_sqn_tag)
-        lbl_host_sqn_resp = host_builder.add_recv(
-            LOOKUP_RESP_SIZE, ccs_rank, host_sqn_tag)
+        if network.group_commit:
+            # Step 3 and the CCS side of step 4 happen once the batch is full
+            host_sqn_tag = get_new_tag()
+            lbl_host_sqn_resp = host_builder.add_recv(
+                LOOKUP_RESP_SIZE, ccs_rank, host_sqn_tag)
+            network.add_to_write_batch(
+                network.slice_resp[id], host_id, size, lbl_ccs_store, (host_rank, host_sqn_tag))
+        else:
+            # Step 3: CCS -> all(BSS): Replicate data
+            sqn_promise_lbls = replicate(
+                network, network.slice_resp[id], size, [lbl_ccs_store])
+
+            # Step 4: CCS -> Host: Reply with sqn
+            host_sqn_tag = get_new_tag()
+            lbl_ccs_sqn_resp = ccs_builder.add_send(
+                LOOKUP_RESP_SIZE, host_rank, host_sqn_tag)
+            lbl_host_sqn_resp = host_builder.add_recv(
+                LOOKUP_RESP_SIZE, ccs_rank, host_sqn_tag)
+
+            # Quorum check before sending back the promise, the replicas outside
+            # of the quorum complete in the background
+            for lbl_ccs_sqn in sqn_promise_lbls:
+                ccs_builder.require_dependency(lbl_ccs_sqn_resp, lbl_ccs_sqn)
 
         result_lbls.append(lbl_host_sqn_resp)
-
-        # TODO pjordan: Figure out how to support quorums beside N=M
-        # Quorum check before sending back the promise
-        for lbl_ccs_sqn in sqn_promise_lbls:
-            ccs_builder.require_dependency(lbl_ccs_sqn_resp, lbl_ccs_sqn)
+        # The writer learns the new SqN, all other cached copies are stale
+        if network.sqn_cache is not None:
+            network.sqn_cache.invalidate(host_id, id)
 
         host_builder.require_dependency(
             lbl_host_sqn_resp, lbl_host_req_sqn)
@@ -0,0 +1,184 @@
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# Binary metadata sidecar of a goal file, same layout as columnar traces:
+#   magic | u64 header length | json header | 64B aligned column arrays
+METADATA_MAGIC = b'T2GMET01'
+METADATA_ALIGNMENT = 64
+# Contexts are spilled to disk in chunks of this size
+METADATA_CHUNK_CONTEXTS = 1 << 16
+
+# Labels ('s123' -> 123) and tags are numbered globally in the order the ops
+# are created, so the ops of an operation form runs of both. The sidecar
+# holds one context per run instead of one record per op:
+#   first_label, first_tag: first label and tag numbers of the run
+#   row: operation the ops were generated for, its row in the trace file
+#       (the first one of coalesced requests, selection does not renumber
+#       them) or index of the workload op, -1 for ops shared by several
+#       operations (e.g. group commits)
+#   host, op, slice: host, operation kind and slice of the operation
+CONTEXT_DTYPE = np.dtype([
+    ('first_label', '<u8'),
+    ('first_tag', '<u8'),
+    ('row', '<i8'),
+    ('host', '<i4'),
+    ('op', 'u1'),
+    ('slice', '<i8'),
+])
+OP_KINDS = ['read', 'write', 'mount']
+OP_CODES = {'r': 0, 'w': 1, 'mount': 2}
+
+Context = Tuple[int, int, int, int]
+
+
+def _align(offset: int) -> int:
+    return -(-offset // METADATA_ALIGNMENT) * METADATA_ALIGNMENT
+
+
+class MetadataWriter:
+    """ Streams the operation contexts of a network's goal ops to a sidecar
+    file. The network sets the context before generating the ops of an
+    operation (or slice), so nothing is recorded per op """
+    dest: str
+    # Label and tag counters of the network
+    counters: Dict[str, int]
+    no_contexts: int = 0
+    # (first label, first tag, row, host, op, slice) not yet spilled
+    _contexts: List[Tuple[int, int, int, int, int, int]]
+
+    def __init__(self, dest: str, counters: Dict[str, int]):
+        self.dest = dest
+        self.counters = counters
+        self._contexts = [(0, 0, -1, -1, 0, -1)]
+        parent = Path(dest).parent.absolute()
+        os.makedirs(parent, exist_ok=True)
+        self._spill_dir = tempfile.TemporaryDirectory(dir=parent)
+        self._spill_files = {
+            name: open(Path(self._spill_dir.name) / name, 'wb')
+            for name in CONTEXT_DTYPE.names
+        }
+
+    @property
+    def context(self) -> Context:
+        """ (row, host, op, slice) of the ops generated next """
+        return self._contexts[-1][2:]
+
+    @context.setter
+    def context(self, context: Context):
+        self._set_context(*context)
+
+    def _set_context(self, row: int, host: int, op: int, slice: int):
+        first_label = self.counters.get('label', 0)
+        first_tag = self.counters.get('tag', 0)
+        contexts = self._contexts
+        if contexts[-1][:2] == (first_label, first_tag):
+            # The previous context has neither ops nor tags
+            contexts[-1] = (first_label, first_tag, row, host, op, slice)
+            return
+        contexts.append((first_label, first_tag, row, host, op, slice))
+        if len(contexts) > METADATA_CHUNK_CONTEXTS:
+            self._spill(keep_last=True)
+
+    def set_op(self, row: int, host: int, op_code: str):
+        self._set_context(row, host, OP_CODES[op_code.lower()], -1)
+
+    def set_slice(self, slice: int):
+        (row, host, op, _) = self.context
+        self._set_context(row, host, op, slice)
+
+    def _spill(self, keep_last: bool = False):
+        # The last context may still be replaced while it has no ops
+        spilled = self._contexts[:-1] if keep_last else self._contexts
+        contexts = np.array(spilled, dtype=np.int64).reshape(-1, len(CONTEXT_DTYPE.names))
+        for (name, column) in zip(CONTEXT_DTYPE.names, contexts.T):
+            self._spill_files[name].write(column.astype(CONTEXT_DTYPE[name]).tobytes())
+        self.no_contexts += len(spilled)
+        self._contexts = self._contexts[-1:] if keep_last else []
+
+    def close(self, rank_kinds: List[int], kind_names: List[str]):
+        """ Writes the sidecar, rank_kinds holds the index into kind_names
+        (e.g. 'host', 'ccs') of every rank """
+        self._spill()
+        for f in self._spill_files.values():
+            f.close()
+
+        arrays = [(name, CONTEXT_DTYPE[name], self.no_contexts) for name in CONTEXT_DTYPE.names]
+        arrays.append(('rank_kind', np.dtype('u1'), len(rank_kinds)))
+        header = {
+            'contexts': self.no_contexts, 'labels': self.counters.get('label', 0),
+            'tags': self.counters.get('tag', 0), 'ops': OP_KINDS,
+            'rank_kinds': kind_names, 'columns': {},
+        }
+        header_size = 4096
+        while True:
+            offset = _align(len(METADATA_MAGIC) + 8 + header_size)
+            for (name, dtype, rows) in arrays:
+                header['columns'][name] = {'dtype': dtype.str, 'offset': offset, 'rows': rows}
+                offset = _align(offset + rows * dtype.itemsize)
+            header_bytes = json.dumps(header).encode()
+            if len(header_bytes) <= header_size:
+                break
+            header_size *= 2
+        header_bytes = header_bytes.ljust(header_size)
+
+        with open(self.dest, 'wb') as out:
+            out.write(METADATA_MAGIC)
+            out.write(len(header_bytes).to_bytes(8, 'little'))
+            out.write(header_bytes)
+            for name in CONTEXT_DTYPE.names:
+                out.seek(header['columns'][name]['offset'])
+                with open(Path(self._spill_dir.name) / name, 'rb') as f:
+                    shutil.copyfileobj(f, out)
+            out.seek(header['columns']['rank_kind']['offset'])
+            out.write(np.asarray(rank_kinds, dtype='u1').tobytes())
+            out.truncate()
+        self._spill_dir.cleanup()
+
+
+class Metadata:
+    """ Metadata sidecar written by `MetadataWriter`, read via mmap """
+    columns: Dict[str, np.ndarray]
+    # No of labels and tags of the goal file
+    no_labels: int
+    no_tags: int
+    ops: List[str]
+    rank_kinds: List[str]
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            magic = f.read(len(METADATA_MAGIC))
+            assert magic == METADATA_MAGIC, f"'{path}' is not a metadata sidecar"
+            header_len = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(header_len))
+
+        self.no_labels = header['labels']
+        self.no_tags = header['tags']
+        self.ops = header['ops']
+        self.rank_kinds = header['rank_kinds']
+        self.columns = {}
+        for (name, col) in header['columns'].items():
+            dtype = np.dtype(col['dtype'])
+            if col['rows'] == 0:
+                self.columns[name] = np.empty(0, dtype=dtype)
+                continue
+            self.columns[name] = np.memmap(
+                path, dtype=dtype, mode='r', offset=col['offset'], shape=(col['rows'],))
+
+    def __len__(self) -> int:
+        return len(self.columns['row'])
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def context_of_labels(self, labels) -> np.ndarray:
+        """ Context index of each (global) label number """
+        return np.searchsorted(self['first_label'], labels, side='right') - 1
+
+    def context_of_tags(self, tags) -> np.ndarray:
+        """ Context index of the operation each message tag was drawn for """
+        return np.searchsorted(self['first_tag'], tags, side='right') - 1
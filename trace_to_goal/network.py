@@ -4,16 +4,46 @@ import random
 import os
 from loguru import logger
 from tqdm import tqdm
-from typing import List, Optional, Dict, Literal
+from collections import deque, OrderedDict
+from typing import List, Optional, Dict, Literal, Set, Tuple
 from pathlib import Path
 
 from .rank import RankBuilder
-from .interaction import inject_mount, inject_read, inject_write
-from .common import Addr, Id, SliceMap, SliceResponsibility, \
-    BssResponsibility, DEFAULT_DUMP_DIR
-
-VALID_TOPOLOGY_STRATEGIES = ['grouped-by-kind', 'fat-tree']
-TopologyStrategy = Literal['grouped-by-kind', 'fat-tree']
+from .metadata import MetadataWriter, OP_CODES
+from .interaction import inject_mount, inject_read, inject_write, \
+    flush_write_batch, resolve_to_slices_and_sizes, WriteBatch
+from .validate import ValidationReport, validate_network
+from .placement import Placement, placement_report
+from .common import Addr, Id, SliceId, SliceMap, SliceResponsibility, \
+    BssId, BssResponsibility, DEFAULT_DUMP_DIR
+
+VALID_TOPOLOGY_STRATEGIES = ['grouped-by-kind', 'fat-tree', 'racked']
+TopologyStrategy = Literal['grouped-by-kind', 'fat-tree', 'racked']
+
+# How the elements of a kind are spread over the racks of a racked topology:
+#   packed: contiguous ids share a rack, spread: round-robin, first: all in rack 0
+VALID_RACK_RULES = ['packed', 'spread', 'first']
+RackRule = Literal['packed', 'spread', 'first']
+TOPOLOGY_KINDS = ['host', 'slb', 'gs', 'mds', 'ccs', 'bss']
+DEFAULT_RACK_RULES: Dict[str, RackRule] = {
+    'host': 'spread', 'slb': 'first', 'gs': 'first', 'mds': 'first',
+    'ccs': 'spread', 'bss': 'packed',
+}
+
+
+def parse_rack_rules(spec: Optional[str]) -> Dict[str, RackRule]:
+    """ Parses rack rules of the form 'host=spread,bss=packed' on top of the defaults """
+    rules = dict(DEFAULT_RACK_RULES)
+    for entry in (spec or '').split(','):
+        if not entry.strip():
+            continue
+        (kind, sep, rule) = entry.partition('=')
+        (kind, rule) = (kind.strip(), rule.strip())
+        if not sep or kind not in TOPOLOGY_KINDS or rule not in VALID_RACK_RULES:
+            raise ValueError(
+                f"Invalid rack rule '{entry}', expected <kind>=<rule> with kind one of {TOPOLOGY_KINDS} and rule one of {VALID_RACK_RULES}")
+        rules[kind] = rule  # type: ignore
+    return rules
 
 
 class NetworkTopology:
@@ -25,6 +55,12 @@ class NetworkTopology:
     bss_count: Id = 1
     strategy: TopologyStrategy = 'grouped-by-kind'
     mapping: Dict = {}
+    # Racked topologies only
+    racks: int = 1
+    racks_per_pod: Optional[int] = None
+    rack_rules: Dict[str, RackRule] = DEFAULT_RACK_RULES
+    # Rack of every rank, None if the topology has no racks
+    rank_racks: Optional[List[int]] = None
 
     def _init_grouped_by_kind_state(self):
         self.mapping = {}
@@ -50,25 +86,27 @@ class NetworkTopology:
         self.mapping = {}
         # Spread all components evenly across the network
         no_total_ranks = self.get_total_ranks()
+        used = set()
 
         def spread_across_network(kind, count):
             fac = no_total_ranks / (count + 1)
             for i in range(count):
                 key = f'{kind}{i}'
                 pos = round((i + 1) * fac)
-                if pos in self.mapping.values():
+                if pos in used:
                     pos_l = (pos - 1) % no_total_ranks
                     pos_r = (pos + 1) % no_total_ranks
-                    while pos_l in self.mapping.values() and pos_r in self.mapping.values():
+                    while pos_l in used and pos_r in used:
                         pos_l = (pos_l - 1) % no_total_ranks
                         pos_r = (pos_r + 1) % no_total_ranks
 
-                    if pos_l not in self.mapping.values():
+                    if pos_l not in used:
                         self.mapping[key] = pos_l
                     else:
                         self.mapping[key] = pos_r
                 else:
                     self.mapping[key] = pos
+                used.add(self.mapping[key])
 
         spread_across_network('host', self.host_count)
         spread_across_network('slb', self.slb_count)
@@ -77,7 +115,33 @@ class NetworkTopology:
         spread_across_network('ccs', self.ccs_count)
         spread_across_network('bss', self.bss_count)
 
-    def __init__(self, *, host_count=None, slb_count=None, gs_count=None, mds_count=None, ccs_count=None, bss_count=None, strategy=None):
+    def _init_racked_state(self):
+        self.mapping = {}
+        counts = {
+            'host': self.host_count, 'slb': self.slb_count, 'gs': self.gs_count,
+            'mds': self.mds_count, 'ccs': self.ccs_count, 'bss': self.bss_count,
+        }
+        # Bucket the elements by rack, then number the ranks rack by rack
+        racks: List[List[str]] = [[] for _ in range(self.racks)]
+        for kind in TOPOLOGY_KINDS:
+            (rule, count) = (self.rack_rules[kind], counts[kind])
+            for i in range(count):
+                if rule == 'packed':
+                    rack = i * self.racks // count
+                elif rule == 'spread':
+                    rack = i % self.racks
+                else:
+                    rack = 0
+                racks[rack].append(f'{kind}{i}')
+
+        self.rank_racks = []
+        for (rack, keys) in enumerate(racks):
+            for key in keys:
+                self.mapping[key] = len(self.rank_racks)
+                self.rank_racks.append(rack)
+
+    def __init__(self, *, host_count=None, slb_count=None, gs_count=None, mds_count=None, ccs_count=None, bss_count=None, strategy=None,
+                 racks=None, racks_per_pod=None, rack_rules=None):
         if host_count is not None:
             self.host_count = host_count
         if slb_count is not None:
@@ -92,13 +156,23 @@ class NetworkTopology:
             self.bss_count = bss_count
         if strategy is not None:
             self.strategy = strategy
+        if racks is not None:
+            self.racks = racks
+        if racks_per_pod is not None:
+            self.racks_per_pod = racks_per_pod
+        if rack_rules is not None:
+            self.rack_rules = rack_rules
+        assert self.racks >= 1, "No of racks has to be >= 1"
+        assert self.racks_per_pod is None or self.racks_per_pod >= 1, "No of racks per pod has to be >= 1"
 
         if self.strategy == 'fat-tree':
             self._init_fattree_state()
         elif self.strategy == 'grouped-by-kind':
             self._init_grouped_by_kind_state()
+        elif self.strategy == 'racked':
+            self._init_racked_state()
         else:
-            assert True, "Your selected strategy is not valid"
+            assert False, "Your selected strategy is not valid"
 
         # Update the total number of ranks
         logger.info("Created network topology:")
@@ -133,16 +207,48 @@ class NetworkTopology:
     def get_bss(self, id: int):
         return self._get(id, 'bss')
 
+    def get_rack(self, rank: int) -> int:
+        return self.rank_racks[rank] if self.rank_racks is not None else 0
+
+    def bss_racks(self) -> Optional[List[int]]:
+        """ Rack of every BSS, None if the topology has no racks """
+        if self.rank_racks is None:
+            return None
+        return [self.rank_racks[self.get_bss(i)] for i in range(self.bss_count)]
+
+    def rack_label(self, rank: int) -> str:
+        rack = self.get_rack(rank)
+        if self.racks_per_pod:
+            return f"Pod {rack // self.racks_per_pod}, Rack {rack}"
+        return f"Rack {rack}"
+
+    def rack_entry(self, rank: int, name: str) -> Dict:
+        """ Rank name map entry of a rank of a racked topology """
+        rack = self.get_rack(rank)
+        entry = {'name': f"{name} ({self.rack_label(rank)})", 'rack': rack}
+        if self.racks_per_pod:
+            entry['pod'] = rack // self.racks_per_pod
+        return entry
+
+    def rank_kinds(self) -> List[int]:
+        """ Index into TOPOLOGY_KINDS of every rank """
+        kinds = [0] * self.get_total_ranks()
+        for (code, kind) in enumerate(TOPOLOGY_KINDS):
+            for i in range(getattr(self, f'{kind}_count')):
+                kinds[self._get(i, kind)] = code
+        return kinds
+
     def get_total_ranks(self):
         return self.host_count + self.slb_count +\
             self.gs_count + self.mds_count +\
             self.ccs_count + self.bss_count
 
-    def to_file(self, dest):
+    def to_file(self, dest, host_labels: Optional[Dict[int, str]] = None):
         value = {}
+        host_labels = host_labels or {}
 
         for i in range(self.host_count):
-            value[str(self.get_host(i))] = f"Host {i}"
+            value[str(self.get_host(i))] = host_labels.get(i, f"Host {i}")
         for i in range(self.slb_count):
             value[str(self.get_slb(i))] = f"SLB {i}"
         for i in range(self.gs_count):
@@ -153,54 +259,210 @@ class NetworkTopology:
             value[str(self.get_ccs(i))] = f"CCS {i}"
         for i in range(self.bss_count):
             value[str(self.get_bss(i))] = f"BSS {i}"
+        if self.rank_racks is not None:
+            # The rack stays readable in the name, tools use the fields
+            value = {rank: self.rack_entry(int(rank), name)
+                     for (rank, name) in value.items()}
 
         json_value = json.dumps(value)
         with open(dest, "w+") as f:
             f.writelines(json_value)
 
 
+class SqnCache:
+    """ Modelled client side SqN caches of all hosts. Every host caches the
+    SqNs of up to `capacity` slices with LRU eviction, a write invalidates
+    the entries of all other hosts. The state is tracked in generation order """
+    capacity: int
+    entries: Dict[int, OrderedDict]
+    # Slice -> hosts caching its SqN
+    holders: Dict[SliceId, set]
+    hits: int = 0
+    misses: int = 0
+
+    def __init__(self, capacity: int):
+        assert capacity > 0, "SqN cache capacity has to be > 0"
+        self.capacity = capacity
+        self.entries = {}
+        self.holders = {}
+
+    def lookup(self, host: int, slice_id: SliceId) -> bool:
+        entries = self.entries.get(host)
+        if entries is not None and slice_id in entries:
+            entries.move_to_end(slice_id)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def insert(self, host: int, slice_id: SliceId):
+        entries = self.entries.setdefault(host, OrderedDict())
+        if slice_id in entries:
+            entries.move_to_end(slice_id)
+            return
+        entries[slice_id] = None
+        self.holders.setdefault(slice_id, set()).add(host)
+        if len(entries) > self.capacity:
+            (evicted, _) = entries.popitem(last=False)
+            self.holders[evicted].discard(host)
+
+    def invalidate(self, writer: int, slice_id: SliceId):
+        holders = self.holders.get(slice_id, set())
+        for host in holders - {writer}:
+            del self.entries[host][slice_id]
+            holders.discard(host)
+        self.insert(writer, slice_id)
+
+
+def parse_erasure_coding(spec: Optional[str]) -> Optional[Tuple[int, int]]:
+    """ Parses an erasure coding layout of the form 'k+m' """
+    if spec is None:
+        return None
+    (k, sep, m) = str(spec).partition('+')
+    try:
+        (k, m) = (int(k), int(m))
+    except ValueError:
+        raise ValueError(f"Invalid erasure coding '{spec}', expected <k>+<m>, e.g. 4+2")
+    if not sep or k < 1 or m < 0:
+        raise ValueError(f"Invalid erasure coding '{spec}', expected k >= 1 data and m >= 0 parity fragments")
+    return (k, m)
+
+
+class Volume:
+    """ Virtual disk with its own slice map. Its slices are numbered after
+    the ones of all previous volumes, so they share the CCS/BSS pool """
+    size: int
+    first_slice: SliceId
+    slice_map: SliceMap
+
+    def __init__(self, size: int, slice_size: int, first_slice: SliceId):
+        self.size = size
+        self.first_slice = first_slice
+        self.slice_map = [
+            (slice_size * id, slice_size * (id + 1))
+            for id in range(max(math.ceil(size / slice_size), 1))
+        ]
+
+
+# CPU of the host ranks running the open loop clock, CPU 0 handles messages
+OPEN_LOOP_CPU = 1
+
 VALID_NEXT_STRATEGIES = ['round-robin', 'random', 'first']
 NextStrategy = Literal['round-robin', 'random', 'first']
+# Reads can also pick the replica with the least work in flight or
+# prefer replicas in the rack of the host (racked topologies)
+VALID_NEXT_BSS_STRATEGIES = VALID_NEXT_STRATEGIES + ['least-loaded', 'rack-local']
+NextBssStrategy = Literal['round-robin', 'random', 'first', 'least-loaded', 'rack-local']
 
 
 class DirectDriveNetwork:
     topology: NetworkTopology
     slice_map: SliceMap
+    # Independent volumes, replace the shared disk (slice_map) if set
+    volumes: Optional[List[Volume]] = None
+    # Total no of slices of the disk or all volumes
+    no_slices: int
     slice_resp: SliceResponsibility
     bss_resp: BssResponsibility
+    placement: Placement
+    # Load imbalance of the responsibility tables, see `placement_report`
+    placement_stats: Dict[str, float]
 
     next_counter: Dict[str, int] = {}
 
     next_ccs_strategy: NextStrategy = "round-robin"
-    next_bss_strategy: NextStrategy = "round-robin"
+    next_bss_strategy: NextBssStrategy = "round-robin"
     next_gs_strategy: NextStrategy = "first"
     next_slb_strategy: NextStrategy = "first"
     next_mds_strategy: NextStrategy = "first"
 
     builders: List[RankBuilder]
+    # Per BSS the bytes and no of operations of the operations in flight,
+    # i.e. still in the queue depth window of their host (all operations
+    # without a queue depth or in open loop mode)
+    bss_load_bytes: List[int]
+    bss_load_ops: List[int]
+    # BSS loads of the operation being added
+    op_loads: List[Tuple[BssId, int]] = []
 
     op_depens: bool
+    # No of outstanding operations per host, None if they are not limited
+    queue_depth: Optional[int] = None
     inplace: bool = False
     inplace_file: Optional[str] = None
-    known_hosts: List[int] = []
-    host_dependencies: Dict[int, List[str]] = {}
+    known_hosts: Set[int] = set()
+    # Per host the result labels of the last `queue_depth` operations
+    host_dependencies: Dict[int, deque] = {}
+    # Per host the BSS loads of the last `queue_depth` operations
+    host_loads: Dict[int, deque] = {}
+    # Request the SqNs of all slices of a read per CCS in one round trip
+    batch_lookups: bool = False
+    sqn_cache: Optional[SqnCache] = None
+    # No of replica acks a CCS waits for before acknowledging a write (None: all)
+    write_quorum: Optional[int] = None
+    # Issue operations at their trace time instead of after their predecessors
+    open_loop: bool = False
+    host_mounts: Dict[int, List[str]] = {}
+    # Per host (time in ns, calc label reaching it) of the open loop clock
+    host_clocks: Dict[int, Tuple[int, Optional[str]]] = {}
+    # (k, m): slices are stored as k data and m parity fragments on the k + m
+    # BSS of their CCS instead of full replicas (None: replication)
+    erasure_coding: Optional[Tuple[int, int]] = None
+    # Records the operation every goal op was generated for
+    metadata: Optional[MetadataWriter] = None
+    # Max no of slice writes a CCS replicates in one round (None: no group commit)
+    group_commit: Optional[int] = None
+    # Per CCS the writes waiting for replication
+    write_batches: Dict[int, WriteBatch] = {}
+    # No of replication rounds and slice writes replicated by group commits
+    group_commit_rounds: int = 0
+    group_commit_writes: int = 0
 
     def __init__(self, topology: NetworkTopology,
                  disk_size: int, slice_size: int,
                  next_ccs_strategy: Optional[NextStrategy] = None,
-                 next_bss_strategy: Optional[NextStrategy] = None,
+                 next_bss_strategy: Optional[NextBssStrategy] = None,
                  next_gs_strategy: Optional[NextStrategy] = None,
                  next_slb_strategy: Optional[NextStrategy] = None,
                  next_mds_strategy: Optional[NextStrategy] = None,
                  op_depens: bool = True,
                  dump_state: bool = False,
-                 dump_folder: str = DEFAULT_DUMP_DIR
+                 dump_folder: str = DEFAULT_DUMP_DIR,
+                 queue_depth: Optional[int] = None,
+                 open_loop: bool = False,
+                 batch_lookups: bool = False,
+                 sqn_cache_size: int = 0,
+                 write_quorum: Optional[int] = None,
+                 placement: Optional[Placement] = None,
+                 group_commit: Optional[int] = None,
+                 volume_sizes: Optional[List[int]] = None,
+                 erasure_coding: Optional[Tuple[int, int]] = None,
+                 metadata_dest: Optional[str] = None
                  ):
         logger.info("Creating DirectDriveNetwork with:")
         logger.info("disk sizes: {}; slice_size: {}", disk_size, slice_size)
         assert topology.is_valid(), "Network topology invalid: All entries should be >= 1"
         self.topology = topology
+        # Per network state, several networks may be created in one process
+        self.next_counter = {}
+        self.known_hosts = set()
+        self.host_dependencies = {}
+        self.host_loads = {}
+        self.op_loads = []
+        self.host_mounts = {}
+        self.host_clocks = {}
+        self.open_loop = open_loop
+        self.batch_lookups = batch_lookups
+        self.sqn_cache = SqnCache(sqn_cache_size) if sqn_cache_size else None
+        assert write_quorum is None or write_quorum >= 1, "Write quorum has to be >= 1"
+        self.write_quorum = write_quorum
+        assert group_commit is None or group_commit >= 1, "Group commit size has to be >= 1"
+        self.group_commit = group_commit
+        self.write_batches = {}
         self.op_depens = op_depens
+        # Strictly chained operations are a queue depth of 1
+        self.queue_depth = queue_depth if queue_depth is not None else (1 if op_depens else None)
+        assert self.queue_depth is None or self.queue_depth >= 1, "Queue depth has to be >= 1"
         self.dump_state = dump_state
         self.dump_folder = dump_folder
         assert not dump_state or dump_folder is not None, "None is not a valid value for the dump folder"
@@ -212,28 +474,43 @@ class DirectDriveNetwork:
             os.makedirs(parent, exist_ok=True)
 
         # TODO pjordan: These args are a little weird
-        # resp and slice_map creation should be handled in a different place
+        # slice_map creation should be handled in a different place
         # to allow various structures
         logger.debug("Creating slice_map")
-        no_slices = math.ceil(disk_size / slice_size)
-        self.slice_map = [
-            (slice_size * id, slice_size * (id + 1))
-            for id in range(no_slices)
-        ]
+        if volume_sizes is not None:
+            self.volumes = []
+            no_slices = 0
+            for size in volume_sizes:
+                volume = Volume(size, slice_size, no_slices)
+                self.volumes.append(volume)
+                no_slices += len(volume.slice_map)
+            self.slice_map = []
+        else:
+            no_slices = math.ceil(disk_size / slice_size)
+            self.slice_map = [
+                (slice_size * id, slice_size * (id + 1))
+                for id in range(no_slices)
+            ]
+        self.no_slices = no_slices
+        self.placement = placement or Placement()
         logger.debug("Creating slice_resp")
-        self.slice_resp = [
-            id % topology.ccs_count
-            for id in range(no_slices)
-        ]
+        slice_owners = self.placement.slice_owners(no_slices, topology.ccs_count)
+        self.slice_resp = slice_owners.tolist()
         logger.debug("Creating bss_resp")
-        bss_factor = math.ceil(topology.bss_count / topology.ccs_count)
-        self.bss_resp = [
-            [
-                ccs_id * bss_factor + id for id in range(bss_factor)
-            ]
-            for ccs_id in range(topology.ccs_count)
-        ]
+        replica_sets = self.placement.replica_sets(
+            topology.ccs_count, topology.bss_count, topology.bss_racks())
+        self.bss_resp = replica_sets.tolist()
+        self.erasure_coding = erasure_coding
+        if erasure_coding is not None:
+            (k, m) = erasure_coding
+            assert replica_sets.shape[1] == k + m, "Erasure coding requires k + m BSS per CCS"
+            assert write_quorum is None or write_quorum >= k, "Erasure coded writes need a write quorum >= k"
+        self.placement_stats = placement_report(
+            slice_owners, replica_sets, topology.ccs_count, topology.bss_count)
+        self.bss_load_bytes = [0] * topology.bss_count
+        self.bss_load_ops = [0] * topology.bss_count
         logger.debug("Creating builders")
+        self.metadata = MetadataWriter(metadata_dest, self.next_counter) if metadata_dest else None
         no_ranks = self.topology.get_total_ranks()
         self.builders = [
             RankBuilder(rid, self.get_next_label,
@@ -267,7 +544,9 @@ class DirectDriveNetwork:
             assert next_ccs_strategy in VALID_NEXT_STRATEGIES, "Next CCS strategy is not supported"
             self.next_ccs_strategy = next_ccs_strategy
         if next_bss_strategy:
-            assert next_bss_strategy in VALID_NEXT_STRATEGIES, "Next BSS strategy is not supported"
+            assert next_bss_strategy in VALID_NEXT_BSS_STRATEGIES, "Next BSS strategy is not supported"
+            assert next_bss_strategy != 'rack-local' or topology.rank_racks is not None, \
+                "Rack local BSS selection requires a racked topology"
             self.next_bss_strategy = next_bss_strategy
         if next_slb_strategy:
             assert next_slb_strategy in VALID_NEXT_STRATEGIES, "Next SLB strategy is not supported"
@@ -276,34 +555,125 @@ class DirectDriveNetwork:
         logger.success("Finished DirectDriveNetwork initialization")
 
     def add_interaction(self, *, op_code: str, host: int,
-                        address: int, size: int, mount: bool = True):
+                        address: int, size: int, mount: bool = True,
+                        slices: Optional[List[Tuple[SliceId, int]]] = None,
+                        issue_time: Optional[int] = None, row: int = -1):
+        metadata = self.metadata
         # Add mount on first interaction
         if host not in self.known_hosts:
-            self.known_hosts.append(host)
-            self.host_dependencies[host] = self.add_mount(
-                host) if mount else []
-
-        deps = self.host_dependencies[host] if self.op_depens else []
+            self.known_hosts.add(host)
+            if metadata is not None:
+                metadata.set_op(row, host, 'mount')
+            mount_deps = self.add_mount(host) if mount else []
+            self.host_mounts[host] = mount_deps
+            # The first `queue_depth` operations only wait for the mount
+            self.host_dependencies[host] = deque(
+                [mount_deps] * (self.queue_depth or 1))
+            self.host_loads[host] = deque([[]] * (self.queue_depth or 1))
+
+        queue = self.host_dependencies[host]
+        self.op_loads = []
+        if metadata is not None:
+            metadata.set_op(row, host, op_code)
+        if self.open_loop:
+            assert issue_time is not None, "Open loop operations need an issue time"
+            deps = self.host_mounts[host] + self._advance_clock(host, issue_time)
+        else:
+            # Each operation waits for the one `queue_depth` positions earlier
+            deps = queue.popleft() if self.queue_depth else []
+            if self.queue_depth:
+                # That one has completed, its BSS work is no longer in flight
+                for (bss_id, load) in self.host_loads[host].popleft():
+                    self.remove_bss_load(bss_id, load)
         if op_code.lower() == "r":
-            self.host_dependencies[host] = self.add_read(
-                host, address, size, depends_on=deps)
+            results = self.add_read(
+                host, address, size, depends_on=deps, slices=slices)
         elif op_code.lower() == "w":
-            self.host_dependencies[host] = self.add_write(
-                host, address, size, depends_on=deps)
+            results = self.add_write(
+                host, address, size, depends_on=deps, slices=slices)
         else:
             raise Exception("Unknown interaction type!")
-
-    def add_read(self, host: int, address: Addr, size: int, depends_on=[]):
-        return inject_read(self, host, address, size, depends_on=depends_on)
-
-    def add_write(self, host: int, address: Addr, size: int, depends_on=[]):
-        return inject_write(self, host, address, size, depends_on=depends_on)
+        if self.queue_depth and not self.open_loop:
+            queue.append(results)
+            self.host_loads[host].append(self.op_loads)
+
+    def _advance_clock(self, host: int, issue_time: int) -> List[str]:
+        """ Extends the chain of calcs on the host rank up to issue_time (ns)
+        and returns the label to wait on. The chain runs on its own CPU, so
+        handling completions does not delay the issue of later operations """
+        (clock, label) = self.host_clocks.get(host, (0, None))
+        delay = issue_time - clock
+        if delay > 0:
+            builder = self.get_builder(self.topology.get_host(host))
+            lbl_delay = builder.add_calc(delay, cpu=OPEN_LOOP_CPU)
+            if label:
+                builder.require_dependency(lbl_delay, label)
+            (clock, label) = (issue_time, lbl_delay)
+            self.host_clocks[host] = (clock, label)
+        return [label] if label else []
+
+    def add_workload(self, workload, mount: bool = True):
+        """ Adds all operations of a (synthetic) workload, one by one """
+        for (row, (op_code, host, address, size)) in enumerate(tqdm(workload, total=len(workload))):
+            self.add_interaction(op_code=op_code, host=host,
+                                 address=address, size=size, mount=mount, row=row)
+
+    def resolve_slices(self, address: Addr, size: int,
+                       volume: Optional[int] = None) -> List[Tuple[SliceId, int]]:
+        if self.volumes is None:
+            return resolve_to_slices_and_sizes(self.slice_map, address, address + size)
+        assert volume is not None, "Networks with volumes need the volume of an address"
+        v = self.volumes[volume]
+        return [(v.first_slice + sid, s) for (sid, s) in
+                resolve_to_slices_and_sizes(v.slice_map, address, address + size)]
+
+    def add_read(self, host: int, address: Addr, size: int, depends_on=[],
+                 slices: Optional[List[Tuple[SliceId, int]]] = None):
+        return inject_read(self, host, address, size, depends_on=depends_on, slices=slices)
+
+    def add_write(self, host: int, address: Addr, size: int, depends_on=[],
+                  slices: Optional[List[Tuple[SliceId, int]]] = None):
+        return inject_write(self, host, address, size, depends_on=depends_on, slices=slices)
 
     def add_mount(self, host: int):
         return inject_mount(self, host)
 
+    def add_to_write_batch(self, ccs_id: int, host: int, size: int, store_lbl: str,
+                           ack: Tuple[int, int]):
+        batch = self.write_batches.setdefault(ccs_id, WriteBatch(ccs_id))
+        batch.size += size
+        batch.store_lbls.append(store_lbl)
+        batch.acks.append(ack)
+        batch.hosts.add(host)
+        assert self.group_commit is not None, "unreachable"
+        if len(batch.acks) >= self.group_commit:
+            self._flush_write_batch(self.write_batches.pop(ccs_id))
+
+    def flush_write_batches(self, host: Optional[int] = None):
+        """ Replicates the pending write batches (only the ones holding
+        writes of `host` if given) """
+        for ccs_id in list(self.write_batches.keys()):
+            if host is None or host in self.write_batches[ccs_id].hosts:
+                self._flush_write_batch(self.write_batches.pop(ccs_id))
+
+    def _flush_write_batch(self, batch: WriteBatch):
+        self.group_commit_rounds += 1
+        self.group_commit_writes += len(batch.acks)
+        metadata = self.metadata
+        if metadata is not None:
+            # The round belongs to all writes of the batch
+            context = metadata.context
+            metadata.context = (-1, -1, OP_CODES['w'], -1)
+        flush_write_batch(self, batch)
+        if metadata is not None:
+            metadata.context = context
+
     def to_goal(self, dest_file: str = "./out.goal"):
         logger.info("Creating goal file at: {}", dest_file)
+        self.flush_write_batches()
+        if self.metadata is not None:
+            self.metadata.close(self.topology.rank_kinds(), TOPOLOGY_KINDS)
+            self.metadata = None
 
         # Create all the parent folders
         parent = Path(dest_file).parent.absolute()
@@ -323,6 +693,15 @@ class DirectDriveNetwork:
                     f.write(rank_res)
                     del rank_res
 
+    def bytes_sent(self) -> int:
+        """ Payload of all messages of the schedule """
+        return sum(b.bytes_sent for b in self.builders)
+
+    def validate(self) -> ValidationReport:
+        """ Structural checks of the goal schedule, before writing it """
+        self.flush_write_batches()
+        return validate_network(self)
+
     def get_builder(self, rank_id: int):
         return self.builders[rank_id]
 
@@ -352,12 +731,70 @@ class DirectDriveNetwork:
         return self._get_next_counter('tag')
 
     def get_next_bss(self, slice_id: Optional[int]) -> int:
+        # Rack local selection picks round-robin among the candidates
+        strategy = 'round-robin' if self.next_bss_strategy == 'rack-local' else self.next_bss_strategy
         return self._get_next_strategy_counter(
             f'bss{slice_id}' if slice_id else 'bss',
-            self.next_bss_strategy,
+            strategy,
             modulo=self.topology.bss_count
         )
 
+    def get_next_replica(self, slice_id: SliceId, replicas: List[BssId],
+                         host: Optional[int] = None) -> int:
+        """ Index of the replica in `replicas` serving a read of the slice """
+        if self.next_bss_strategy == 'least-loaded':
+            return min(range(len(replicas)), key=lambda i: (
+                self.bss_load_bytes[replicas[i]], self.bss_load_ops[replicas[i]]))
+        if self.next_bss_strategy == 'rack-local' and host is not None:
+            rack = self.topology.get_rack(self.topology.get_host(host))
+            local = [i for (i, bss_id) in enumerate(replicas)
+                     if self.topology.get_rack(self.topology.get_bss(bss_id)) == rack]
+            if local:
+                return local[self.get_next_bss(slice_id) % len(local)]
+        return self.get_next_bss(slice_id) % len(replicas)
+
+    def get_fragment_size(self, size: int) -> int:
+        """ Bytes each BSS stores of `size` bytes """
+        if self.erasure_coding is None:
+            return size
+        return math.ceil(size / self.erasure_coding[0])
+
+    def get_read_fragments(self, slice_id: SliceId, replicas: List[BssId],
+                           host: Optional[int] = None) -> List[int]:
+        """ Indices of the k BSS in `replicas` a read of an erasure coded
+        slice fetches its fragments from """
+        assert self.erasure_coding is not None, "unreachable"
+        k = self.erasure_coding[0]
+        if self.next_bss_strategy == 'least-loaded':
+            return sorted(range(len(replicas)), key=lambda i: (
+                self.bss_load_bytes[replicas[i]], self.bss_load_ops[replicas[i]], i))[:k]
+        # k consecutive fragments from the one the selection strategy picks
+        start = self.get_next_replica(slice_id, replicas, host=host)
+        return [(start + i) % len(replicas) for i in range(k)]
+
+    def get_write_quorum(self, replicas: List[BssId], ccs_id: Optional[int] = None) -> List[int]:
+        """ Indices of the replicas whose acks complete a write. Goal has no
+        'any K of N' dependency, so the quorum is fixed upfront: the replicas
+        in the rack of the CCS, then the least loaded ones are expected to
+        ack first """
+        if self.write_quorum is None or self.write_quorum >= len(replicas):
+            return list(range(len(replicas)))
+        topology = self.topology
+        rack = topology.get_rack(topology.get_ccs(ccs_id)) if ccs_id is not None else 0
+        order = sorted(range(len(replicas)), key=lambda i: (
+            topology.get_rack(topology.get_bss(replicas[i])) != rack,
+            self.bss_load_bytes[replicas[i]], self.bss_load_ops[replicas[i]], i))
+        return sorted(order[:self.write_quorum])
+
+    def add_bss_load(self, bss_id: BssId, size: int):
+        self.bss_load_bytes[bss_id] += size
+        self.bss_load_ops[bss_id] += 1
+        self.op_loads.append((bss_id, size))
+
+    def remove_bss_load(self, bss_id: BssId, size: int):
+        self.bss_load_bytes[bss_id] -= size
+        self.bss_load_ops[bss_id] -= 1
+
     def get_next_ccs(self) -> int:
         return self._get_next_strategy_counter('ccs', self.next_ccs_strategy, modulo=self.topology.ccs_count)
 
@@ -0,0 +1,167 @@
+import math
+import numpy as np
+from typing import Dict, Literal, Optional, Sequence
+
+VALID_PLACEMENTS = ['modulo', 'consistent-hash', 'rendezvous', 'rack-aware']
+PlacementStrategy = Literal['modulo', 'consistent-hash', 'rendezvous', 'rack-aware']
+
+# Points per node on the consistent hashing ring
+RING_VNODES = 64
+# Slices scored at once by rendezvous hashing
+RENDEZVOUS_CHUNK = 1 << 16
+
+_U64 = np.uint64
+
+
+def mix64(values: np.ndarray) -> np.ndarray:
+    """ splitmix64 finalizer, a cheap vectorized hash of uint64 values """
+    x = values.astype(_U64)
+    x = (x ^ (x >> _U64(30))) * _U64(0xbf58476d1ce4e5b9)
+    x = (x ^ (x >> _U64(27))) * _U64(0x94d049bb133111eb)
+    return x ^ (x >> _U64(31))
+
+
+def _keys(values, salt: int) -> np.ndarray:
+    return mix64(np.asarray(values, dtype=_U64) ^ mix64(np.array([salt], dtype=_U64)))
+
+
+class Placement:
+    """ Computes the responsibility tables of a network as arrays:
+    slice -> CCS and CCS -> replica set of BSS.
+        modulo: slice i is owned by CCS i % ccs_count, CCS c replicates onto
+            consecutive BSS from c * ceil(bss_count / ccs_count) onwards
+        consistent-hash: slices and replica sets are placed on hash rings
+        rendezvous: highest random weight hashing
+        rack-aware: rendezvous, but the replicas of a CCS are spread over
+            distinct racks first (CRUSH-like) """
+    strategy: PlacementStrategy = 'modulo'
+    # Replicas per CCS (Default: ceil(bss_count / ccs_count))
+    replication: Optional[int] = None
+    racks: int = 1
+    seed: int = 0
+
+    def __init__(self, *, strategy=None, replication=None, racks=None, seed=None):
+        if strategy is not None:
+            self.strategy = strategy
+        if replication is not None:
+            self.replication = replication
+        if racks is not None:
+            self.racks = racks
+        if seed is not None:
+            self.seed = seed
+
+        assert self.strategy in VALID_PLACEMENTS, "Placement strategy is not supported"
+        assert self.replication is None or self.replication >= 1, "Replication factor has to be >= 1"
+        assert self.racks >= 1, "No of racks has to be >= 1"
+
+    def replication_for(self, ccs_count: int, bss_count: int) -> int:
+        replication = self.replication or math.ceil(bss_count / ccs_count)
+        assert replication <= bss_count, "Replication factor exceeds the no of BSS"
+        return replication
+
+    def slice_owners(self, no_slices: int, ccs_count: int) -> np.ndarray:
+        """ CCS responsible for each slice """
+        ids = np.arange(no_slices, dtype=np.int64)
+        if self.strategy == 'modulo':
+            return ids % ccs_count
+        if self.strategy == 'consistent-hash':
+            (ring, owners) = self._ring(ccs_count, salt=1)
+            pos = np.searchsorted(ring, _keys(ids, self.seed)) % len(ring)
+            return owners[pos]
+
+        # Rendezvous: every slice picks the CCS with the highest score
+        result = np.empty(no_slices, dtype=np.int64)
+        ccs_keys = _keys(np.arange(ccs_count), self.seed + 1)
+        for start in range(0, no_slices, RENDEZVOUS_CHUNK):
+            chunk = _keys(ids[start:start + RENDEZVOUS_CHUNK], self.seed)
+            scores = mix64(chunk[:, None] ^ ccs_keys[None, :])
+            result[start:start + len(chunk)] = np.argmax(scores, axis=1)
+        return result
+
+    def replica_sets(self, ccs_count: int, bss_count: int,
+                     bss_racks: Optional[Sequence[int]] = None) -> np.ndarray:
+        """ (ccs_count, replication) array of the BSS replicating each CCS.
+        bss_racks is the rack of every BSS in a racked topology """
+        replication = self.replication_for(ccs_count, bss_count)
+        ccs = np.arange(ccs_count, dtype=np.int64)
+        if self.strategy == 'modulo':
+            stride = math.ceil(bss_count / ccs_count)
+            # Wraps around instead of pointing past the last BSS
+            return (ccs[:, None] * stride + np.arange(replication)[None, :]) % bss_count
+        if self.strategy == 'consistent-hash':
+            return self._ring_replicas(ccs_count, bss_count, replication)
+
+        scores = mix64(_keys(ccs, self.seed + 2)[:, None] ^
+                       _keys(np.arange(bss_count), self.seed + 3)[None, :])
+        # Highest scores first
+        order = np.argsort(~scores, axis=1, kind='stable')
+        if self.strategy == 'rendezvous':
+            return order[:, :replication]
+        return self._rack_aware(order, bss_count, replication, bss_racks)
+
+    def rack_of(self, bss_ids: np.ndarray, bss_count: int,
+                bss_racks: Optional[Sequence[int]] = None) -> np.ndarray:
+        """ Racks of the BSS, without a racked topology `racks` racks hold
+        contiguous ranges of BSS """
+        if bss_racks is not None:
+            return np.asarray(bss_racks, dtype=np.int64)[bss_ids]
+        return np.asarray(bss_ids) * self.racks // bss_count
+
+    def _ring(self, count: int, salt: int):
+        nodes = np.repeat(np.arange(count, dtype=np.int64), RING_VNODES)
+        points = _keys(nodes * RING_VNODES + np.tile(np.arange(RING_VNODES), count),
+                       self.seed + salt)
+        order = np.argsort(points, kind='stable')
+        return (points[order], nodes[order])
+
+    def _ring_replicas(self, ccs_count: int, bss_count: int, replication: int) -> np.ndarray:
+        (ring, owners) = self._ring(bss_count, salt=2)
+        starts = np.searchsorted(ring, _keys(np.arange(ccs_count), self.seed + 3))
+        result = np.empty((ccs_count, replication), dtype=np.int64)
+        for (c, start) in enumerate(starts.tolist()):
+            # Walk clockwise until enough distinct BSS are found
+            chosen = []
+            pos = start
+            while len(chosen) < replication:
+                bss = int(owners[pos % len(ring)])
+                if bss not in chosen:
+                    chosen.append(bss)
+                pos += 1
+            result[c] = chosen
+        return result
+
+    def _rack_aware(self, order: np.ndarray, bss_count: int, replication: int,
+                    bss_racks: Optional[Sequence[int]]) -> np.ndarray:
+        # Take the best BSS of every rack first, then the second best, ...:
+        # order each row by the rank of a BSS within its rack, then by score
+        racks = self.rack_of(order, bss_count, bss_racks)
+        by_rack = np.argsort(racks, axis=1, kind='stable')
+        sorted_racks = np.take_along_axis(racks, by_rack, axis=1)
+        pos = np.arange(bss_count)
+        first = np.ones_like(sorted_racks, dtype=bool)
+        first[:, 1:] = sorted_racks[:, 1:] != sorted_racks[:, :-1]
+        group_start = np.maximum.accumulate(np.where(first, pos, 0), axis=1)
+        within_rack = np.empty_like(by_rack)
+        np.put_along_axis(within_rack, by_rack, pos - group_start, axis=1)
+        picks = np.argsort(within_rack * bss_count + pos, axis=1, kind='stable')[:, :replication]
+        return np.take_along_axis(order, picks, axis=1)
+
+
+def placement_report(slice_owners: np.ndarray, replica_sets: np.ndarray,
+                     ccs_count: int, bss_count: int) -> Dict[str, float]:
+    """ Load imbalance (max / mean) of slices per CCS and slice replicas per BSS """
+    per_ccs = np.bincount(slice_owners, minlength=ccs_count)
+    per_bss = np.bincount(replica_sets.ravel(), weights=per_ccs.repeat(replica_sets.shape[1]),
+                          minlength=bss_count)
+    return {
+        'ccs_imbalance': float(per_ccs.max() / max(per_ccs.mean(), 1e-9)),
+        'bss_imbalance': float(per_bss.max() / max(per_bss.mean(), 1e-9)),
+        'unused_ccs': int((per_ccs == 0).sum()),
+        'unused_bss': int((per_bss == 0).sum()),
+    }
+
+
+def format_placement_report(report: Dict[str, float]) -> str:
+    return (f"slices per CCS max/mean {report['ccs_imbalance']:.2f}; "
+            f"slice replicas per BSS max/mean {report['bss_imbalance']:.2f}; "
+            f"{report['unused_ccs']} CCS and {report['unused_bss']} BSS unused")
@@ -1,4 +1,4 @@
-from typing import List, Optional, Callable
+from typing import Iterator, List, Optional, Callable
 from pathlib import Path
 from io import TextIOWrapper
 
@@ -8,6 +8,8 @@ class RankBuilder:
     get_new_label: Callable[[Optional[str]], str]
 
     use_file: bool = False
+    # Payload of all sends of the rank
+    bytes_sent: int = 0
     _lines: List[str] = []
     _lines_file: Optional[TextIOWrapper] = None
     _lines_file_path: Optional[Path] = None
@@ -43,6 +45,7 @@ class RankBuilder:
     def add_send(self, len: int, to_rank: int,
                  tag: Optional[int] = None) -> str:
         label = self.get_new_label('s')
+        self.bytes_sent += len
 
         line = f"{label}: send {len}b to {to_rank}" + \
             (f" tag {tag}" if tag else "")
@@ -60,9 +63,10 @@ class RankBuilder:
         self.add_line(line)
         return label
 
-    def add_calc(self, time: int) -> str:
+    def add_calc(self, time: int, cpu: Optional[int] = None) -> str:
         label = self.get_new_label('c')
-        line = f"{label}: calc {time}"
+        line = f"{label}: calc {time}" + \
+            (f" cpu {cpu}" if cpu else "")
         self.add_line(line)
         return label
 
@@ -75,6 +79,19 @@ class RankBuilder:
         line = f"{label0} requires {label1}"
         self.add_line(line)
 
+    def iter_lines(self) -> Iterator[str]:
+        """ Lines of the rank block, without joining them into one string """
+        if self.use_file:
+            assert self._lines_file is not None, "unreachable - lines_file is None"
+            self._lines_file.flush()
+
+            assert self._lines_file_path is not None, "unreachable - lines_file_path is None"
+            with open(self._lines_file_path, "r") as file:
+                yield from file
+        else:
+            yield from self._lines
+        yield "}\n"
+
     def serialize(self, append_file: Optional[TextIOWrapper] = None):
         if self.use_file:
             assert self._lines_file is not None, "unreachable - lines_file is None"
@@ -0,0 +1,469 @@
+import csv
+import heapq
+import json
+import numpy as np
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .estimate import _Graph, LogGPParameters, KIND_SEND, KIND_RECV, KIND_CALC
+from .goal import iter_goal_lines, read_goal
+from .metadata import Metadata
+
+PHASES = ['sqn-lookup', 'bss-read', 'transfer', 'replication', 'ack', 'mount', 'other']
+# End to end latency of an I/O, reported next to its phases
+TOTAL = 'total'
+ALL_HOSTS = 'all'
+LATENCY_COLUMNS = ['op', 'host', 'phase', 'count', 'p50_us', 'p99_us', 'p999_us', 'max_us']
+THROUGHPUT_COLUMNS = ['start_ns', 'reads', 'writes', 'read_bytes', 'write_bytes']
+# Sub buckets per power of two of the latency histograms (< 1.6% error)
+HISTOGRAM_SUB_BITS = 6
+
+
+def message_phase(op: str, src_kind: str, dst_kind: str) -> str:
+    """ Phase of an I/O a message between two kinds of ranks belongs to """
+    if op == 'mount':
+        return 'mount'
+    kinds = {src_kind, dst_kind}
+    if op == 'read':
+        if kinds == {'host', 'ccs'}:
+            return 'sqn-lookup'
+        if kinds == {'host', 'bss'}:
+            return 'bss-read'
+    elif op == 'write':
+        if (src_kind, dst_kind) == ('host', 'ccs'):
+            return 'transfer'
+        if (src_kind, dst_kind) == ('ccs', 'host'):
+            return 'ack'
+        if kinds == {'ccs', 'bss'}:
+            return 'replication'
+    return 'other'
+
+
+def calc_phase(op: str, kind: str) -> str:
+    if op == 'mount':
+        return 'mount'
+    if op == 'read':
+        return {'ccs': 'sqn-lookup', 'bss': 'bss-read'}.get(kind, 'other')
+    return {'ccs': 'transfer', 'bss': 'replication'}.get(kind, 'other')
+
+
+class LatencyHistogram:
+    """ Log-linear histogram, memory only grows with the no of distinct
+    magnitudes, not the no of values """
+    count: int = 0
+    max: int = 0
+    buckets: Dict[int, int]
+
+    def __init__(self):
+        self.buckets = {}
+
+    def add(self, value: int):
+        shift = max(value.bit_length() - HISTOGRAM_SUB_BITS, 0)
+        key = (shift << HISTOGRAM_SUB_BITS) + (value >> shift)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> int:
+        """ Middle of the bucket holding the q-th percentile """
+        rank = q / 100 * self.count
+        seen = 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen >= rank:
+                (shift, base) = divmod(key, 1 << HISTOGRAM_SUB_BITS)
+                return min((base << shift) + ((1 << shift) >> 1), self.max)
+        return self.max
+
+
+class GoalReplay:
+    """ Finds the goal op behind every record of a viz file. Viz records
+    carry neither labels nor tags, so the requires and messages of the goal
+    file are replayed along the records: a record is joined with the op of
+    its rank (and peer and size, or duration) whose dependencies completed
+    first, among the ops whose dependencies were joined already. All ops of
+    the goal file are held, in numpy tables of about 40 bytes per op, only
+    the runnable ops are python objects """
+    rank_kinds: List[str]
+    ops: List[str]
+    # Per op: I/O (operation of a host) it belongs to, -1 for none
+    op_ios: np.ndarray
+    # Per I/O: host, op (index into ops) and no of ops
+    io_host: np.ndarray
+    io_op: np.ndarray
+    io_ops: np.ndarray
+    # Records joined with an op, and the joins among them that picked one of
+    # several ops of different I/Os ready at the same time (the viz file
+    # cannot tell them apart)
+    joins: int = 0
+    ambiguous: int = 0
+
+    def __init__(self, goal_path: str, metadata: Metadata):
+        self.rank_kinds = [metadata.rank_kinds[k] for k in metadata['rank_kind']]
+        self.ops = metadata.ops
+        graph = _Graph(keep_ids=True)
+        graph.add(read_goal(goal_path))
+        n = len(graph.kinds)
+        # Ops and edges are indexed with int32 unless there are 2^31 of them
+        index = np.int32 if max(n, len(graph.edges_dst)) < 2**31 else np.int64
+
+        # Views of the arrays of the graph, not copies
+        kinds = np.frombuffer(graph.kinds, dtype=np.int8)
+        ranks = np.frombuffer(graph.ranks, dtype=np.int32)
+        ids = np.frombuffer(graph.ids, dtype=np.int64)
+        (io_of_context, self.io_host, self.io_op) = self._ios(metadata)
+        # Messages belong to the I/O their tag was drawn for (e.g. group
+        # committed acks to their write), calcs to the one of their label
+        is_calc = kinds == KIND_CALC
+        contexts = np.where(is_calc, metadata.context_of_labels(ids), metadata.context_of_tags(ids))
+        op_ios = io_of_context[contexts].astype(np.int32)
+        del contexts
+        # Host calcs are open loop issue delays, not part of an I/O
+        host = metadata.rank_kinds.index('host')
+        op_ios[is_calc & (np.asarray(metadata['rank_kind'])[ranks] == host)] = -1
+        self.io_ops = np.bincount(op_ios[op_ios >= 0], minlength=len(self.io_host))
+        self.op_ios = op_ios
+
+        src = np.frombuffer(graph.edges_src, dtype=np.int64)
+        dst = np.frombuffer(graph.edges_dst, dtype=np.int64)
+        order = np.argsort(src, kind='stable')
+        self._succs = dst[order].astype(index)
+        self._offsets = np.searchsorted(src[order], np.arange(n + 1)).astype(index)
+        del order
+        partners = graph.partners.astype(index)
+        indegree = np.bincount(dst, minlength=n).astype(np.int32)
+        # Receives also wait for their message
+        indegree[kinds == KIND_RECV] += 1
+        self._indegree = indegree
+        self._kinds = kinds
+        self._ranks = ranks
+        self._sizes = np.frombuffer(graph.sizes, dtype=np.int64)
+        self._partners = partners
+        self._ready_at = np.zeros(n, dtype=np.int64)
+        # Join key -> (heap of ready times, ready time -> ops in the order
+        # they became runnable) of the ops that may run next
+        self._runnable: Dict[Tuple, Tuple[List[int], Dict[int, deque]]] = {}
+        # Rank -> keys of its runnable receives, (KIND_RECV, rank, peer, size)
+        self._recv_keys: Dict[int, set] = {}
+        for u in np.flatnonzero(indegree == 0).tolist():
+            self._make_runnable(u)
+
+    @staticmethod
+    def _ios(metadata: Metadata):
+        """ I/Os are the contexts of an operation (row) of a host, clones of
+        amplified traces share the row but not the host """
+        row = np.asarray(metadata['row'], dtype=np.int64)
+        valid = row >= 0
+        keys = np.empty(int(valid.sum()), dtype=[('row', '<i8'), ('host', '<i8'), ('op', '<i8')])
+        for c in keys.dtype.names:
+            keys[c] = np.asarray(metadata[c])[valid]
+        (unique, inverse) = np.unique(keys, return_inverse=True)
+        # Index -1 (before the first context) maps to the trailing -1
+        io_of_context = np.full(len(row) + 1, -1, dtype=np.int64)
+        io_of_context[np.flatnonzero(valid)] = inverse
+        return (io_of_context, unique['host'], unique['op'])
+
+    def _key(self, u: int) -> Optional[Tuple]:
+        kind = int(self._kinds[u])
+        rank = int(self._ranks[u])
+        size = int(self._sizes[u])
+        if kind == KIND_CALC:
+            return (KIND_CALC, rank, size)
+        partner = int(self._partners[u])
+        if partner == -1:
+            return None
+        peer = int(self._ranks[partner])
+        if kind == KIND_SEND:
+            return (KIND_SEND, rank, peer, size)
+        # Size of the message as sent, receives may post a larger buffer
+        return (KIND_RECV, rank, peer, int(self._sizes[partner]))
+
+    def _make_runnable(self, u: int):
+        key = self._key(u)
+        if key is None:
+            return
+        ready = int(self._ready_at[u])
+        entry = self._runnable.get(key)
+        if entry is None:
+            entry = self._runnable[key] = ([], {})
+        (times, ops) = entry
+        if ready not in ops:
+            heapq.heappush(times, ready)
+            ops[ready] = deque()
+        ops[ready].append(u)
+        if key[0] == KIND_RECV:
+            self._recv_keys.setdefault(key[1], set()).add(key)
+
+    def _satisfy(self, v: int, time: int):
+        if time > self._ready_at[v]:
+            self._ready_at[v] = time
+        self._indegree[v] -= 1
+        if self._indegree[v] == 0:
+            self._make_runnable(v)
+
+    def _first(self, key: Tuple) -> Tuple[int, int]:
+        """ (ready at, op) of the op of a key that became ready first """
+        (times, ops) = self._runnable[key]
+        # Times of ops joined out of order are only dropped once they are first
+        while times[0] not in ops:
+            heapq.heappop(times)
+        return (times[0], ops[times[0]][0])
+
+    def _pop(self, key: Tuple, idle_start: Optional[int]) -> int:
+        # A record started on an idle CPU at the ready time of one of the ops
+        # of its key is that op, else the op that was ready first
+        ops = self._runnable[key][1]
+        ready = idle_start if idle_start in ops else self._first(key)[0]
+        queue = ops[ready]
+        u = queue.popleft()
+        self.joins += 1
+        if queue and any(self.op_ios[v] != self.op_ios[u] for v in queue):
+            self.ambiguous += 1
+        if not queue:
+            del ops[ready]
+            # Sizes vary per op, keep only the keys with runnable ops
+            if not ops:
+                del self._runnable[key]
+        return u
+
+    def join(self, key: Tuple, idle_start: Optional[int] = None) -> Optional[int]:
+        """ Op behind a record, keys are (KIND_SEND, src, dst, size) and
+        (KIND_CALC, rank, duration). idle_start is the start of records whose
+        CPU was idle before, they started once their op became ready """
+        if key not in self._runnable:
+            return None
+        return self._pop(key, idle_start)
+
+    def join_recv(self, rank: int, idle_start: Optional[int] = None) -> Optional[int]:
+        """ Receive behind an orecv record. These only name their rank, so
+        the keys (peer and size of the transmission of their message) of all
+        runnable receives of the rank are candidates """
+        keys = self._recv_keys.get(rank)
+        if not keys:
+            return None
+        exact = [k for k in keys if idle_start in self._runnable[k][1]]
+        firsts = sorted((self._first(k), k) for k in (exact or keys))
+        key = firsts[0][1]
+        u = self._pop(key, idle_start)
+        if len(firsts) > 1 and firsts[1][0][0] == firsts[0][0][0] and \
+                self.op_ios[firsts[1][0][1]] != self.op_ios[u]:
+            self.ambiguous += 1
+        if key not in self._runnable:
+            keys.discard(key)
+        return u
+
+    def complete(self, u: int, finish: int, arrival: Optional[int] = None):
+        """ Releases the dependents of a joined op, arrival is the time the
+        message of a send reaches its receiver """
+        (start, end) = (self._offsets[u], self._offsets[u + 1])
+        for v in self._succs[start:end].tolist():
+            self._satisfy(v, finish)
+        partner = int(self._partners[u])
+        if arrival is not None and partner != -1:
+            self._satisfy(partner, arrival)
+
+    def rank_kind(self, u: int) -> str:
+        return self.rank_kinds[self._ranks[u]]
+
+    def phase(self, u: int, io: int) -> str:
+        op = self.ops[self.io_op[io]]
+        (kind, rank) = (self._kinds[u], self.rank_kinds[self._ranks[u]])
+        if kind == KIND_CALC:
+            return calc_phase(op, rank)
+        peer = self.rank_kinds[self._ranks[self._partners[u]]]
+        return message_phase(op, rank, peer) if kind == KIND_SEND else message_phase(op, peer, rank)
+
+
+class LatencyReport:
+    """ Joins the records of a LogGOPSim viz file (times in ns) with the ops
+    of its goal file and aggregates per I/O:
+        the end to end latency (first to last record of the I/O)
+        the span of every phase (sqn-lookup, bss-read, ...)
+        completions and payload per time bucket
+    The file is streamed, an I/O is aggregated (and dropped) once all its
+    ops were seen, so only the I/Os in flight are held on top of the replay
+    of the goal file """
+    replay: GoalReplay
+    bucket_width: int = 1_000_000
+    # (op, host, phase) -> histogram, host ALL_HOSTS aggregates all hosts
+    latencies: Dict[Tuple[str, str, str], LatencyHistogram]
+    # Bucket -> [reads, writes, read bytes, write bytes]
+    buckets: Dict[int, List[int]]
+    completed: int = 0
+    # Records without a runnable goal op
+    unmatched: Dict[str, int]
+    # I/O -> [start, end, ops left, payload, {phase: [start, end]}]
+    _active: Dict[int, List]
+    # Network latency L (ns) of the simulation, messages arrive L after
+    # their transmission started (plus G per byte)
+    latency: int = LogGPParameters.L
+    # Rank -> (start, end, start if its CPU was idle) of its osends, in the
+    # order of their transmissions
+    _osends: Dict[int, deque]
+    # (rank, cpu) -> end of its last record
+    _busy_until: Dict[Tuple[int, int], int]
+
+    def __init__(self, replay: GoalReplay, bucket_width: Optional[int] = None,
+                 latency: Optional[int] = None):
+        self.replay = replay
+        if bucket_width is not None:
+            self.bucket_width = bucket_width
+        if latency is not None:
+            self.latency = latency
+        assert self.bucket_width > 0, "Bucket width has to be > 0"
+        self.latencies = {}
+        self.buckets = {}
+        self.unmatched = {'transmission': 0, 'orecv': 0, 'loclop': 0}
+        self._active = {}
+        self._osends = {}
+        self._busy_until = {}
+
+    def add(self, lines: Iterable[str]):
+        replay = self.replay
+        for line in lines:
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            record = parts[0]
+            # osend and orecv records only hold rank, cpu, start and end
+            if record == 'osend':
+                (rank, start, end) = (int(parts[1]), int(parts[3]), int(parts[4]))
+                if rank not in self._osends:
+                    self._osends[rank] = deque()
+                self._osends[rank].append((start, end, self._idle_start(rank, int(parts[2]), start, end)))
+            elif record == 'transmission':
+                (src, dst, start, end, size) = map(int, parts[1:6])
+                gap_per_byte = float(parts[6]) if len(parts) > 6 else 0
+                osends = self._osends.get(src)
+                (first, finish, idle_start) = osends.popleft() if osends else (start, start, None)
+                u = replay.join((KIND_SEND, src, dst, size), idle_start)
+                if u is None:
+                    self.unmatched['transmission'] += 1
+                    continue
+                arrival = start + self.latency + int(max(size - 1, 0) * gap_per_byte)
+                replay.complete(u, finish, arrival=arrival)
+                self._add_op(u, first, end, size)
+            elif record == 'orecv':
+                (rank, start, end) = (int(parts[1]), int(parts[3]), int(parts[4]))
+                u = replay.join_recv(rank, self._idle_start(rank, int(parts[2]), start, end))
+                if u is None:
+                    self.unmatched['orecv'] += 1
+                    continue
+                replay.complete(u, end)
+                self._add_op(u, start, end, 0)
+            elif record == 'loclop':
+                (rank, start, end) = (int(parts[1]), int(parts[3]), int(parts[4]))
+                u = replay.join((KIND_CALC, rank, end - start),
+                                self._idle_start(rank, int(parts[2]), start, end))
+                if u is None:
+                    self.unmatched['loclop'] += 1
+                    continue
+                replay.complete(u, end)
+                self._add_op(u, start, end, 0)
+
+    def _idle_start(self, rank: int, cpu: int, start: int, end: int) -> Optional[int]:
+        """ Start of a record if its CPU was idle before it, None if it waited
+        for the CPU. Records of a CPU are written in the order they run """
+        busy_until = self._busy_until.get((rank, cpu), -1)
+        self._busy_until[(rank, cpu)] = end
+        return start if start > busy_until else None
+
+    def _add_op(self, u: int, start: int, end: int, size: int):
+        io = int(self.replay.op_ios[u])
+        if io < 0:
+            return
+        phase = self.replay.phase(u, io)
+        state = self._active.get(io)
+        if state is None:
+            state = self._active[io] = [start, end, int(self.replay.io_ops[io]), 0, {}]
+        state[0] = min(state[0], start)
+        state[1] = max(state[1], end)
+        state[2] -= 1
+        # Data read from the BSS or written to the CCS
+        if phase == 'transfer' or (phase == 'bss-read' and self.replay.rank_kind(u) == 'bss'):
+            state[3] += size
+        span = state[4].setdefault(phase, [start, end])
+        span[0] = min(span[0], start)
+        span[1] = max(span[1], end)
+        if state[2] == 0:
+            del self._active[io]
+            self._complete(io, state)
+
+    def _complete(self, io: int, state: List):
+        (start, end, _, payload, spans) = state
+        op = self.replay.ops[self.replay.io_op[io]]
+        host = str(self.replay.io_host[io])
+        for (phase, latency) in [(TOTAL, end - start)] + [(p, e - s) for (p, (s, e)) in spans.items()]:
+            for h in (host, ALL_HOSTS):
+                key = (op, h, phase)
+                if key not in self.latencies:
+                    self.latencies[key] = LatencyHistogram()
+                self.latencies[key].add(latency)
+        self.completed += 1
+        if op in ('read', 'write'):
+            bucket = self.buckets.setdefault(end // self.bucket_width, [0, 0, 0, 0])
+            i = 0 if op == 'read' else 1
+            bucket[i] += 1
+            bucket[2 + i] += payload
+
+    @property
+    def incomplete(self) -> int:
+        """ I/Os with ops missing in the viz file (e.g. aborted runs) """
+        return len(self._active)
+
+    def latency_rows(self, per_host: bool = True) -> List[Dict]:
+        phases = {p: i for (i, p) in enumerate([TOTAL] + PHASES)}
+
+        def order(key):
+            (op, host, phase) = key
+            return (op, host != ALL_HOSTS, int(host) if host != ALL_HOSTS else 0, phases[phase])
+
+        rows = []
+        for key in sorted(self.latencies, key=order):
+            (op, host, phase) = key
+            if not per_host and host != ALL_HOSTS:
+                continue
+            hist = self.latencies[key]
+            rows.append({
+                'op': op, 'host': host, 'phase': phase, 'count': hist.count,
+                'p50_us': hist.percentile(50) / 1000, 'p99_us': hist.percentile(99) / 1000,
+                'p999_us': hist.percentile(99.9) / 1000, 'max_us': hist.max / 1000,
+            })
+        return rows
+
+    def throughput_rows(self) -> List[Dict]:
+        return [
+            dict(zip(THROUGHPUT_COLUMNS, [bucket * self.bucket_width] + counts))
+            for (bucket, counts) in sorted(self.buckets.items())
+        ]
+
+    def totals(self) -> Dict[str, int]:
+        return {'ios': self.completed, 'incomplete_ios': self.incomplete} | \
+            {f"unmatched_{k}s": v for (k, v) in self.unmatched.items()} | \
+            {'joined_records': self.replay.joins, 'ambiguous_joins': self.replay.ambiguous}
+
+    def to_json(self, dest: str):
+        value = {
+            'totals': self.totals(),
+            'latencies': self.latency_rows(),
+            'throughput': self.throughput_rows(),
+        }
+        with open(dest, 'w+') as f:
+            f.writelines(json.dumps(value))
+
+    def to_csv(self, latencies_dest: Optional[str] = None, throughput_dest: Optional[str] = None):
+        for (dest, columns, rows) in [(latencies_dest, LATENCY_COLUMNS, self.latency_rows()),
+                                      (throughput_dest, THROUGHPUT_COLUMNS, self.throughput_rows())]:
+            if not dest:
+                continue
+            with open(dest, 'w+', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=columns)
+                writer.writeheader()
+                writer.writerows(rows)
+
+
+def report_viz(viz_path: str, goal_path: str, metadata_path: str,
+               bucket_width: Optional[int] = None, latency: Optional[int] = None) -> LatencyReport:
+    report = LatencyReport(GoalReplay(goal_path, Metadata(metadata_path)), bucket_width, latency)
+    report.add(iter_goal_lines(viz_path))
+    return report
@@ -0,0 +1,189 @@
+import csv
+import inspect
+import itertools
+import os
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from pathlib import Path
+from loguru import logger
+from typing import Any, Dict, List, Tuple
+
+from .common import DEFAULT_DUMP_DIR
+from .convert import convert_trace
+from .trace import ColumnarTrace
+
+# Parameters of `convert_trace` which are set per variant or only check the
+# result and can't be swept, next to all output paths (`*_dest`), which all
+# variants would overwrite
+NON_SWEEPABLE_PARAMETERS = ['dump_folder', 'validate']
+OUTPUT_PATH_SUFFIX = '_dest'
+
+# (column name, shared memory name, dtype, no of rows)
+ColumnsSpec = List[Tuple[str, str, str, int]]
+
+
+def sweepable_parameters() -> List[str]:
+    return [
+        name for (name, param) in inspect.signature(convert_trace).parameters.items()
+        if param.kind == inspect.Parameter.KEYWORD_ONLY and name not in NON_SWEEPABLE_PARAMETERS
+        and not name.endswith(OUTPUT_PATH_SUFFIX)
+    ]
+
+
+def parse_value(value: str) -> Any:
+    value = value.strip()
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    if value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    if value.lower() == 'none':
+        return None
+    return value
+
+
+def parse_grid(specs: List[str]) -> Dict[str, List[Any]]:
+    """ Parses grid specs of the form 'ccs-count=4,8,16' """
+    valid = sweepable_parameters()
+    grid = {}
+    for spec in specs:
+        (key, sep, values) = spec.partition('=')
+        name = key.strip().lstrip('-').replace('-', '_')
+        if not sep or name not in valid:
+            raise ValueError(
+                f"Invalid grid spec '{spec}', expected <param>=<v1>,<v2>,... with param one of: {', '.join(p.replace('_', '-') for p in valid)}")
+        grid[name] = [parse_value(v) for v in values.split(',')]
+    return grid
+
+
+def expand_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    names = list(grid.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+def variant_name(params: Dict[str, Any]) -> str:
+    if not params:
+        return 'default'
+    return '_'.join(f"{k.replace('_', '-')}-{v}" for (k, v) in params.items())
+
+
+class SharedColumns:
+    """ Trace columns placed in shared memory, so the worker processes of a
+    sweep can attach to them without copying or parsing the trace again """
+    blocks: List[shared_memory.SharedMemory]
+    spec: ColumnsSpec
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.blocks = []
+        self.spec = []
+        for (name, values) in columns.items():
+            block = shared_memory.SharedMemory(
+                create=True, size=max(values.nbytes, 1))
+            np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+            self.blocks.append(block)
+            self.spec.append((name, block.name, values.dtype.str, len(values)))
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def _init_worker():
+    # Only the summary of the sweep is of interest, silence the workers
+    logger.remove()
+    sys.stderr = open(os.devnull, 'w')
+
+
+def _run_variant(spec: ColumnsSpec, out_dir: str, name: str, params: Dict[str, Any]) -> Dict:
+    blocks = []
+    columns = {}
+    for (column, block_name, dtype, no_rows) in spec:
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        columns[column] = np.ndarray(
+            (no_rows,), dtype=np.dtype(dtype), buffer=block.buf)
+
+    goal_path = str(Path(out_dir) / f"{name}.goal")
+    rank_names_path = str(Path(out_dir) / f"{name}_topology.json")
+    trace = None
+    try:
+        trace = ColumnarTrace.from_columns(columns)
+        stats = convert_trace(
+            trace, goal_path, rank_names_dest=rank_names_path,
+            dump_folder=str(Path(DEFAULT_DUMP_DIR) / name), **params)
+        stats['topology_bytes'] = os.path.getsize(rank_names_path)
+    finally:
+        # All views on the shared memory have to be released before closing
+        del trace
+        columns.clear()
+        for block in blocks:
+            block.close()
+    return stats
+
+
+def run_sweep(columns: Dict[str, np.ndarray], variants: List[Dict[str, Any]],
+              out_dir: str, base_params: Dict[str, Any], jobs: int) -> List[Tuple[str, Dict, Dict]]:
+    """ Converts the trace columns once per variant in a process pool and
+    returns (name, params, stats) per variant. Failed variants report their
+    error in stats['error'] """
+    os.makedirs(out_dir, exist_ok=True)
+    shared = SharedColumns(columns)
+    results = []
+    try:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+            futures = {}
+            for params in variants:
+                name = variant_name(params)
+                future = pool.submit(_run_variant, shared.spec, out_dir, name,
+                                     base_params | params)
+                futures[future] = (name, params)
+
+            for future in as_completed(futures):
+                (name, params) = futures[future]
+                try:
+                    stats = future.result()
+                    logger.info(f"Finished variant '{name}'")
+                except Exception as e:
+                    logger.error(f"Variant '{name}' failed: {e}")
+                    stats = {'error': str(e)}
+                results.append((name, params, stats))
+    finally:
+        shared.close()
+
+    order = {variant_name(params): i for (i, params) in enumerate(variants)}
+    results.sort(key=lambda r: order[r[0]])
+    return results
+
+
+SUMMARY_COLUMNS = ['variant', 'rows', 'ranks', 'generate_s', 'goal_bytes', 'network_bytes', 'topology_bytes', 'error']
+
+
+def write_summary(results: List[Tuple[str, Dict, Dict]], dest: str):
+    with open(dest, 'w+', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(SUMMARY_COLUMNS)
+        for (name, _, stats) in results:
+            writer.writerow([name] + [stats.get(c, '') for c in SUMMARY_COLUMNS[1:]])
+
+
+def format_summary(results: List[Tuple[str, Dict, Dict]]) -> str:
+    rows = [['variant', 'ranks', 'time [s]', 'goal [MB]', 'network [MB]', 'topology [kB]']]
+    for (name, _, stats) in results:
+        if 'error' in stats:
+            rows.append([name, '-', '-', '-', '-', f"failed: {stats['error']}"])
+            continue
+        rows.append([
+            name, str(stats['ranks']), f"{stats['generate_s']:.2f}",
+            f"{stats['goal_bytes'] / 1024**2:.2f}",
+            f"{stats['network_bytes'] / 1024**2:.2f}",
+            f"{stats['topology_bytes'] / 1024:.2f}",
+        ])
+    widths = [max(len(r[i]) for r in rows) for i in range(len(rows[0]))]
+    return '\n'.join(
+        '  '.join(v.ljust(w) for (v, w) in zip(r, widths)) for r in rows)
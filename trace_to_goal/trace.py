@@ -0,0 +1,779 @@
+import bz2
+import csv
+import gzip
+import json
+import lzma
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+import zlib
+import numpy as np
+from itertools import islice
+from pathlib import Path
+from queue import Queue
+from threading import Event, Thread
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Literal, Optional, Tuple
+from tqdm import tqdm
+
+from .placement import mix64
+
+# uMass/SPC rows as (asu, lba, size, opcode, timestamp)
+TraceRow = Tuple[int, int, int, str, float]
+# (index of the row in the trace file, row), the index survives selection
+# and coalescing to map operations back onto the trace
+IndexedRow = Tuple[int, TraceRow]
+
+# Binary columnar trace format:
+#   magic | u64 header length | json header | 64B aligned column arrays
+COLUMNAR_MAGIC = b'T2GCOL01'
+COLUMNAR_ALIGNMENT = 64
+COLUMNS: List[Tuple[str, np.dtype]] = [
+    ('asu', np.dtype('<u4')),
+    ('lba', np.dtype('<i8')),
+    ('size', np.dtype('<i8')),
+    ('opcode', np.dtype('u1')),
+    ('timestamp', np.dtype('<f8')),
+]
+IMPORT_CHUNK_ROWS = 1 << 20
+# Column of `load_columns` holding the index of every row in the trace file
+SOURCE_ROW_COLUMN = 'row'
+# Rows whose reservoir keys are computed at once
+RESERVOIR_CHUNK_ROWS = 1 << 16
+
+# Compressed traces are detected by their magic bytes
+COMPRESSION_MAGICS: Dict[str, bytes] = {
+    'gzip': b'\x1f\x8b',
+    'bz2': b'BZh',
+    'xz': b'\xfd7zXZ\x00',
+    'zstd': b'\x28\xb5\x2f\xfd',
+}
+READ_BLOCK_SIZE = 4 * 1024 * 1024
+READ_QUEUE_SIZE = 8
+
+
+class TraceTimings:
+    """ Time (in s) spent decompressing, parsing and waiting for decompressed data """
+    decompress: float = 0.0
+    parse: float = 0.0
+    stall: float = 0.0
+
+    def __init__(self):
+        self.decompress = 0.0
+        self.parse = 0.0
+        self.stall = 0.0
+
+
+def detect_compression(path: str) -> Optional[str]:
+    with open(path, 'rb') as f:
+        head = f.read(max(len(m) for m in COMPRESSION_MAGICS.values()))
+    for (name, magic) in COMPRESSION_MAGICS.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def open_binary(path: str) -> BinaryIO:
+    """ Opens a (possibly compressed) file as decompressed binary stream """
+    compression = detect_compression(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    elif compression == 'bz2':
+        return bz2.open(path, 'rb')
+    elif compression == 'xz':
+        return lzma.open(path, 'rb')
+    elif compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError(
+                f"'{path}' is zstd compressed, reading it requires the 'zstandard' package")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def _decompress_blocks(path: str, blocks: Queue, stop: Event, timings: TraceTimings):
+    try:
+        with open_binary(path) as f:
+            while not stop.is_set():
+                start = time.perf_counter()
+                block = f.read(READ_BLOCK_SIZE)
+                timings.decompress += time.perf_counter() - start
+                blocks.put(block)
+                if not block:
+                    break
+    except BaseException as e:
+        blocks.put(e)
+
+
+def iter_line_chunks(path: str, timings: TraceTimings) -> Iterator[List[str]]:
+    """ Yields the lines of a (possibly compressed) text file in chunks. The
+    decompression runs in a separate thread, to overlap with the consumer """
+    blocks: Queue = Queue(maxsize=READ_QUEUE_SIZE)
+    stop = Event()
+    thread = Thread(target=_decompress_blocks,
+                    args=(path, blocks, stop, timings), daemon=True)
+    thread.start()
+
+    rest = b''
+    try:
+        while True:
+            start = time.perf_counter()
+            block = blocks.get()
+            timings.stall += time.perf_counter() - start
+            if isinstance(block, BaseException):
+                raise block
+            if not block:
+                break
+
+            data = rest + block
+            cut = data.rfind(b'\n') + 1
+            rest = data[cut:]
+            if cut:
+                yield data[:cut].decode().splitlines()
+        if rest:
+            yield rest.decode().splitlines()
+    finally:
+        # Unblock the decompression thread in case we terminated early
+        stop.set()
+        while not blocks.empty():
+            blocks.get_nowait()
+        thread.join()
+
+
+class TraceSelection:
+    """ Subset of trace rows to convert. The filters are applied in order:
+    asu projection, time window, skip, every-k-th, host sampling, reservoir,
+    max rows """
+    asus: Optional[List[int]] = None
+    start_time: Optional[float] = None
+    end_time: Optional[float] = None
+    skip: int = 0
+    every: int = 1
+    host_rate: Optional[float] = None
+    reservoir: Optional[int] = None
+    max_rows: Optional[int] = None
+    seed: int = 0
+
+    def __init__(self, *, asus=None, start_time=None, end_time=None, skip=None, every=None,
+                 host_rate=None, reservoir=None, max_rows=None, seed=None):
+        if asus is not None:
+            self.asus = sorted(set(asus))
+        if start_time is not None:
+            self.start_time = start_time
+        if end_time is not None:
+            self.end_time = end_time
+        if skip is not None:
+            self.skip = skip
+        if every is not None:
+            self.every = every
+        if host_rate is not None:
+            self.host_rate = host_rate
+        if reservoir is not None:
+            self.reservoir = reservoir
+        if max_rows is not None:
+            self.max_rows = max_rows
+        if seed is not None:
+            self.seed = seed
+
+        assert self.skip >= 0, "Skip has to be >= 0"
+        assert self.every >= 1, "Every has to be >= 1"
+        assert self.host_rate is None or 0 <= self.host_rate <= 1, "Host sample rate has to be in [0, 1]"
+
+    def has_time_window(self) -> bool:
+        return self.start_time is not None or self.end_time is not None
+
+    def in_time_window(self, timestamp: float) -> bool:
+        return (self.start_time is None or self.start_time <= timestamp) and \
+            (self.end_time is None or timestamp < self.end_time)
+
+    def keeps_host(self, asu: int) -> bool:
+        # Stable per host decision, independent of the order of the trace
+        assert self.host_rate is not None, "unreachable"
+        return zlib.crc32(f'{self.seed}:{asu}'.encode()) < self.host_rate * 2**32
+
+    def select(self, rows: Iterable[TraceRow]) -> Iterator[TraceRow]:
+        return (row for (_, row) in self.select_indexed(enumerate(rows)))
+
+    def select_indexed(self, rows: Iterable[IndexedRow]) -> Iterator[IndexedRow]:
+        if self.asus is not None:
+            asus = set(self.asus)
+            rows = (r for r in rows if r[1][0] in asus)
+        if self.has_time_window():
+            rows = (r for r in rows if self.in_time_window(r[1][4]))
+        if self.skip or self.every > 1:
+            rows = islice(rows, self.skip, None, self.every)
+        if self.host_rate is not None:
+            rows = (r for r in rows if self.keeps_host(r[1][0]))
+        if self.reservoir is not None:
+            rows = reservoir_sample(rows, self.reservoir, self.seed)
+        return islice(rows, self.max_rows)
+
+
+def reservoir_keys(positions: np.ndarray, seed: int) -> np.ndarray:
+    """ Seeded random key of every row position, the sample holds the rows
+    with the smallest keys. Keys only depend on the position after the
+    streaming filters, so csv and columnar traces draw the same sample """
+    salt = mix64(np.array([seed], dtype=np.uint64))
+    return mix64(np.asarray(positions, dtype=np.uint64) ^ salt)
+
+
+def smallest_keys(positions: np.ndarray, k: int, seed: int) -> np.ndarray:
+    """ Indices into positions of the (at most) k rows with the smallest keys """
+    if len(positions) <= k:
+        return np.arange(len(positions))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    # Keys are unique (mix64 is a bijection), so ties cannot occur
+    return np.argpartition(reservoir_keys(positions, seed), k - 1)[:k]
+
+
+def reservoir_sample(rows: Iterable[IndexedRow], k: int, seed: int) -> Iterator[IndexedRow]:
+    """ Uniformly samples k rows in a single pass, keeping the trace order """
+    positions = np.empty(0, dtype=np.int64)
+    sample: List[IndexedRow] = []
+    rows = iter(rows)
+    start = 0
+    while chunk := list(islice(rows, max(k, RESERVOIR_CHUNK_ROWS))):
+        positions = np.concatenate([positions, np.arange(start, start + len(chunk))])
+        sample += chunk
+        start += len(chunk)
+        keep = smallest_keys(positions, k, seed)
+        positions = positions[keep]
+        sample = [sample[i] for i in keep.tolist()]
+    yield from (sample[i] for i in np.argsort(positions).tolist())
+
+
+def parse_row(row: List[str]) -> TraceRow:
+    (asu, lba, size, opcode, timestamp, *_) = row
+    return (int(asu), int(lba), int(size), opcode.lower(), float(timestamp))
+
+
+class CsvTrace:
+    """ uMass trace stored as csv file, optionally gzip/bz2/xz/zstd compressed """
+    path: str
+    selection: TraceSelection
+    timings: TraceTimings
+
+    def __init__(self, path: str, selection: Optional[TraceSelection] = None):
+        self.path = path
+        self.selection = selection or TraceSelection()
+        self.timings = TraceTimings()
+
+    def _parsed_rows(self) -> Iterator[TraceRow]:
+        for lines in iter_line_chunks(self.path, self.timings):
+            start = time.perf_counter()
+            rows = [parse_row(row) for row in csv.reader(lines) if row]
+            self.timings.parse += time.perf_counter() - start
+            yield from rows
+
+    def __iter__(self) -> Iterator[TraceRow]:
+        yield from self.selection.select(self._parsed_rows())
+
+    def indexed(self) -> Iterator[IndexedRow]:
+        """ Selected rows with their index in the trace file """
+        yield from self.selection.select_indexed(enumerate(self._parsed_rows()))
+
+    def extent(self) -> Tuple[List[int], int, int]:
+        """ Returns (sorted ASUs, max accessed address, no of rows) """
+        asus = set()
+        max_addr = 0
+        no_rows = 0
+        for (asu, lba, size, *_) in tqdm(self):
+            asus.add(asu)
+            max_addr = max(lba + size, max_addr)
+            no_rows += 1
+        return (sorted(asus), max_addr, no_rows)
+
+    def asu_extents(self) -> Dict[int, int]:
+        """ Returns the max accessed address of every ASU """
+        extents: Dict[int, int] = {}
+        for (asu, lba, size, *_) in tqdm(self):
+            extents[asu] = max(extents.get(asu, 0), lba + size)
+        return extents
+
+
+class ColumnarTrace:
+    """ Binary columnar trace created by `trace2goal import`, read zero-copy via mmap """
+    path: Optional[str]
+    columns: Dict[str, np.ndarray]
+    # Index of every selected row in the trace file (or the given columns)
+    source_rows: range | np.ndarray
+    selection: TraceSelection
+    timings: TraceTimings
+
+    def __init__(self, path: str, selection: Optional[TraceSelection] = None):
+        self.path = path
+        self.selection = selection or TraceSelection()
+        self.timings = TraceTimings()
+
+        with open(path, 'rb') as f:
+            magic = f.read(len(COLUMNAR_MAGIC))
+            assert magic == COLUMNAR_MAGIC, f"'{path}' is not a columnar trace file"
+            header_len = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(header_len))
+
+        no_rows = header['rows']
+        self.columns = {}
+        for (name, dtype) in COLUMNS:
+            col = header['columns'][name]
+            assert np.dtype(col['dtype']) == dtype, f"Unexpected dtype for column '{name}'"
+            if no_rows == 0:
+                self.columns[name] = np.empty(0, dtype=dtype)
+                continue
+            self.columns[name] = np.memmap(
+                path, dtype=dtype, mode='r', offset=col['offset'], shape=(no_rows,))
+
+        self._apply_selection(header.get('timestamp_sorted', False))
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, np.ndarray],
+                     selection: Optional[TraceSelection] = None) -> 'ColumnarTrace':
+        """ Wraps already loaded columns, e.g. placed in shared memory. Rows
+        keep the index of a SOURCE_ROW_COLUMN (see `load_columns`) """
+        trace = cls.__new__(cls)
+        trace.path = None
+        trace.selection = selection or TraceSelection()
+        trace.timings = TraceTimings()
+        trace.columns = {name: columns[name] for (name, _) in COLUMNS}
+
+        ts = trace.columns['timestamp']
+        trace._apply_selection(
+            trace.selection.has_time_window() and bool(np.all(ts[1:] >= ts[:-1])),
+            columns.get(SOURCE_ROW_COLUMN))
+        return trace
+
+    def _apply_selection(self, timestamp_sorted: bool, source_rows: Optional[np.ndarray] = None):
+        index = self._select(timestamp_sorted)
+        if isinstance(index, range):
+            # Contiguous or strided selections stay zero-copy views
+            rows = slice(index.start, index.stop, index.step)
+            self.columns = {k: v[rows] for (k, v) in self.columns.items()}
+            self.source_rows = index if source_rows is None else source_rows[rows]
+        else:
+            self.columns = {k: v[index] for (k, v) in self.columns.items()}
+            self.source_rows = index if source_rows is None else source_rows[index]
+
+    def _select(self, timestamp_sorted: bool):
+        """ Resolves the selection to a range of rows where possible and only
+        falls back to an index array for the filters requiring it """
+        sel = self.selection
+        ts = self.columns['timestamp']
+        index = range(len(ts))
+
+        if sel.asus is not None:
+            index = np.nonzero(np.isin(self.columns['asu'], sel.asus))[0]
+
+        if sel.has_time_window():
+            if timestamp_sorted and isinstance(index, range):
+                lo = 0 if sel.start_time is None else int(
+                    np.searchsorted(ts, sel.start_time, side='left'))
+                hi = len(ts) if sel.end_time is None else int(
+                    np.searchsorted(ts, sel.end_time, side='left'))
+                index = index[lo:hi]
+            else:
+                ts = ts[np.asarray(index)]
+                mask = np.ones(len(ts), dtype=bool)
+                if sel.start_time is not None:
+                    mask &= ts >= sel.start_time
+                if sel.end_time is not None:
+                    mask &= ts < sel.end_time
+                index = np.asarray(index)[mask]
+
+        index = index[sel.skip::sel.every]
+
+        if sel.host_rate is not None:
+            asus = self.columns['asu'][slice(index.start, index.stop, index.step)] \
+                if isinstance(index, range) else self.columns['asu'][index]
+            kept = [asu for asu in np.unique(asus).tolist() if sel.keeps_host(asu)]
+            index = np.asarray(index)[np.isin(asus, kept)]
+
+        if sel.reservoir is not None and len(index) > sel.reservoir:
+            # Same keys as `reservoir_sample`, chunked to bound memory
+            chosen = np.empty(0, dtype=np.int64)
+            for start in range(0, len(index), max(sel.reservoir, IMPORT_CHUNK_ROWS)):
+                stop = min(start + max(sel.reservoir, IMPORT_CHUNK_ROWS), len(index))
+                chosen = np.concatenate([chosen, np.arange(start, stop)])
+                chosen = chosen[smallest_keys(chosen, sel.reservoir, sel.seed)]
+            index = np.asarray(index)[np.sort(chosen)]
+
+        return index[:sel.max_rows]
+
+    def __len__(self) -> int:
+        return len(self.columns['asu'])
+
+    def __iter__(self) -> Iterator[TraceRow]:
+        for start in range(0, len(self), IMPORT_CHUNK_ROWS):
+            end = start + IMPORT_CHUNK_ROWS
+            t = time.perf_counter()
+            rows = list(zip(
+                self.columns['asu'][start:end].tolist(),
+                self.columns['lba'][start:end].tolist(),
+                self.columns['size'][start:end].tolist(),
+                map(chr, self.columns['opcode'][start:end].tolist()),
+                self.columns['timestamp'][start:end].tolist(),
+            ))
+            self.timings.parse += time.perf_counter() - t
+            yield from rows
+
+    def indexed(self) -> Iterator[IndexedRow]:
+        """ Selected rows with their index in the trace file """
+        rows = iter(self)
+        for start in range(0, len(self), IMPORT_CHUNK_ROWS):
+            source_rows = np.asarray(self.source_rows[start:start + IMPORT_CHUNK_ROWS]).tolist()
+            yield from zip(source_rows, islice(rows, IMPORT_CHUNK_ROWS))
+
+    def extent(self) -> Tuple[List[int], int, int]:
+        """ Returns (sorted ASUs, max accessed address, no of rows) """
+        if len(self) == 0:
+            return ([], 0, 0)
+        asus = np.unique(self.columns['asu']).tolist()
+        max_addr = int((self.columns['lba'] + self.columns['size']).max())
+        return (asus, max_addr, len(self))
+
+    def asu_extents(self) -> Dict[int, int]:
+        """ Returns the max accessed address of every ASU """
+        if len(self) == 0:
+            return {}
+        (asus, inverse) = np.unique(self.columns['asu'], return_inverse=True)
+        extents = np.zeros(len(asus), dtype=np.int64)
+        np.maximum.at(extents, inverse, self.columns['lba'] + self.columns['size'])
+        return dict(zip(asus.tolist(), extents.tolist()))
+
+
+VALID_HOST_MAPPINGS = ['identity', 'compact', 'fold']
+HostMappingKind = Literal['identity', 'compact', 'fold']
+
+
+class HostMapping:
+    """ Maps the ASUs of a trace onto host ids """
+    kind: HostMappingKind = 'identity'
+    host_count: int = 1
+    asu_to_host: Dict[int, int]
+
+    def __init__(self, asus: List[int], kind: Optional[HostMappingKind] = None,
+                 fold_count: Optional[int] = None):
+        if kind is not None:
+            self.kind = kind
+
+        if self.kind == 'identity':
+            # Every ASU id is a host id, unused ids become idle hosts
+            self.asu_to_host = {asu: asu for asu in asus}
+            self.host_count = max(asus, default=0) + 1
+        elif self.kind == 'compact':
+            self.asu_to_host = {asu: i for (i, asu) in enumerate(asus)}
+            self.host_count = max(len(asus), 1)
+        elif self.kind == 'fold':
+            assert fold_count is not None and fold_count >= 1, "Folding requires a host count >= 1"
+            self.asu_to_host = {asu: i % fold_count for (i, asu) in enumerate(asus)}
+            self.host_count = min(max(len(asus), 1), fold_count)
+        else:
+            raise RuntimeError(f"Invalid host mapping '{self.kind}'")
+
+    def __getitem__(self, asu: int) -> int:
+        return self.asu_to_host[asu]
+
+    def host_labels(self) -> Dict[int, str]:
+        if self.kind == 'identity':
+            return {}
+        asus: Dict[int, List[int]] = {}
+        for (asu, host) in self.asu_to_host.items():
+            asus.setdefault(host, []).append(asu)
+        return {
+            host: f"Host {host} (ASU {', '.join(map(str, host_asus))})"
+            for (host, host_asus) in asus.items()
+        }
+
+    def to_file(self, dest):
+        value = {
+            'kind': self.kind,
+            'host_count': self.host_count,
+            'asu_to_host': {str(asu): host for (asu, host) in self.asu_to_host.items()},
+        }
+
+        json_value = json.dumps(value)
+        with open(dest, "w+") as f:
+            f.writelines(json_value)
+
+
+VALID_VOLUME_MODES = ['shared', 'per-host', 'per-asu']
+VolumeMode = Literal['shared', 'per-host', 'per-asu']
+
+
+class VolumeLayout:
+    """ Assigns the ASUs of a trace to the volumes of the network:
+        shared: all hosts access one disk (no volumes)
+        per-host: every host mounts its own volume, sized to its largest address
+        per-asu: every ASU is its own volume """
+    kind: VolumeMode = 'shared'
+    # Size of every volume, empty for a shared disk
+    sizes: List[int]
+    asu_to_volume: Dict[int, int]
+
+    def __init__(self, asu_extents: Dict[int, int], hosts: HostMapping,
+                 kind: Optional[VolumeMode] = None):
+        if kind is not None:
+            self.kind = kind
+        assert self.kind in VALID_VOLUME_MODES, "Invalid volume mode"
+
+        self.sizes = []
+        self.asu_to_volume = {}
+        if self.kind == 'per-asu':
+            for (asu, extent) in sorted(asu_extents.items()):
+                self.asu_to_volume[asu] = len(self.sizes)
+                self.sizes.append(extent)
+        elif self.kind == 'per-host':
+            volumes: Dict[int, int] = {}
+            for (asu, extent) in sorted(asu_extents.items()):
+                volume = volumes.setdefault(hosts[asu], len(volumes))
+                if volume == len(self.sizes):
+                    self.sizes.append(0)
+                self.sizes[volume] = max(self.sizes[volume], extent)
+                self.asu_to_volume[asu] = volume
+
+    def __getitem__(self, asu: int) -> Optional[int]:
+        return self.asu_to_volume.get(asu)
+
+    def no_slices(self, slice_size: int) -> int:
+        return sum(max(math.ceil(size / slice_size), 1) for size in self.sizes)
+
+
+VALID_AMPLIFY_TRANSFORMS = ['none', 'offset', 'shuffle']
+AmplifyTransform = Literal['none', 'offset', 'shuffle']
+
+
+class TraceAmplification:
+    """ Replays every host of a trace as K clones. Clone 0 is the original
+    host, all other clones access transformed slices:
+        none: the same slices as the original host
+        offset: their own copy of the disk placed behind the original one
+        shuffle: a seeded (affine) permutation of the original slices """
+    factor: int = 1
+    transform: AmplifyTransform = 'offset'
+    no_slices: int
+    _permutations: List[Tuple[int, int]]
+
+    def __init__(self, no_slices: int, factor: Optional[int] = None,
+                 transform: Optional[AmplifyTransform] = None, seed: int = 0):
+        if factor is not None:
+            self.factor = factor
+        if transform is not None:
+            self.transform = transform
+        assert self.factor >= 1, "Amplification factor has to be >= 1"
+        assert self.transform in VALID_AMPLIFY_TRANSFORMS, "Invalid amplification transform"
+        self.no_slices = no_slices
+
+        rng = random.Random(seed)
+        self._permutations = [(1, 0)]
+        for _ in range(1, self.factor):
+            a = rng.randrange(1, max(no_slices, 2))
+            while math.gcd(a, no_slices) != 1:
+                a = rng.randrange(1, no_slices)
+            self._permutations.append((a, rng.randrange(0, max(no_slices, 1))))
+
+    def total_slices(self) -> int:
+        return self.no_slices * (self.factor if self.transform == 'offset' else 1)
+
+    def clone_host(self, clone: int, host: int, host_count: int) -> int:
+        return clone * host_count + host
+
+    def clone_slices(self, clone: int, slices: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        if clone == 0 or self.transform == 'none':
+            return slices
+        elif self.transform == 'offset':
+            offset = clone * self.no_slices
+            return [(sid + offset, size) for (sid, size) in slices]
+        (a, b) = self._permutations[clone]
+        n = self.no_slices
+        return [((a * sid + b) % n, size) for (sid, size) in slices]
+
+
+class TraceCoalescing:
+    """ Merges contiguous or overlapping requests of the same host and
+    opcode into one request, as a client side write (and read) batching
+    would. A run of merged requests is closed by the first request of its
+    host that does not extend it or once it is older than the window, given
+    in trace rows and/or trace time (s). Merged requests keep the asu and
+    timestamp of their first request """
+    window_rows: Optional[int] = None
+    window_time: Optional[float] = None
+    slice_size: int = 1024 * 1024
+    # opcode -> [requests, slice requests] before and after merging
+    before: Dict[str, List[int]]
+    after: Dict[str, List[int]]
+
+    def __init__(self, *, window_rows=None, window_time=None, slice_size=None):
+        if window_rows is not None:
+            self.window_rows = window_rows
+        if window_time is not None:
+            self.window_time = window_time
+        if slice_size is not None:
+            self.slice_size = slice_size
+        assert self.window_rows is not None or self.window_time is not None, \
+            "Coalescing requires a window in rows or time"
+        assert self.window_rows is None or self.window_rows >= 1, "Coalescing window has to be >= 1 rows"
+        assert self.window_time is None or self.window_time >= 0, "Coalescing window has to be >= 0s"
+        self.before = {}
+        self.after = {}
+
+    def _count(self, counts: Dict[str, List[int]], opcode: str, lba: int, size: int):
+        entry = counts.setdefault(opcode, [0, 0])
+        entry[0] += 1
+        if size > 0:
+            entry[1] += (lba + size - 1) // self.slice_size - lba // self.slice_size + 1
+
+    def _expired(self, run: List, index: int, timestamp: float) -> bool:
+        return (self.window_rows is not None and index - run[5] >= self.window_rows) or \
+            (self.window_time is not None and timestamp - run[4] > self.window_time)
+
+    def _close(self, run: List) -> IndexedRow:
+        (asu, start, end, opcode, timestamp, _, source_row) = run
+        self._count(self.after, opcode, start, end - start)
+        return (source_row, (asu, start, end - start, opcode, timestamp))
+
+    def coalesce(self, rows: Iterable[IndexedRow], host_of=None) -> Iterator[IndexedRow]:
+        """ `host_of` maps an asu onto its host (Default: asus are hosts).
+        Merged requests keep the trace file index of their first request """
+        # host -> [asu, start, end, opcode, timestamp, index of the first row,
+        # its index in the trace file], in the order the runs were opened, so
+        # the oldest ones expire first
+        runs: Dict[int, List] = {}
+        for (index, (source_row, (asu, lba, size, opcode, timestamp))) in enumerate(rows):
+            self._count(self.before, opcode, lba, size)
+            while runs:
+                host = next(iter(runs))
+                if not self._expired(runs[host], index, timestamp):
+                    break
+                yield self._close(runs.pop(host))
+
+            host = host_of(asu) if host_of is not None else asu
+            run = runs.get(host)
+            if run is not None and run[3] == opcode and lba <= run[2] and run[1] <= lba + size:
+                run[1] = min(run[1], lba)
+                run[2] = max(run[2], lba + size)
+                continue
+            if run is not None:
+                yield self._close(runs.pop(host))
+            runs[host] = [asu, lba, lba + size, opcode, timestamp, index, source_row]
+        for run in runs.values():
+            yield self._close(run)
+
+    def requests(self, counts: Dict[str, List[int]]) -> int:
+        return sum(c[0] for c in counts.values())
+
+    def slice_requests(self, counts: Dict[str, List[int]]) -> int:
+        return sum(c[1] for c in counts.values())
+
+    def messages(self, counts: Dict[str, List[int]], replication: int) -> int:
+        """ Messages without lookup batching and SqN caching: a read slice
+        is a SqN lookup plus a BSS read, a write slice goes through the CCS
+        and each of its replicas """
+        (_, reads) = counts.get('r', (0, 0))
+        (_, writes) = counts.get('w', (0, 0))
+        return 4 * reads + (2 + 2 * replication) * writes
+
+
+def is_columnar_trace(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(len(COLUMNAR_MAGIC)) == COLUMNAR_MAGIC
+
+
+def open_trace(path: str, selection: Optional[TraceSelection] = None):
+    if is_columnar_trace(path):
+        return ColumnarTrace(path, selection=selection)
+    return CsvTrace(path, selection=selection)
+
+
+def _rows_to_columns(rows: List[TraceRow]) -> Dict[str, np.ndarray]:
+    (asu, lba, size, opcode, timestamp) = zip(*rows)
+    values = {
+        'asu': asu, 'lba': lba, 'size': size,
+        'opcode': [ord(op) for op in opcode], 'timestamp': timestamp,
+    }
+    return {
+        name: np.asarray(values[name], dtype=dtype) for (name, dtype) in COLUMNS
+    }
+
+
+def load_columns(trace) -> Dict[str, np.ndarray]:
+    """ Materializes the selected rows of an opened trace as column arrays,
+    plus their index in the trace file as SOURCE_ROW_COLUMN """
+    if isinstance(trace, ColumnarTrace):
+        return {
+            name: np.ascontiguousarray(trace.columns[name]) for (name, _) in COLUMNS
+        } | {SOURCE_ROW_COLUMN: np.asarray(trace.source_rows, dtype=np.int64)}
+
+    chunks: Dict[str, List[np.ndarray]] = {name: [] for (name, _) in COLUMNS}
+    chunks[SOURCE_ROW_COLUMN] = []
+    rows = iter(tqdm(trace.indexed()))
+    while chunk := list(islice(rows, IMPORT_CHUNK_ROWS)):
+        (source_rows, selected) = zip(*chunk)
+        for (name, values) in _rows_to_columns(list(selected)).items():
+            chunks[name].append(values)
+        chunks[SOURCE_ROW_COLUMN].append(np.asarray(source_rows, dtype=np.int64))
+    return {
+        name: np.concatenate(chunks[name]) if chunks[name] else np.empty(0, dtype=dtype)
+        for (name, dtype) in COLUMNS + [(SOURCE_ROW_COLUMN, np.dtype('<i8'))]
+    }
+
+
+def _align(offset: int) -> int:
+    return -(-offset // COLUMNAR_ALIGNMENT) * COLUMNAR_ALIGNMENT
+
+
+def import_trace(src: str, dest: str, selection: Optional[TraceSelection] = None) -> int:
+    """ Converts a csv trace into the columnar format, returns the no of rows """
+    parent = Path(dest).parent.absolute()
+    os.makedirs(parent, exist_ok=True)
+
+    # Spill every column to its own file first, as the no of rows (and
+    # therefore the column offsets) are only known after a full pass
+    with tempfile.TemporaryDirectory(dir=parent) as spill_dir:
+        spill_files = {
+            name: open(Path(spill_dir) / name, 'wb') for (name, _) in COLUMNS
+        }
+        no_rows = 0
+        last_timestamp = -np.inf
+        timestamp_sorted = True
+        rows = iter(tqdm(CsvTrace(src, selection=selection)))
+        while chunk := list(islice(rows, IMPORT_CHUNK_ROWS)):
+            values = _rows_to_columns(chunk)
+            ts = values['timestamp']
+            timestamp_sorted = timestamp_sorted and last_timestamp <= ts[0] \
+                and bool(np.all(ts[1:] >= ts[:-1]))
+            last_timestamp = ts[-1]
+            for (name, _) in COLUMNS:
+                spill_files[name].write(values[name].tobytes())
+            no_rows += len(chunk)
+
+        for f in spill_files.values():
+            f.close()
+
+        # Compute column offsets behind the (padded) header
+        # Sorted timestamps allow time windows to be resolved by binary search
+        header = {'rows': no_rows, 'timestamp_sorted': timestamp_sorted, 'columns': {}}
+        header_size = 4096
+        while True:
+            offset = _align(len(COLUMNAR_MAGIC) + 8 + header_size)
+            for (name, dtype) in COLUMNS:
+                header['columns'][name] = {'dtype': dtype.str, 'offset': offset}
+                offset = _align(offset + no_rows * dtype.itemsize)
+            header_bytes = json.dumps(header).encode()
+            if len(header_bytes) <= header_size:
+                break
+            header_size *= 2
+        header_bytes = header_bytes.ljust(header_size)
+
+        with open(dest, 'wb') as out:
+            out.write(COLUMNAR_MAGIC)
+            out.write(len(header_bytes).to_bytes(8, 'little'))
+            out.write(header_bytes)
+            for (name, _) in COLUMNS:
+                out.seek(header['columns'][name]['offset'])
+                with open(Path(spill_dir) / name, 'rb') as f:
+                    shutil.copyfileobj(f, out)
+            out.truncate()
+
+    return no_rows
@@ -0,0 +1,234 @@
+import numpy as np
+from array import array
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .estimate import _Graph, KIND_SEND, KIND_RECV
+from .goal import GoalEvent, parse_goal, read_goal, \
+    NUM_RANKS, RANK, END, OP, REQUIRES, SEND, RECV
+
+# Only the first errors are kept with their message, all are counted
+MAX_REPORTED_ERRORS = 100
+# Ranks named in the error of ops blocked by dependency cycles
+MAX_REPORTED_RANKS = 10
+DIGEST_MASK = (1 << 64) - 1
+
+
+class GoalValidationError(ValueError):
+    pass
+
+
+class ValidationReport:
+    no_ranks: int = 0
+    no_ops: int = 0
+    errors: List[str]
+    # Error kind -> count
+    counts: Dict[str, int]
+
+    def __init__(self):
+        self.errors = []
+        self.counts = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.counts
+
+    def add_error(self, kind: str, message: str):
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+    def summary(self) -> str:
+        if self.ok:
+            return f"Valid goal schedule ({self.no_ranks} ranks; {self.no_ops} ops)"
+        return "Invalid goal schedule: " + \
+            ', '.join(f"{c} {kind}" for (kind, c) in self.counts.items())
+
+
+class GoalValidator:
+    """ Streaming structural checks of a goal schedule:
+        labels are unique per rank
+        required labels exist in the same rank
+        requires of a rank do not form a cycle
+        sends and receives of every rank pair match in count, size and tag
+    Messages are not kept, every rank pair only holds a count and an order
+    independent digest of (tag, size) of its sends minus its receives, so
+    memory grows with the largest rank, not the file.
+    With check_cycles, requires and messages of all ranks must not form a
+    cycle either, e.g. a recv waiting on a send of another rank, which waits
+    on a send after the recv. This needs the graph of all ops, which is kept
+    like in estimate """
+    report: ValidationReport
+    # (src, dst) -> [sends - receives, digest]
+    pairs: Dict[Tuple[int, int], List[int]]
+    seen_ranks: set
+    declared_ranks: Optional[int] = None
+    _graph: Optional[_Graph] = None
+
+    def __init__(self, check_cycles: bool = False):
+        self.report = ValidationReport()
+        self.pairs = {}
+        self.seen_ranks = set()
+        if check_cycles:
+            self._graph = _Graph()
+
+    def add(self, events: Iterable[GoalEvent]):
+        report = self.report
+        labels: Dict[str, int] = {}
+        # Requires of a rank as (dependency, dependent) label indices, those
+        # of labels defined later in the block wait for its end
+        edges = (array('i'), array('i'))
+        requires: List[Tuple[str, str]] = []
+        if self._graph is not None:
+            events = self._graph.record(events)
+        for (event, rank, label, kind, size, peer, tag) in events:
+            if event == OP:
+                report.no_ops += 1
+                if label in labels:
+                    report.add_error('duplicate labels', f"Rank {rank}: label '{label}' is defined twice")
+                labels[label] = len(labels)
+                if kind == SEND or kind == RECV:
+                    self._add_message(rank, kind, size, peer, tag)
+            elif event == REQUIRES:
+                if label in labels and peer in labels:
+                    edges[0].append(labels[peer])
+                    edges[1].append(labels[label])
+                else:
+                    requires.append((label, peer))
+            elif event == RANK:
+                if rank in self.seen_ranks:
+                    report.add_error('duplicate ranks', f"Rank {rank} is defined twice")
+                self.seen_ranks.add(rank)
+            elif event == END:
+                self._check_requires(rank, labels, edges, requires)
+                labels = {}
+                edges = (array('i'), array('i'))
+                requires = []
+            elif event == NUM_RANKS:
+                self.declared_ranks = rank
+
+    def _add_message(self, rank: int, kind: str, size: int, peer: int, tag: int):
+        if self.declared_ranks is not None and not 0 <= peer < self.declared_ranks:
+            self.report.add_error(
+                'invalid peers', f"Rank {rank}: {kind} with rank {peer}, which does not exist")
+        if kind == SEND:
+            (key, sign) = ((rank, peer), 1)
+        else:
+            (key, sign) = ((peer, rank), -1)
+        pair = self.pairs.setdefault(key, [0, 0])
+        pair[0] += sign
+        pair[1] = (pair[1] + sign * hash((tag, size))) & DIGEST_MASK
+
+    def _check_requires(self, rank: int, labels: Dict[str, int], edges: Tuple[array, array],
+                        requires: List[Tuple[str, str]]):
+        for (label, dep) in requires:
+            for name in (label, dep):
+                if name not in labels:
+                    self.report.add_error(
+                        'dangling requires', f"Rank {rank}: '{label} requires {dep}' references the unknown label '{name}'")
+                    break
+            else:
+                edges[0].append(labels[dep])
+                edges[1].append(labels[label])
+        if self._graph is not None:
+            # Cycles are found across all ranks at the end
+            return
+
+        n = len(labels)
+        src = np.frombuffer(edges[0], dtype=np.int32)
+        dst = np.frombuffer(edges[1], dtype=np.int32)
+        order = np.argsort(src, kind='stable')
+        succs = dst[order].tolist()
+        offsets = np.searchsorted(src[order], np.arange(n + 1)).tolist()
+        indegree = np.bincount(dst, minlength=n).tolist()
+
+        queue = deque(i for (i, d) in enumerate(indegree) if d == 0)
+        processed = 0
+        while queue:
+            u = queue.popleft()
+            processed += 1
+            for v in succs[offsets[u]:offsets[u + 1]]:
+                indegree[v] -= 1
+                if indegree[v] == 0:
+                    queue.append(v)
+        if processed < n:
+            self.report.add_error(
+                'dependency cycles', f"Rank {rank}: {n - processed} ops are part of or wait on a requires cycle")
+
+    def _check_cycles(self):
+        """ Topological pass over the requires and matched messages of all
+        ranks, the ops it cannot reach are part of or wait on a cycle.
+        Unmatched receives are reported on their own and not followed """
+        graph = self._graph
+        assert graph is not None, "unreachable"
+        n = len(graph.kinds)
+        src = np.array(graph.edges_src, dtype=np.int64)
+        dst = np.array(graph.edges_dst, dtype=np.int64)
+        order = np.argsort(src, kind='stable')
+        succs = dst[order].tolist()
+        offsets = np.searchsorted(src[order], np.arange(n + 1)).tolist()
+        kinds = np.array(graph.kinds, dtype=np.int8)
+        partners = graph.partners
+        indegree = np.bincount(dst, minlength=n)
+        indegree[(kinds == KIND_RECV) & (partners >= 0)] += 1
+        indegree = indegree.tolist()
+        # Receive of every matched send
+        recv_of = np.where(kinds == KIND_SEND, partners, -1).tolist()
+
+        queue = deque(i for i in range(n) if indegree[i] == 0)
+        processed = 0
+        while queue:
+            u = queue.popleft()
+            processed += 1
+            for v in succs[offsets[u]:offsets[u + 1]]:
+                indegree[v] -= 1
+                if indegree[v] == 0:
+                    queue.append(v)
+            v = recv_of[u]
+            if v != -1:
+                indegree[v] -= 1
+                if indegree[v] == 0:
+                    queue.append(v)
+        if processed < n:
+            blocked = np.flatnonzero(np.array(indegree) > 0)
+            ranks = np.unique(np.array(graph.ranks)[blocked]).tolist()
+            names = ', '.join(map(str, ranks[:MAX_REPORTED_RANKS])) + \
+                (', ...' if len(ranks) > MAX_REPORTED_RANKS else '')
+            self.report.add_error(
+                'dependency cycles', f"{n - processed} ops of ranks {names} are part of or wait on a dependency cycle")
+
+    def finish(self) -> ValidationReport:
+        report = self.report
+        report.no_ranks = len(self.seen_ranks)
+        if self._graph is not None:
+            self._check_cycles()
+        if self.declared_ranks is not None:
+            missing = self.declared_ranks - len(self.seen_ranks & set(range(self.declared_ranks)))
+            if missing:
+                report.add_error('missing ranks', f"{missing} of {self.declared_ranks} declared ranks have no block")
+        for ((src, dst), (balance, digest)) in sorted(self.pairs.items()):
+            if balance > 0:
+                report.add_error(
+                    'unmatched messages', f"Rank {src} -> {dst}: {balance} sends without receive")
+            elif balance < 0:
+                report.add_error(
+                    'unmatched messages', f"Rank {src} -> {dst}: {-balance} receives without send")
+            elif digest:
+                report.add_error(
+                    'mismatched messages', f"Rank {src} -> {dst}: sizes or tags of sends and receives differ")
+        return report
+
+
+def validate_goal(path: str, check_cycles: bool = False) -> ValidationReport:
+    validator = GoalValidator(check_cycles)
+    validator.add(read_goal(path))
+    return validator.finish()
+
+
+def validate_network(network) -> ValidationReport:
+    """ Validates a network before (or without) writing its goal file """
+    validator = GoalValidator()
+    validator.declared_ranks = network.topology.get_total_ranks()
+    for b in network.builders:
+        validator.add(parse_goal(b.iter_lines()))
+    return validator.finish()
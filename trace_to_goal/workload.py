@@ -0,0 +1,164 @@
+import numpy as np
+from typing import Iterator, Literal, Optional, Tuple
+
+VALID_PATTERNS = ['sequential', 'strided', 'uniform', 'zipf']
+Pattern = Literal['sequential', 'strided', 'uniform', 'zipf']
+VALID_SIZE_DISTRIBUTIONS = ['fixed', 'uniform', 'lognormal']
+SizeDistribution = Literal['fixed', 'uniform', 'lognormal']
+
+OP_READ = ord('r')
+OP_WRITE = ord('w')
+BULK_CHUNK_OPS = 1 << 16
+
+
+class Workload:
+    """ Batch of IO operations stored as columns """
+    ops: np.ndarray
+    hosts: np.ndarray
+    addresses: np.ndarray
+    sizes: np.ndarray
+
+    def __init__(self, ops: np.ndarray, hosts: np.ndarray,
+                 addresses: np.ndarray, sizes: np.ndarray):
+        assert len(ops) == len(hosts) == len(addresses) == len(sizes), \
+            "All workload columns need the same length"
+        self.ops = ops
+        self.hosts = hosts
+        self.addresses = addresses
+        self.sizes = sizes
+
+    def __len__(self) -> int:
+        return len(self.ops)
+
+    def __iter__(self) -> Iterator[Tuple[str, int, int, int]]:
+        """ Yields (op code, host, address, size) """
+        for start in range(0, len(self), BULK_CHUNK_OPS):
+            end = start + BULK_CHUNK_OPS
+            yield from zip(
+                map(chr, self.ops[start:end].tolist()),
+                self.hosts[start:end].tolist(),
+                self.addresses[start:end].tolist(),
+                self.sizes[start:end].tolist(),
+            )
+
+    def total_bytes(self) -> int:
+        return int(self.sizes.sum())
+
+
+class WorkloadGenerator:
+    """ Vectorized generator of synthetic workloads. Every host issues the
+    same no of operations, the operations of all hosts are interleaved.
+        sequential: each host walks the disk from a random block onwards
+        strided: each host jumps `stride` bytes from a random block onwards
+        uniform: uniform random blocks
+        zipf: hot-spot blocks, following a zipf distribution (alpha > 1) """
+    disk_size: int
+    host_count: int = 1
+    pattern: Pattern = 'uniform'
+    read_ratio: float = 0.5
+    size_distribution: SizeDistribution = 'fixed'
+    size: int = 4096
+    min_size: int = 512
+    max_size: int = 1024 * 1024
+    size_sigma: float = 1.0
+    stride: int = 64 * 1024
+    zipf_alpha: float = 1.2
+    block_size: int = 512
+
+    def __init__(self, *, disk_size: int, host_count=None, pattern=None,
+                 read_ratio=None, size_distribution=None, size=None,
+                 min_size=None, max_size=None, size_sigma=None, stride=None,
+                 zipf_alpha=None, block_size=None, seed: Optional[int] = None):
+        self.disk_size = disk_size
+        if host_count is not None:
+            self.host_count = host_count
+        if pattern is not None:
+            self.pattern = pattern
+        if read_ratio is not None:
+            self.read_ratio = read_ratio
+        if size_distribution is not None:
+            self.size_distribution = size_distribution
+        if size is not None:
+            self.size = size
+        if min_size is not None:
+            self.min_size = min_size
+        if max_size is not None:
+            self.max_size = max_size
+        if size_sigma is not None:
+            self.size_sigma = size_sigma
+        if stride is not None:
+            self.stride = stride
+        if zipf_alpha is not None:
+            self.zipf_alpha = zipf_alpha
+        if block_size is not None:
+            self.block_size = block_size
+
+        assert self.pattern in VALID_PATTERNS, "Workload pattern is not supported"
+        assert self.size_distribution in VALID_SIZE_DISTRIBUTIONS, "Size distribution is not supported"
+        assert 0 <= self.read_ratio <= 1, "Read ratio has to be in [0, 1]"
+        assert self.pattern != 'zipf' or self.zipf_alpha > 1, "Zipf alpha has to be > 1"
+        assert self.block_size <= self.disk_size, "Disk is smaller than a single block"
+        self.rng = np.random.default_rng(seed)
+
+    def _sizes(self, shape) -> np.ndarray:
+        if self.size_distribution == 'fixed':
+            sizes = np.full(shape, self.size, dtype=np.int64)
+        elif self.size_distribution == 'uniform':
+            sizes = self.rng.integers(
+                self.min_size, self.max_size, size=shape, endpoint=True)
+        else:
+            # Log-normal around a median of `size`
+            sizes = self.rng.lognormal(
+                np.log(self.size), self.size_sigma, size=shape).astype(np.int64)
+            sizes = np.clip(sizes, self.min_size, self.max_size)
+
+        # Round up to full blocks, never exceed the disk
+        sizes = -(-sizes // self.block_size) * self.block_size
+        return np.clip(sizes, self.block_size, self.disk_size)
+
+    def _blocks(self, shape, sizes: np.ndarray) -> np.ndarray:
+        no_blocks = self.disk_size // self.block_size
+        (no_ops, host_count) = shape
+
+        if self.pattern == 'uniform':
+            return self.rng.integers(0, no_blocks, size=shape)
+        elif self.pattern == 'zipf':
+            # Rank 1 is the hottest block, ranks are scattered over the disk
+            # with an affine permutation to not cluster all hot blocks
+            ranks = (self.rng.zipf(self.zipf_alpha, size=shape) - 1) % no_blocks
+            a = int(self.rng.integers(1, max(no_blocks, 2)))
+            while np.gcd(a, no_blocks) != 1:
+                a = int(self.rng.integers(1, no_blocks))
+            b = int(self.rng.integers(0, no_blocks))
+            return (a * ranks + b) % no_blocks
+
+        starts = self.rng.integers(0, no_blocks, size=host_count)
+        if self.pattern == 'sequential':
+            # Every op starts where the previous op of the host ended
+            steps = sizes // self.block_size
+            offsets = np.cumsum(steps, axis=0) - steps
+        else:
+            offsets = np.arange(no_ops)[:, None] * \
+                max(self.stride // self.block_size, 1)
+        return (starts[None, :] + offsets) % no_blocks
+
+    def generate(self, ops_per_host: int) -> Workload:
+        shape = (ops_per_host, self.host_count)
+        sizes = self._sizes(shape)
+        addresses = self._blocks(shape, sizes) * self.block_size
+        # Wrap operations crossing the end of the disk to its start
+        addresses = np.where(addresses + sizes > self.disk_size, 0, addresses)
+
+        ops = np.where(self.rng.random(shape) < self.read_ratio,
+                       OP_READ, OP_WRITE).astype(np.uint8)
+        hosts = np.broadcast_to(np.arange(self.host_count), shape)
+
+        return Workload(ops.ravel(), hosts.ravel(),
+                        addresses.ravel().astype(np.int64), sizes.ravel())
+
+
+def random_ranges(rng: np.random.Generator, count: int, disk_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """ Draws (start, end) pairs with start in [0, disk_size/2] and end in [start, disk_size] """
+    starts = rng.integers(0, disk_size // 2, size=count, endpoint=True)
+    ends = rng.integers(starts, disk_size, endpoint=True)
+    return (starts, ends)